@@ -1,11 +1,19 @@
-from fastapi import APIRouter,HTTPException
+from fastapi import APIRouter,HTTPException,Depends
+import asyncio
 import logging
 
 from app.services.admin_service import AdminService
+from app.dependencies import get_admin_service
 from app.api.schemas.admin import(
     DocumentListResponse,
     DocumentDeleteResponse,
-    StatisticsResponse
+    StatisticsResponse,
+    RegistryRebuildResponse,
+    LexicalIndexRebuildResponse,
+    LexicalIndexStatsResponse,
+    EmbeddingCacheStatsResponse,
+    AnswerCacheStatsResponse,
+    LLMSchedulerStatsResponse
 )
 
 logger=logging.getLogger(__name__)
@@ -13,14 +21,13 @@ logger=logging.getLogger(__name__)
 router=APIRouter(prefix="/admin",tags=["admin"])
 
 @router.get("/documents", response_model=DocumentListResponse)
-async def list_all_documents():
+async def list_all_documents(service: AdminService = Depends(get_admin_service)):
     """
     List all documents in the vector store.
     Returns total count, unique files count, and list of files with chunk counts.
     """
     try:
-        service=AdminService()
-        result=service.list_all_documents()
+        result=await asyncio.to_thread(service.list_all_documents)
 
         return DocumentListResponse(
             total_count=result["total_count"],
@@ -35,7 +42,7 @@ async def list_all_documents():
         )
 
 @router.delete("/documents/{file_name}", response_model=DocumentDeleteResponse)
-async def delete_document(file_name: str):
+async def delete_document(file_name: str, service: AdminService = Depends(get_admin_service)):
     """
     Delete a document and all its chunks from the vector store.
     
@@ -43,8 +50,7 @@ async def delete_document(file_name: str):
         file_name: Name of the file to delete
     """
     try:
-        service = AdminService()
-        result = service.delete_document(file_name)
+        result = await asyncio.to_thread(service.delete_document, file_name)
         
         return DocumentDeleteResponse(
             success=result["success"],
@@ -59,14 +65,13 @@ async def delete_document(file_name: str):
             detail=f"Failed to delete document: {str(e)}"
         )
 @router.get("/statistics", response_model=StatisticsResponse)
-async def get_statistics():
+async def get_statistics(service: AdminService = Depends(get_admin_service)):
     """
     Get statistics about the document collection.
     Returns total chunks, unique files count, and list of all file names.
     """
     try:
-        service = AdminService()
-        result = service.get_statistics()
+        result = await asyncio.to_thread(service.get_statistics)
         
         return StatisticsResponse(
             total_chunks=result["total_chunks"],
@@ -80,4 +85,98 @@ async def get_statistics():
             detail=f"Failed to get statistics: {str(e)}"
         )
 
+@router.post("/registry/rebuild", response_model=RegistryRebuildResponse)
+async def rebuild_registry(service: AdminService = Depends(get_admin_service)):
+    """
+    Rebuild the per-file document registry from the chunks stored in the vector store.
+    """
+    try:
+        result = await asyncio.to_thread(service.rebuild_registry)
+
+        return RegistryRebuildResponse(**result)
+    except Exception as e:
+        logger.error(f"Error rebuilding document registry: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to rebuild document registry: {str(e)}"
+        )
+
+@router.post("/lexical-index/rebuild", response_model=LexicalIndexRebuildResponse)
+async def rebuild_lexical_index(service: AdminService = Depends(get_admin_service)):
+    """
+    Rebuild the BM25 index from the chunks stored in the vector store.
+    """
+    try:
+        result = await asyncio.to_thread(service.rebuild_lexical_index)
+
+        return LexicalIndexRebuildResponse(**result)
+    except Exception as e:
+        logger.error(f"Error rebuilding BM25 index: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to rebuild BM25 index: {str(e)}"
+        )
+
+@router.get("/lexical-index", response_model=LexicalIndexStatsResponse)
+async def get_lexical_index_statistics(service: AdminService = Depends(get_admin_service)):
+    """
+    Get segment and document counts of the BM25 index.
+    """
+    try:
+        result = await asyncio.to_thread(service.get_lexical_index_statistics)
+
+        return LexicalIndexStatsResponse(**result)
+    except Exception as e:
+        logger.error(f"Error getting BM25 index statistics: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get BM25 index statistics: {str(e)}"
+        )
 
+@router.get("/embedding-cache", response_model=EmbeddingCacheStatsResponse)
+async def get_embedding_cache_statistics(service: AdminService = Depends(get_admin_service)):
+    """
+    Get hit/miss counters and sizes of the embedding cache.
+    """
+    try:
+        result = await asyncio.to_thread(service.get_embedding_cache_statistics)
+
+        return EmbeddingCacheStatsResponse(**result)
+    except Exception as e:
+        logger.error(f"Error getting embedding cache statistics: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get embedding cache statistics: {str(e)}"
+        )
+
+@router.get("/answer-cache", response_model=AnswerCacheStatsResponse)
+async def get_answer_cache_statistics(service: AdminService = Depends(get_admin_service)):
+    """
+    Get hit/miss counters and size of the semantic answer cache.
+    """
+    try:
+        result = await asyncio.to_thread(service.get_answer_cache_statistics)
+
+        return AnswerCacheStatsResponse(**result)
+    except Exception as e:
+        logger.error(f"Error getting answer cache statistics: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get answer cache statistics: {str(e)}"
+        )
+
+@router.get("/llm-scheduler", response_model=LLMSchedulerStatsResponse)
+async def get_llm_scheduler_statistics(service: AdminService = Depends(get_admin_service)):
+    """
+    Get queue depth, wait times and budgets of the Gemini call scheduler.
+    """
+    try:
+        result = service.get_llm_scheduler_statistics()
+
+        return LLMSchedulerStatsResponse(**result)
+    except Exception as e:
+        logger.error(f"Error getting LLM scheduler statistics: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get LLM scheduler statistics: {str(e)}"
+        )
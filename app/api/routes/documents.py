@@ -1,19 +1,40 @@
-from fastapi import APIRouter,UploadFile,File,HTTPException
+from fastapi import APIRouter,UploadFile,File,HTTPException,Depends,Query,Response
 import os
-import tempfile
 import logging
 
-from app.services.document_service import DocumentService
-from app.api.schemas.document import DocumentUploadResponse
+from app.services.ingestion_service import IngestionService, IngestionQueueFullError
+from app.dependencies import get_ingestion_service
+from app.api.schemas.document import IngestionJobResponse
+from app.core.uploads import spool_upload, UploadTooLargeError
+from app.core.ingestion_jobs import get_spool_dir, STATUS_COMPLETED
 
 logger=logging.getLogger(__name__)
 
 router=APIRouter(prefix="/documents",tags=["documents"])
 
-@router.post("/upload",response_model=DocumentUploadResponse)
-async def upload_document(file: UploadFile = File(...)):
+@router.post("/upload",response_model=IngestionJobResponse,status_code=202)
+async def upload_document(
+    response: Response,
+    file: UploadFile = File(...),
+    include_chunks: bool = Query(False,description="Keep the chunk texts in the job result"),
+    wait: bool = Query(False,description="Respond once the document is processed instead of right away"),
+    service: IngestionService = Depends(get_ingestion_service)
+):
     """
-    Upload and process a document (PDF,DOCX,or TXT).
+    Upload a document (PDF,DOCX,or TXT) and queue it for processing.
+
+    The file is streamed to disk in chunks (never held in memory whole) and
+    rejected with 413 once it exceeds UPLOAD_MAX_BYTES: requests whose body
+    passes the limit are cut off as it arrives (see UploadSizeLimitMiddleware),
+    also without a Content-Length. Returns 202 with an
+    ingestion job; poll GET /documents/jobs/{job_id} for its progress. With
+    wait=true the response is sent when the job has finished: 200 if it
+    completed, 500 with the job's error if it failed.
+
+    Uploading a file under a name that is stored already updates it: an
+    identical file is not processed again, otherwise only new or changed
+    chunks are embedded (chunks_embedded vs chunks_reused) and chunks no
+    longer in the file are deleted (chunks_deleted).
     """
     #check file type
     file_ext=os.path.splitext(file.filename)[1].lower()
@@ -22,33 +43,46 @@ async def upload_document(file: UploadFile = File(...)):
             status_code=400,
             detail=f"Unsupported file type,we support only PDF,DOCS,TXT"
         )
-    with tempfile.NamedTemporaryFile(delete=False,suffix=file_ext) as temp_file:
-        content=await file.read()
-        temp_file.write(content)
-        temp_path=temp_file.name
+    try:
+        upload=await spool_upload(file,suffix=file_ext,directory=get_spool_dir())
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413,detail=str(e))
 
     try:
-        service = DocumentService()
-        # Store document in vector store (this also processes it)
-        result = service.store_document_in_vector_store(temp_path)
+        job=service.submit(
+            file_name=file.filename,
+            file_path=upload["path"],
+            content_sha256=upload["sha256"],
+            size_bytes=upload["size_bytes"],
+            include_chunks=include_chunks
+        )
+    except IngestionQueueFullError as e:
+        os.remove(upload["path"])
+        raise HTTPException(status_code=503,detail=str(e))
+    except Exception as e:
+        os.remove(upload["path"])
+        logger.error(f"Failed to queue {file.filename}: {str(e)}")
+        raise HTTPException(status_code=500,detail=f"Failed to queue document: {str(e)}")
 
-        if not result:
+    if wait:
+        job=await service.wait(job["job_id"])
+        if job["status"]!=STATUS_COMPLETED:
             raise HTTPException(
                 status_code=500,
-                detail="Failed to process and store document"
+                detail=f"Failed to process and store document (job {job['job_id']}): {job['error']}"
             )
-        
-        # Unpack the tuple: (chunks, chunk_ids)
-        chunks, chunk_ids = result
+        response.status_code=200
+    return IngestionJobResponse(**job)
 
-        return DocumentUploadResponse(
-            message="Document processed and stored in vector database successfully",
-            file_name=file.filename,
-            chunk_count=len(chunks),
-            chunks=chunks
-        )
-
-    finally:
-        #clean up temporary file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+@router.get("/jobs/{job_id}",response_model=IngestionJobResponse)
+async def get_ingestion_job(
+    job_id: str,
+    service: IngestionService = Depends(get_ingestion_service)
+):
+    """
+    Status and progress of an ingestion job.
+    """
+    job=service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404,detail=f"Ingestion job {job_id} not found")
+    return IngestionJobResponse(**job)
@@ -1,32 +1,53 @@
-from fastapi import APIRouter,HTTPException
+from fastapi import APIRouter,HTTPException,Depends
+from fastapi.responses import StreamingResponse
+import json
 import logging
+import time
 
 from app.services.query_service import QueryService
-from app.api.schemas.query import QueryRequest,QueryResponse
+from app.dependencies import get_query_service
+from app.api.schemas.query import QueryRequest,QueryResponse,BatchQueryRequest,BatchQueryResponse,BatchQueryItem
+from app.core.rag.filters import build_where_filter
+from app.config import settings
 
 logger=logging.getLogger(__name__)
 
 router=APIRouter(prefix="/query",tags=['query'])
 
+def _where_filter(request:QueryRequest):
+    """
+    Metadata filter for the request's scoping options (None if unscoped).
+    """
+    return build_where_filter(
+        file_name=request.file_name,
+        file_type=request.file_type,
+        ingested_after=request.ingested_after,
+        ingested_before=request.ingested_before
+    )
+
 @router.post("/",response_model=QueryResponse)
-async def query_documents(request:QueryRequest):
+async def query_documents(request:QueryRequest,service:QueryService=Depends(get_query_service)):
     """
     Query uploaded documents and get an AI-generated answer.
     
     This endpoint uses RAG (Retrieval-Augmented Generation) to:
     1. Find relevant document chunks
     2. Generate an answer based on those chunks
+
+    Set file_name, file_type or an ingest-date range to search only the
+    matching documents.
     """
     try:
-        service=QueryService()
-
-        result=service.query(question=request.question,
-            n_results=request.n_results)
+        result=await service.query_async(question=request.question,
+            n_results=request.n_results,
+            retrieval_mode=request.retrieval_mode,
+            where=_where_filter(request))
 
         return QueryResponse(
             answer=result["answer"],
             sources=result["sources"],
-            question=request.question
+            question=request.question,
+            metrics=result.get("metrics")
         )
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
@@ -35,6 +56,84 @@ async def query_documents(request:QueryRequest):
             detail=f"Failed to process query: {str(e)}"
         )
 
-        
 
+@router.post("/batch",response_model=BatchQueryResponse)
+async def query_documents_batch(request:BatchQueryRequest,service:QueryService=Depends(get_query_service)):
+    """
+    Answer a list of questions in one request.
+
+    All questions are embedded in one call and searched with one vector store
+    query; answers are generated concurrently (QUERY_BATCH_CONCURRENCY at a
+    time). Results come back in request order; a question that fails gets an
+    `error` instead of an answer without failing the batch.
+    """
+    if len(request.queries) > settings.query_batch_max_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(request.queries)} queries (max {settings.query_batch_max_size})"
+        )
+    try:
+        start_time=time.perf_counter()
+        results=await service.query_batch_async([
+            {
+                "question": query.question,
+                "n_results": query.n_results,
+                "retrieval_mode": query.retrieval_mode,
+                "where": _where_filter(query)
+            }
+            for query in request.queries
+        ])
+
+        items=[]
+        for i,(query,result) in enumerate(zip(request.queries,results)):
+            if "error" in result:
+                items.append(BatchQueryItem(index=i,question=query.question,error=result["error"]))
+            else:
+                items.append(BatchQueryItem(
+                    index=i,
+                    question=query.question,
+                    answer=result["answer"],
+                    sources=result["sources"],
+                    metrics=result.get("metrics")
+                ))
+        return BatchQueryResponse(
+            results=items,
+            total_time_ms=round((time.perf_counter()-start_time)*1000,2)
+        )
+    except Exception as e:
+        logger.error(f"Error processing batch query: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to process batch query: {str(e)}"
+        )
+
+
+@router.post("/stream")
+async def query_documents_stream(request:QueryRequest,service:QueryService=Depends(get_query_service)):
+    """
+    Query uploaded documents and stream the answer as server-sent events.
+
+    Events, in order:
+    1. `sources` - the retrieved chunks, sent before generation starts
+    2. `token` - pieces of the answer as Gemini generates them
+    3. `done` - time-to-first-token and total time in milliseconds
+    """
+    async def event_stream():
+        try:
+            async for event in service.query_stream_async(
+                question=request.question,
+                n_results=request.n_results,
+                retrieval_mode=request.retrieval_mode,
+                where=_where_filter(request)
+            ):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}")
+            error = {"detail": f"Failed to process query: {str(e)}"}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
 
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -4,6 +4,8 @@ from typing import List,Optional
 class FileInfo(BaseModel):
     file_name: str=Field(..., description="Name of the file")
     chunk_count: int=Field(..., description="Number of chunks for this file")
+    size_bytes: Optional[int]=Field(None, description="Size of the uploaded file in bytes")
+    ingested_at: Optional[float]=Field(None, description="Unix time of the last ingestion")
 
 class DocumentListResponse(BaseModel):
     total_count: int=Field(..., description="Total number of document chunks in the database")
@@ -21,9 +23,45 @@ class StatisticsResponse(BaseModel):
     unique_files: int = Field(..., description="Number of unique files")
     file_names: List[str] = Field(..., description="List of all unique file names")
 
+class RegistryRebuildResponse(BaseModel):
+    files: int = Field(..., description="Number of files registered")
+    chunks: int = Field(..., description="Number of chunks registered")
 
+class LexicalIndexRebuildResponse(BaseModel):
+    chunks: int = Field(..., description="Number of chunks indexed")
 
+class LexicalIndexStatsResponse(BaseModel):
+    enabled: bool = Field(..., description="Whether hybrid BM25 retrieval is enabled")
+    segments: int = Field(0, description="Index segments on disk")
+    documents: int = Field(0, description="Chunks currently indexed")
+    deleted_documents: int = Field(0, description="Deleted chunks awaiting compaction")
 
+class EmbeddingCacheStatsResponse(BaseModel):
+    enabled: bool = Field(..., description="Whether the embedding cache is enabled")
+    memory_hits: int = Field(0, description="Lookups served from the in-process LRU")
+    disk_hits: int = Field(0, description="Lookups served from the on-disk cache")
+    misses: int = Field(0, description="Lookups that had to be embedded by the API")
+    hit_rate: float = Field(0.0, description="Fraction of lookups served from the cache")
+    evictions: int = Field(0, description="Entries evicted from the on-disk cache")
+    memory_entries: int = Field(0, description="Entries currently in the in-process LRU")
+    disk_entries: int = Field(0, description="Entries currently in the on-disk cache")
+    max_disk_entries: int = Field(0, description="Size cap of the on-disk cache")
 
+class AnswerCacheStatsResponse(BaseModel):
+    enabled: bool = Field(..., description="Whether the semantic answer cache is enabled")
+    hits: int = Field(0, description="Queries answered from the cache")
+    misses: int = Field(0, description="Queries that needed retrieval and generation")
+    hit_rate: float = Field(0.0, description="Fraction of queries answered from the cache")
+    invalidations: int = Field(0, description="Entries dropped because of TTL or corpus changes")
+    entries: int = Field(0, description="Entries currently cached")
+    max_entries: int = Field(0, description="Size cap of the cache")
 
-
+class LLMSchedulerStatsResponse(BaseModel):
+    queue_depth: int = Field(..., description="Calls currently waiting for rate-limit budget")
+    max_queue_depth: int = Field(..., description="Largest queue depth seen since startup")
+    total_requests: int = Field(..., description="Upstream calls admitted by the scheduler")
+    coalesced_requests: int = Field(..., description="Calls served by sharing an identical in-flight call")
+    avg_wait_ms: float = Field(..., description="Average time spent waiting in the queue")
+    max_wait_ms: float = Field(..., description="Longest time spent waiting in the queue")
+    requests_per_minute: float = Field(..., description="Configured requests-per-minute budget")
+    tokens_per_minute: float = Field(..., description="Configured tokens-per-minute budget")
@@ -1,9 +1,23 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
-class DocumentUploadResponse(BaseModel):
-    """Response a Model for Document Upload"""
-    message: str
+class IngestionJobResponse(BaseModel):
+    """Response Model for an ingestion job (upload processed in the background)"""
+    job_id: str
+    status: str  # queued, running, completed or failed
+    stage: Optional[str] = None  # parsing, chunking, embedding, storing while running
     file_name: str
-    chunk_count: int
-    chunks: List[str]
+    size_bytes: int
+    content_sha256: Optional[str] = None
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0  # Chunks that were new or changed and had to be embedded
+    chunks_reused: int = 0  # Chunks unchanged since the file was last stored
+    chunks_stored: int = 0
+    chunks_deleted: int = 0  # Chunks of the previous version no longer in the file
+    chunk_count: Optional[int] = None
+    chunks: Optional[List[str]] = None  # Only when uploaded with include_chunks=true
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
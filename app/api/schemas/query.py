@@ -1,5 +1,6 @@
 from pydantic import BaseModel,Field
-from typing import List,Optional
+from typing import List,Optional,Dict,Literal
+from datetime import datetime
 
 class QueryRequest(BaseModel):
     """
@@ -7,6 +8,14 @@ class QueryRequest(BaseModel):
     """
     question:str=Field(..., description="The question to ask about the documents")
     n_results: Optional[int]=Field(default=5,description="Number of relevant chunks to retrieve", ge=1, le=10)
+    retrieval_mode: Literal["standard","multi_query"]=Field(
+        default="standard",
+        description="'standard' searches the question only; 'multi_query' also searches LLM rewrites of it and fuses the results"
+    )
+    file_name: Optional[str]=Field(default=None,description="Only search chunks of this file")
+    file_type: Optional[str]=Field(default=None,description="Only search chunks of this file type, e.g. 'pdf'")
+    ingested_after: Optional[datetime]=Field(default=None,description="Only search documents ingested at or after this time")
+    ingested_before: Optional[datetime]=Field(default=None,description="Only search documents ingested at or before this time")
 
 class SourceChunk(BaseModel):
     """
@@ -23,4 +32,29 @@ class QueryResponse(BaseModel):
     """
     answer: str = Field(..., description="The generated answer")
     sources: List[SourceChunk] = Field(..., description="List of source chunks used")
-    question: str = Field(..., description="The original question")
\ No newline at end of file
+    question: str = Field(..., description="The original question")
+    metrics: Optional[Dict[str, float]] = Field(default=None, description="Per-stage latencies in milliseconds")
+
+class BatchQueryRequest(BaseModel):
+    """
+    Request model for the batch query endpoint.
+    """
+    queries: List[QueryRequest] = Field(..., min_length=1, description="Questions to answer, each with its own options")
+
+class BatchQueryItem(BaseModel):
+    """
+    Result of one question of a batch: an answer, or the error that prevented it.
+    """
+    index: int = Field(..., description="Position of the question in the request")
+    question: str = Field(..., description="The original question")
+    answer: Optional[str] = Field(default=None, description="The generated answer")
+    sources: List[SourceChunk] = Field(default_factory=list, description="List of source chunks used")
+    metrics: Optional[Dict[str, float]] = Field(default=None, description="Per-stage latencies in milliseconds")
+    error: Optional[str] = Field(default=None, description="Why this question failed, if it did")
+
+class BatchQueryResponse(BaseModel):
+    """
+    Response model for the batch query endpoint.
+    """
+    results: List[BatchQueryItem] = Field(..., description="One result per question, in request order")
+    total_time_ms: float = Field(..., description="Time to answer the whole batch in milliseconds")
@@ -7,8 +7,8 @@ It's implemented as a LangGraph node function.
 """
 import logging
 from app.core.agents.state import AgentState
-from app.core.rag.vector_store import ChromaVectorStore
-from app.services.embedding_service import EmbeddingService
+from app.dependencies import get_vector_store, get_embedding_service
+from app.core.rag.reranking import get_reranker
 from app.config import settings
 
 logger=logging.getLogger(__name__)
@@ -19,31 +19,41 @@ def researcher_node(state: AgentState)->AgentState:
 
     state["current_step"]="researcher"
 
-    vector_store=ChromaVectorStore()
-    embedding_service=EmbeddingService()
+    # Shared, process-lifetime instances (see app/dependencies.py)
+    vector_store=get_vector_store()
+    embedding_service=get_embedding_service()
+    reranker=get_reranker()
+
+    # Optional metadata filter, pushed down to the vector store
+    where=state.get("filters")
+
+    # Over-fetch candidates when reranking, then keep the best n_results
+    n_candidates=reranker.candidate_depth(state['n_results']) if reranker else state['n_results']
 
     try:
         question_embedding=None
         try:
-            if settings.gemini_api_key:
+            if embedding_service.is_available():
                 question_embedding=embedding_service.generate_embeddings([state['question']])[0]
-                logging.info("Reseacher Agent:Using Gemini embeddings")
+                logger.info(f"Researcher Agent: Using {embedding_service.backend_name} embeddings")
             else:
-                logger.info("Researcher Agent: No Gemini API key, using ChromaDB default embeddings")
+                logger.info("Researcher Agent: Embedding backend unavailable, using ChromaDB default embeddings")
         except Exception as e:
-            logger.warning(f"Researcher Agent: Failed to generate Gemini embeddings: {str(e)}. Using ChromaDB default.")
+            logger.warning(f"Researcher Agent: Failed to generate embeddings: {str(e)}. Using ChromaDB default.")
             question_embedding = None
 
         if question_embedding:
             results = vector_store.query(
                 query_texts=[state['question']],
-                n_results=state['n_results'],
+                n_results=n_candidates,
+                where=where,
                 embeddings=[question_embedding]
             )
         else:
             results = vector_store.query(
                 query_texts=[state['question']],
-                n_results=state['n_results']
+                n_results=n_candidates,
+                where=where
             )
         if not results['documents'] or len(results['documents'][0]) == 0:
             logger.warning("Researcher Agent: No relevant documents found")
@@ -69,6 +79,17 @@ def researcher_node(state: AgentState)->AgentState:
                 "similarity_score": 1.0 - distance  # Convert distance to similarity (0-1 scale)
             }
             formatted_sources.append(source_info)
+
+        if reranker and len(formatted_sources) > 1:
+            selected = reranker.rerank_indices(state['question'], formatted_sources, state['n_results'])
+            retrieved_chunks = [retrieved_chunks[i] for i in selected]
+            metadatas = [metadatas[i] for i in selected if i < len(metadatas)]
+            formatted_sources = [formatted_sources[i] for i in selected]
+        else:
+            retrieved_chunks = retrieved_chunks[:state['n_results']]
+            metadatas = metadatas[:state['n_results']]
+            formatted_sources = formatted_sources[:state['n_results']]
+
         state["chunks"] = retrieved_chunks
         state["metadatas"] = metadatas
         state["formatted_sources"] = formatted_sources
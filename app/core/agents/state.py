@@ -16,6 +16,7 @@ class AgentState(TypedDict):
     # Input
     question: str  # User's original question
     n_results: int  # Number of chunks to retrieve
+    filters: Optional[Dict]  # Metadata where filter scoping the search (see app.core.rag.filters)
     
     # Researcher Agent output
     chunks: List[str]  # Retrieved document chunks
@@ -0,0 +1,81 @@
+"""
+Shared, bounded executors for blocking work started from async code.
+
+CPU-bound document parsing (PyPDF2, python-docx) must not run on the
+event loop, and it must not run unbounded either: a burst of uploads
+would otherwise start one parser per request.
+"""
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_parse_executor: Optional[ThreadPoolExecutor] = None
+_pdf_process_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_parse_executor() -> ThreadPoolExecutor:
+    """
+    Get the process-wide executor used for document parsing and chunking.
+    """
+    global _parse_executor
+    if _parse_executor is None:
+        with _lock:
+            if _parse_executor is None:
+                _parse_executor = ThreadPoolExecutor(
+                    max_workers=max(1, settings.parse_max_workers),
+                    thread_name_prefix="documind-parse",
+                )
+    return _parse_executor
+
+
+def get_pdf_process_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Get the process pool PDF pages are extracted in, or None if
+    settings.pdf_parse_processes is 0. Worker processes are started on
+    first use, from a fork server (forking the threaded API process itself
+    is unsafe) where available.
+    """
+    global _pdf_process_pool
+    if settings.pdf_parse_processes <= 0:
+        return None
+    if _pdf_process_pool is None:
+        with _lock:
+            if _pdf_process_pool is None:
+                methods = multiprocessing.get_all_start_methods()
+                _pdf_process_pool = ProcessPoolExecutor(
+                    max_workers=settings.pdf_parse_processes,
+                    mp_context=multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn"),
+                )
+    return _pdf_process_pool
+
+
+async def run_in_parse_executor(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run a blocking parse/chunk function on the bounded parse executor.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_parse_executor(), func, *args)
+
+
+def shutdown_executors():
+    """
+    Shut down the shared executors, waiting for running jobs to finish.
+    """
+    global _parse_executor, _pdf_process_pool
+    with _lock:
+        if _parse_executor is not None:
+            _parse_executor.shutdown(wait=True)
+            _parse_executor = None
+            logger.info("Parse executor shut down")
+        if _pdf_process_pool is not None:
+            _pdf_process_pool.shutdown(wait=True)
+            _pdf_process_pool = None
+            logger.info("PDF process pool shut down")
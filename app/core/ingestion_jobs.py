@@ -0,0 +1,197 @@
+"""
+Persistent ingestion job records.
+
+Uploads are processed in the background (see IngestionService). Every job
+is a row in a SQLite file next to the vector store, so its status and
+progress can be polled, and queued or interrupted jobs are picked up
+again after a restart (their uploaded file is kept in the upload spool
+directory until the job finishes).
+
+Job status: "queued" -> "running" -> "completed" | "failed".
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+# Progress fields a running job may update
+PROGRESS_FIELDS = ("stage", "pages_parsed", "chunks_total", "chunks_embedded", "chunks_reused", "chunks_stored")
+
+_COLUMNS = (
+    "job_id", "file_name", "file_path", "content_sha256", "size_bytes", "include_chunks",
+    "status", "stage", "pages_parsed", "chunks_total", "chunks_embedded", "chunks_stored",
+    "chunk_count", "chunks", "error", "created_at", "started_at", "finished_at",
+    "chunks_reused", "chunks_deleted",
+)
+
+
+class IngestionJobStore:
+    """
+    SQLite-backed table of ingestion jobs.
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, file_name TEXT NOT NULL, file_path TEXT NOT NULL, "
+            "content_sha256 TEXT, size_bytes INTEGER NOT NULL DEFAULT 0, "
+            "include_chunks INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL, stage TEXT, "
+            "pages_parsed INTEGER NOT NULL DEFAULT 0, chunks_total INTEGER NOT NULL DEFAULT 0, "
+            "chunks_embedded INTEGER NOT NULL DEFAULT 0, chunks_stored INTEGER NOT NULL DEFAULT 0, "
+            "chunk_count INTEGER, chunks TEXT, error TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "chunks_reused INTEGER NOT NULL DEFAULT 0, chunks_deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Job tables created before incremental re-ingestion
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column in ("chunks_reused", "chunks_deleted"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        self._conn.commit()
+
+    def create(
+        self,
+        file_name: str,
+        file_path: str,
+        content_sha256: Optional[str] = None,
+        size_bytes: int = 0,
+        include_chunks: bool = False,
+    ) -> Dict:
+        """
+        Record a new queued job.
+
+        Returns:
+            The job dictionary
+        """
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, file_name, file_path, content_sha256, size_bytes, include_chunks, "
+                "status, stage, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, file_name, file_path, content_sha256, size_bytes, int(include_chunks),
+                 STATUS_QUEUED, STATUS_QUEUED, time.time()),
+            )
+            self._conn.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        Get a job by ID, or None if it doesn't exist.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._to_job(row) if row else None
+
+    def update(self, job_id: str, **fields):
+        """
+        Update some columns of a job.
+        """
+        if not fields:
+            return
+        if "chunks" in fields and fields["chunks"] is not None:
+            fields["chunks"] = json.dumps(fields["chunks"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def unfinished(self) -> List[Dict]:
+        """
+        Jobs that still have to run (queued, or interrupted while running), oldest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (STATUS_QUEUED, STATUS_RUNNING),
+            ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def count_unfinished(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (STATUS_QUEUED, STATUS_RUNNING)
+            ).fetchone()[0]
+
+    def prune(self, older_than_seconds: float) -> int:
+        """
+        Delete finished jobs older than the given age.
+
+        Returns:
+            Number of jobs deleted
+        """
+        cutoff = time.time() - older_than_seconds
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (STATUS_COMPLETED, STATUS_FAILED, cutoff),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_job(row) -> Dict:
+        job = dict(zip(_COLUMNS, row))
+        job["include_chunks"] = bool(job["include_chunks"])
+        job["chunks"] = json.loads(job["chunks"]) if job["chunks"] else None
+        return job
+
+
+_job_store: Optional[IngestionJobStore] = None
+_job_store_lock = threading.Lock()
+
+
+def get_ingestion_job_store() -> IngestionJobStore:
+    """
+    Get the process-wide ingestion job store (created on first use).
+    """
+    global _job_store
+    if _job_store is None:
+        with _job_store_lock:
+            if _job_store is None:
+                _job_store = IngestionJobStore(
+                    db_path=os.path.join(settings.vector_db_dir, "ingestion_jobs.sqlite")
+                )
+    return _job_store
+
+
+def close_ingestion_job_store():
+    """
+    Close the job store, if it was opened.
+    """
+    global _job_store
+    with _job_store_lock:
+        if _job_store is not None:
+            _job_store.close()
+            _job_store = None
+
+
+def get_spool_dir() -> str:
+    """
+    Directory uploads are kept in until their job has finished.
+    """
+    return settings.ingestion_spool_dir or os.path.join(settings.vector_db_dir, "uploads")
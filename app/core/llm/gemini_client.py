@@ -1,47 +1,251 @@
-from typing import List, Optional
-import google.generativeai as genai
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import asyncio
+import logging
+import random
+import threading
+import time
 from app.config import settings
+from app.core.llm.scheduler import GeminiScheduler, get_gemini_scheduler, estimate_tokens, request_key
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+# google.generativeai takes most of a second to import, so it is only
+# imported (and configured) when the first Gemini call is made.
+@lru_cache(maxsize=None)
+def _load_genai():
+    import google.generativeai as genai
+    genai.configure(api_key=settings.gemini_api_key)
+    return genai
+
+
+@lru_cache(maxsize=None)
+def _retryable_errors() -> Tuple[type, ...]:
+    """
+    Errors worth retrying: quota/rate limits and transient server-side failures.
+    """
+    from google.api_core import exceptions as google_exceptions
+    return (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+    )
 
 class GeminiClient:
     """
     Wrapper class for Google Gemini API.
     Handles both chat completions and embeddings generation.
+
+    All calls go through the shared GeminiScheduler (rate limits, fair
+    queueing and coalescing of identical concurrent requests).
     """
-    def __init__(self):
-        genai.configure(api_key=settings.gemini_api_key)
-        self.model = genai.GenerativeModel(settings.gemini_model_name)
+    def __init__(self, scheduler: Optional[GeminiScheduler] = None):
+        self._model = None
+        self._model_lock = threading.Lock()
         # Note: Embeddings use a different API, not GenerativeModel
-    
+        self.scheduler = scheduler or get_gemini_scheduler()
+
+    @property
+    def model(self):
+        """
+        The GenerativeModel, created on first use.
+        """
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = _load_genai().GenerativeModel(settings.gemini_model_name)
+        return self._model
+
     def chat(self, prompt: str, context: Optional[str] = None) -> str:
         """
         Generate a chat response from Gemini.
-        
+
         Args:
             prompt: The user's question/prompt
             context: Optional context to include in the prompt
-            
+
         Returns:
             The generated text response
         """
         full_prompt = f"{context}\n\n{prompt}" if context else prompt
-        response = self.model.generate_content(full_prompt)
-        return response.text
-    
-    def embed(self, texts: List[str]) -> List[List[float]]:
+        key = request_key(settings.gemini_model_name, full_prompt)
+        tokens = estimate_tokens(full_prompt)
+
+        return self._with_retries(
+            lambda: self.scheduler.run(key, tokens, lambda: self.model.generate_content(full_prompt).text),
+            description="Chat request",
+        )
+
+    async def chat_async(self, prompt: str, context: Optional[str] = None) -> str:
+        """
+        Async version of chat(). Awaits Gemini without blocking the event loop.
+
+        Args:
+            prompt: The user's question/prompt
+            context: Optional context to include in the prompt
+
+        Returns:
+            The generated text response
+        """
+        full_prompt = f"{context}\n\n{prompt}" if context else prompt
+        key = request_key(settings.gemini_model_name, full_prompt)
+        tokens = estimate_tokens(full_prompt)
+
+        async def generate() -> str:
+            response = await self.model.generate_content_async(full_prompt)
+            return response.text
+
+        return await self._with_retries_async(
+            lambda: self.scheduler.run_async(key, tokens, generate),
+            description="Chat request",
+        )
+
+    async def chat_stream_async(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Stream a chat response from Gemini, yielding text as it is generated.
+
+        Streams are rate-limited by the scheduler but never coalesced.
+
+        Args:
+            prompt: The user's question/prompt
+            context: Optional context to include in the prompt
+
+        Yields:
+            Pieces of the generated text, in order
+        """
+        full_prompt = f"{context}\n\n{prompt}" if context else prompt
+        await self.scheduler.acquire_async(estimate_tokens(full_prompt))
+        response = await self.model.generate_content_async(full_prompt, stream=True)
+        async for chunk in response:
+            # Chunks without text parts (e.g. safety/finish metadata) raise on .text
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text:
+                yield text
+
+    def embed(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
         """
         Generate embeddings for a list of texts using Gemini.
-        
+
+        Texts are sent in batches (one API call per batch) and several
+        batches run concurrently. The output order matches the input order.
+
         Args:
             texts: List of text strings to embed
-            
+            batch_size: Texts per API call (default: settings.gemini_embed_batch_size)
+
         Returns:
             List of embedding vectors (each is a list of floats)
         """
-        embeddings = []
-        for text in texts:
-            result = genai.embed_content(
+        if not texts:
+            return []
+
+        batch_size = max(1, batch_size or settings.gemini_embed_batch_size)
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+
+        max_workers = max(1, min(settings.gemini_embed_concurrency, len(batches)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # executor.map keeps results in the same order as the batches
+            batch_results = list(executor.map(self._embed_batch, batches))
+
+        return [embedding for batch in batch_results for embedding in batch]
+
+    async def embed_async(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        Async version of embed(). Batches run concurrently (bounded by
+        settings.gemini_embed_concurrency) in worker threads, so the event
+        loop stays free while waiting on the API or backing off.
+
+        Args:
+            texts: List of text strings to embed
+            batch_size: Texts per API call (default: settings.gemini_embed_batch_size)
+
+        Returns:
+            List of embedding vectors, in input order
+        """
+        if not texts:
+            return []
+
+        batch_size = max(1, batch_size or settings.gemini_embed_batch_size)
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        semaphore = asyncio.Semaphore(max(1, settings.gemini_embed_concurrency))
+
+        async def embed_one(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await asyncio.to_thread(self._embed_batch, batch)
+
+        # gather keeps results in the same order as the batches
+        batch_results = await asyncio.gather(*(embed_one(batch) for batch in batches))
+        return [embedding for batch in batch_results for embedding in batch]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """
+        Embed one batch of texts with a single API call, retrying with
+        exponential backoff (plus jitter) on rate-limit and transient errors.
+        """
+        key = request_key(settings.gemini_embed_model, *batch)
+        tokens = sum(estimate_tokens(text) for text in batch)
+
+        def call() -> List[List[float]]:
+            result = _load_genai().embed_content(
                 model=settings.gemini_embed_model,
-                content=text
+                content=batch
             )
-            embeddings.append(result['embedding'])
-        return embeddings
\ No newline at end of file
+            return result['embedding']
+
+        return self._with_retries(
+            lambda: self.scheduler.run(key, tokens, call),
+            description=f"Embedding batch of {len(batch)}",
+        )
+
+    @staticmethod
+    def _retry_delay(attempt: int) -> float:
+        delay = settings.gemini_retry_base_delay * (2 ** attempt)
+        return delay + random.uniform(0, settings.gemini_retry_base_delay)
+
+    def _with_retries(self, func: Callable[[], T], description: str) -> T:
+        """
+        Call func, retrying rate-limit and transient errors with exponential
+        backoff (plus jitter).
+        """
+        for attempt in range(settings.gemini_max_retries + 1):
+            try:
+                return func()
+            except _retryable_errors() as e:
+                if attempt >= settings.gemini_max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(
+                    f"{description} failed ({type(e).__name__}), "
+                    f"retrying in {delay:.1f}s (attempt {attempt + 1}/{settings.gemini_max_retries})"
+                )
+                time.sleep(delay)
+        raise RuntimeError(f"{description} failed")
+
+    async def _with_retries_async(self, func: Callable[[], Awaitable[T]], description: str) -> T:
+        """
+        Async version of _with_retries().
+        """
+        for attempt in range(settings.gemini_max_retries + 1):
+            try:
+                return await func()
+            except _retryable_errors() as e:
+                if attempt >= settings.gemini_max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(
+                    f"{description} failed ({type(e).__name__}), "
+                    f"retrying in {delay:.1f}s (attempt {attempt + 1}/{settings.gemini_max_retries})"
+                )
+                await asyncio.sleep(delay)
+        raise RuntimeError(f"{description} failed")
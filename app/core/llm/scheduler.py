@@ -0,0 +1,319 @@
+"""
+Shared scheduler for Gemini API calls.
+
+Every chat/embed call made by GeminiClient goes through one process-wide
+GeminiScheduler, which:
+    - enforces requests-per-minute and tokens-per-minute budgets with two
+      token buckets, so we queue instead of hitting quota errors;
+    - serves waiting callers strictly in arrival order (FIFO queue), so a
+      burst of ingestion batches can't starve a user query forever;
+    - coalesces concurrent identical requests (same prompt / same embed
+      batch) into a single upstream call whose result is shared;
+    - reports queue depth and wait times.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate (~4 characters per token) used for TPM budgeting.
+    """
+    return len(text) // 4 + 1
+
+
+def request_key(*parts: str) -> str:
+    """
+    Build a coalescing key from the parts that identify a request.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`, holding at
+    most one minute of budget.
+    """
+    def __init__(self, rate_per_minute: float):
+        self.capacity = max(1.0, float(rate_per_minute))
+        self.rate_per_second = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` tokens are available (0 if available now).
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate_per_second
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class _AsyncWaiter:
+    """
+    Queue ticket of an async caller: woken through its event loop when it
+    reaches the head of the queue, so waiting holds no thread.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future: Optional[asyncio.Future] = None
+
+    def wake(self):
+        future = self.future
+        if future is not None:
+            self.loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class GeminiScheduler:
+    """
+    Rate-limits, orders and coalesces Gemini API calls.
+    """
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self._request_bucket = TokenBucket(requests_per_minute)
+        self._token_bucket = TokenBucket(tokens_per_minute)
+        self._condition = threading.Condition()
+
+        # FIFO queue of waiting callers: only the head may take budget
+        self._waiters: Deque[object] = deque()
+
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_async: Dict[str, asyncio.Task] = {}
+
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.total_requests = 0
+        self.coalesced_requests = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def acquire(self, tokens: int):
+        """
+        Block until it is this caller's turn and both budgets allow the call.
+
+        Args:
+            tokens: Estimated tokens the call will use
+        """
+        start = time.monotonic()
+        with self._condition:
+            ticket = object()
+            self._waiters.append(ticket)
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            try:
+                while True:
+                    if self._waiters[0] is ticket:
+                        wait = max(
+                            self._request_bucket.wait_time(1),
+                            self._token_bucket.wait_time(tokens),
+                        )
+                        if wait <= 0:
+                            break
+                        self._condition.wait(timeout=wait)
+                    else:
+                        self._condition.wait()
+
+                self._request_bucket.consume(1)
+                self._token_bucket.consume(tokens)
+            finally:
+                self._leave(ticket)
+            waited = self._record_wait(start)
+
+        if waited > 1.0:
+            logger.info(f"Gemini scheduler: call waited {waited:.2f}s for rate-limit budget")
+
+    async def acquire_async(self, tokens: int):
+        """
+        Async version of acquire(). Waits on the event loop, without holding
+        a thread: the head of the queue sleeps until the budget refills, the
+        others wait until they become the head. Shares the FIFO queue with
+        blocking callers.
+
+        Args:
+            tokens: Estimated tokens the call will use
+        """
+        start = time.monotonic()
+        waiter = _AsyncWaiter(asyncio.get_running_loop())
+        with self._condition:
+            self._waiters.append(waiter)
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            while True:
+                with self._condition:
+                    delay: Optional[float] = None
+                    if self._waiters[0] is waiter:
+                        delay = max(
+                            self._request_bucket.wait_time(1),
+                            self._token_bucket.wait_time(tokens),
+                        )
+                        if delay <= 0:
+                            self._request_bucket.consume(1)
+                            self._token_bucket.consume(tokens)
+                            break
+                    # Created under the lock, so a wake-up can't be missed
+                    waiter.future = waiter.loop.create_future()
+                if delay is None:
+                    await waiter.future
+                else:
+                    # Only the head consumes budget, so the delay is exact
+                    await asyncio.sleep(delay)
+        finally:
+            with self._condition:
+                self._leave(waiter)
+        with self._condition:
+            waited = self._record_wait(start)
+
+        if waited > 1.0:
+            logger.info(f"Gemini scheduler: call waited {waited:.2f}s for rate-limit budget")
+
+    def _leave(self, ticket: object):
+        """
+        Remove a ticket from the queue and wake the next caller (caller must
+        hold the condition).
+        """
+        self._waiters.remove(ticket)
+        self.queue_depth -= 1
+        self._condition.notify_all()
+        if self._waiters and isinstance(self._waiters[0], _AsyncWaiter):
+            self._waiters[0].wake()
+
+    def _record_wait(self, start: float) -> float:
+        """
+        Update the wait statistics (caller must hold the condition).
+        """
+        waited = time.monotonic() - start
+        self.total_requests += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return waited
+
+    def run(self, key: Optional[str], tokens: int, func: Callable[[], T]) -> T:
+        """
+        Run a blocking API call under the scheduler.
+
+        Args:
+            key: Coalescing key (see request_key); None disables coalescing
+            tokens: Estimated tokens the call will use
+            func: The API call
+
+        Returns:
+            The call's result (shared with identical concurrent callers)
+        """
+        if key is None:
+            self.acquire(tokens)
+            return func()
+
+        with self._condition:
+            leader_future = self._inflight.get(key)
+            if leader_future is None:
+                future: Future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced_requests += 1
+
+        if leader_future is not None:
+            return leader_future.result()
+
+        try:
+            self.acquire(tokens)
+            result = func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._condition:
+                self._inflight.pop(key, None)
+
+    async def run_async(self, key: Optional[str], tokens: int, coro_func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Async version of run() for coroutine API calls.
+        """
+        if key is None:
+            await self.acquire_async(tokens)
+            return await coro_func()
+
+        task = self._inflight_async.get(key)
+        if task is not None:
+            self.coalesced_requests += 1
+        else:
+            async def call():
+                try:
+                    await self.acquire_async(tokens)
+                    return await coro_func()
+                finally:
+                    self._inflight_async.pop(key, None)
+
+            task = asyncio.ensure_future(call())
+            self._inflight_async[key] = task
+
+        # shield: one caller being cancelled must not cancel the shared call
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue depth, wait times and the configured budgets.
+        """
+        with self._condition:
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "total_requests": self.total_requests,
+                "coalesced_requests": self.coalesced_requests,
+                "avg_wait_ms": (self.total_wait_seconds / self.total_requests * 1000) if self.total_requests else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+                "requests_per_minute": self._request_bucket.capacity,
+                "tokens_per_minute": self._token_bucket.capacity,
+            }
+
+
+_scheduler: Optional[GeminiScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_gemini_scheduler() -> GeminiScheduler:
+    """
+    Get the process-wide Gemini scheduler (created on first use).
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GeminiScheduler(
+                    requests_per_minute=settings.gemini_requests_per_minute,
+                    tokens_per_minute=settings.gemini_tokens_per_minute,
+                )
+    return _scheduler
@@ -0,0 +1,130 @@
+"""
+Context assembly for answer prompts.
+
+TextSplitter produces overlapping chunks, so when retrieval returns
+neighbouring chunks of the same file the overlap would be sent to the LLM
+twice. ContextPacker:
+    1. merges chunks with consecutive chunk_index from the same file_name
+       into one block, dropping the duplicated overlap text;
+    2. orders blocks by their best retrieval rank;
+    3. packs blocks into a token budget (estimated at ~4 chars per token).
+"""
+import logging
+from typing import Dict, List, Tuple
+
+from app.core.llm.scheduler import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Shorter suffix/prefix matches are treated as coincidence, not chunk overlap
+MIN_OVERLAP_CHARS = 10
+
+
+def merge_overlapping(previous: str, following: str, max_overlap_chars: int) -> str:
+    """
+    Join two consecutive chunks, keeping their shared overlap only once.
+
+    Args:
+        previous: Text of chunk i
+        following: Text of chunk i + 1
+        max_overlap_chars: Longest overlap to look for
+
+    Returns:
+        The merged text
+    """
+    longest = min(len(previous), len(following), max_overlap_chars)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return previous + following[size:]
+    return f"{previous}\n{following}"
+
+
+class ContextPacker:
+    """
+    Merges adjacent chunks and packs them into a token budget.
+    """
+    def __init__(self, token_budget: int = 3000, max_overlap_chars: int = 400):
+        self.token_budget = token_budget
+        self.max_overlap_chars = max_overlap_chars
+
+    def merge(self, sources: List[Dict]) -> List[Dict]:
+        """
+        Merge sources with consecutive chunk_index from the same file.
+
+        Args:
+            sources: Retrieved sources, best first (chunk, file_name, chunk_index)
+
+        Returns:
+            Blocks with text, file_name, first/last chunk index and best rank,
+            ordered by best rank
+        """
+        by_file: Dict[str, List[Tuple[int, int, str]]] = {}
+        for rank, source in enumerate(sources):
+            by_file.setdefault(source.get("file_name", "Unknown"), []).append(
+                (int(source.get("chunk_index", 0)), rank, source["chunk"])
+            )
+
+        blocks: List[Dict] = []
+        for file_name, entries in by_file.items():
+            entries.sort()
+            current = None
+            for chunk_index, rank, text in entries:
+                if current is not None and chunk_index == current["last_chunk"]:
+                    # Same chunk retrieved twice (e.g. by several queries)
+                    current["rank"] = min(current["rank"], rank)
+                    continue
+                if current is not None and chunk_index == current["last_chunk"] + 1:
+                    current["text"] = merge_overlapping(current["text"], text, self.max_overlap_chars)
+                    current["last_chunk"] = chunk_index
+                    current["rank"] = min(current["rank"], rank)
+                    current["chunk_count"] += 1
+                    continue
+                if current is not None:
+                    blocks.append(current)
+                current = {
+                    "text": text,
+                    "file_name": file_name,
+                    "first_chunk": chunk_index,
+                    "last_chunk": chunk_index,
+                    "rank": rank,
+                    "chunk_count": 1,
+                }
+            if current is not None:
+                blocks.append(current)
+
+        blocks.sort(key=lambda block: block["rank"])
+        return blocks
+
+    def pack(self, sources: List[Dict]) -> Tuple[List[Dict], Dict[str, int]]:
+        """
+        Merge sources and keep as many blocks as fit in the token budget.
+        If even the best block is too large it is truncated to the budget.
+
+        Returns:
+            Tuple of (packed blocks, stats) where stats has the token counts
+            of the naive concatenation and of the packed context
+        """
+        blocks = self.merge(sources)
+
+        packed: List[Dict] = []
+        used_tokens = 0
+        for block in blocks:
+            tokens = estimate_tokens(block["text"])
+            if used_tokens + tokens <= self.token_budget:
+                packed.append(block)
+                used_tokens += tokens
+            elif not packed:
+                # Keep at least the best block, cut to the budget
+                block = {**block, "text": block["text"][:self.token_budget * 4]}
+                packed.append(block)
+                used_tokens += estimate_tokens(block["text"])
+
+        original_tokens = sum(estimate_tokens(source["chunk"]) for source in sources)
+        stats = {
+            "context_tokens_original": original_tokens,
+            "context_tokens_packed": used_tokens,
+            "context_tokens_saved": max(0, original_tokens - used_tokens),
+            "context_blocks": len(packed),
+            "context_chunks_merged": sum(block["chunk_count"] - 1 for block in packed),
+        }
+        return packed, stats
@@ -0,0 +1,297 @@
+"""
+Per-file document registry.
+
+Chroma only knows chunks, so answering "which files are stored and how many
+chunks does each have" used to mean loading every chunk's text and metadata.
+The registry keeps one row per file (name, chunk count, size, ingest time,
+content hash) plus the file's chunk IDs in a SQLite file next to the vector
+store:
+
+    - DocumentService registers a file's chunks as they are written, and
+      uses the content hash and chunk IDs to skip or update re-uploads.
+    - AdminService lists files, builds statistics and deletes by file name
+      with indexed lookups instead of collection scans.
+    - rebuild() reconstructs the registry from the chunk metadata in Chroma
+      (see scripts/rebuild_registry.py), e.g. for collections created before
+      the registry existed.
+"""
+import os
+import sqlite3
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentRegistry:
+    """
+    SQLite-backed index of stored files and their chunk IDs.
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "file_name TEXT PRIMARY KEY, chunk_count INTEGER NOT NULL, "
+            "size_bytes INTEGER NOT NULL, ingested_at REAL NOT NULL, content_sha256 TEXT)"
+        )
+        # Registries created before content hashes were recorded
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        if "content_sha256" not in columns:
+            self._conn.execute("ALTER TABLE files ADD COLUMN content_sha256 TEXT")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "chunk_id TEXT PRIMARY KEY, file_name TEXT NOT NULL, chunk_index INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file_name ON chunks(file_name)")
+        self._conn.commit()
+
+    def register_file(
+        self,
+        file_name: str,
+        chunk_ids: List[str],
+        size_bytes: int = 0,
+        ingested_at: Optional[float] = None,
+        chunk_indexes: Optional[List[int]] = None,
+    ):
+        """
+        Record newly stored chunks of a file. Chunks already registered
+        under the same ID get the new chunk index.
+
+        Args:
+            file_name: Name the file is listed and deleted by
+            chunk_ids: IDs of the chunks written to the vector store, in order
+            size_bytes: Size of the uploaded file
+            ingested_at: Unix time of the ingestion (default: now)
+            chunk_indexes: Chunk index of every chunk (default: 0, 1, ...)
+        """
+        ingested_at = ingested_at if ingested_at is not None else time.time()
+        with self._lock:
+            if chunk_indexes is None:
+                chunk_indexes = list(range(len(chunk_ids)))
+            self._add_chunks(file_name, list(zip(chunk_ids, chunk_indexes)))
+            self._conn.execute(
+                "INSERT INTO files (file_name, chunk_count, size_bytes, ingested_at) VALUES (?, 0, ?, ?) "
+                "ON CONFLICT(file_name) DO UPDATE SET size_bytes = excluded.size_bytes, "
+                "ingested_at = excluded.ingested_at",
+                (file_name, size_bytes, ingested_at),
+            )
+            self._refresh_chunk_count(file_name)
+            self._conn.commit()
+
+    def get_file(self, file_name: str) -> Optional[Dict]:
+        """
+        Get a file's entry (file_name, chunk_count, size_bytes, ingested_at,
+        content_sha256), or None if it isn't registered.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_name, chunk_count, size_bytes, ingested_at, content_sha256 FROM files WHERE file_name = ?",
+                (file_name,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("file_name", "chunk_count", "size_bytes", "ingested_at", "content_sha256"), row))
+
+    def set_content_hash(self, file_name: str, content_sha256: Optional[str]):
+        """
+        Record the SHA-256 of the file content its chunks were made from.
+        """
+        with self._lock:
+            self._conn.execute("UPDATE files SET content_sha256 = ? WHERE file_name = ?", (content_sha256, file_name))
+            self._conn.commit()
+
+    def get_chunk_indexes(self, file_name: str) -> Dict[str, int]:
+        """
+        Get the chunk index of every chunk stored for a file, by chunk ID.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, chunk_index FROM chunks WHERE file_name = ?", (file_name,)
+            ).fetchall()
+        return {chunk_id: chunk_index for chunk_id, chunk_index in rows}
+
+    def get_chunk_ids(self, file_name: str) -> List[str]:
+        """
+        Get the IDs of all chunks stored for a file.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id FROM chunks WHERE file_name = ? ORDER BY chunk_index",
+                (file_name,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def remove_file(self, file_name: str) -> int:
+        """
+        Forget a file and its chunks.
+
+        Returns:
+            Number of chunk IDs removed from the registry
+        """
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM chunks WHERE file_name = ?", (file_name,)).rowcount
+            self._conn.execute("DELETE FROM files WHERE file_name = ?", (file_name,))
+            self._conn.commit()
+        return removed
+
+    def remove_chunks(self, file_name: str, chunk_ids: List[str]) -> int:
+        """
+        Forget some chunks of a file (e.g. of an ingestion that failed part
+        way); the file is forgotten once it has no chunks left.
+
+        Returns:
+            Number of chunk IDs removed from the registry
+        """
+        with self._lock:
+            removed = self._conn.executemany(
+                "DELETE FROM chunks WHERE chunk_id = ? AND file_name = ?",
+                [(chunk_id, file_name) for chunk_id in chunk_ids],
+            ).rowcount
+            self._refresh_chunk_count(file_name)
+            self._conn.execute("DELETE FROM files WHERE file_name = ? AND chunk_count = 0", (file_name,))
+            self._conn.commit()
+        return removed
+
+    def list_files(self) -> List[Dict]:
+        """
+        Get every registered file, ordered by name.
+
+        Returns:
+            List of dictionaries with file_name, chunk_count, size_bytes and ingested_at
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_name, chunk_count, size_bytes, ingested_at FROM files ORDER BY file_name"
+            ).fetchall()
+        return [
+            {
+                "file_name": file_name,
+                "chunk_count": chunk_count,
+                "size_bytes": size_bytes,
+                "ingested_at": ingested_at,
+            }
+            for file_name, chunk_count, size_bytes, ingested_at in rows
+        ]
+
+    def total_chunks(self) -> int:
+        """
+        Get the number of registered chunks across all files.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(chunk_count), 0) FROM files").fetchone()[0]
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
+
+    def rebuild(self, chunks: Iterable[Tuple[str, Dict]]) -> Dict:
+        """
+        Replace the registry contents with what the vector store holds.
+
+        Args:
+            chunks: (chunk_id, metadata) pairs for every chunk in the collection
+
+        Returns:
+            Dictionary with the number of files and chunks registered
+        """
+        files: Dict[str, Dict] = {}
+        chunk_rows: List[Tuple[str, str, int]] = []
+        for chunk_id, metadata in chunks:
+            metadata = metadata or {}
+            file_name = metadata.get("file_name", "Unknown")
+            chunk_rows.append((chunk_id, file_name, int(metadata.get("chunk_index", 0))))
+            entry = files.setdefault(
+                file_name, {"size_bytes": 0, "ingested_at": 0.0, "content_sha256": metadata.get("content_sha256")}
+            )
+            entry["size_bytes"] = max(entry["size_bytes"], int(metadata.get("file_size", 0)))
+            entry["ingested_at"] = max(entry["ingested_at"], float(metadata.get("ingested_at", 0.0)))
+            # Chunks from different versions of the file: the hash is unknown
+            if entry["content_sha256"] != metadata.get("content_sha256"):
+                entry["content_sha256"] = None
+
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM files")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, file_name, chunk_index) VALUES (?, ?, ?)",
+                chunk_rows,
+            )
+            self._conn.executemany(
+                "INSERT INTO files (file_name, chunk_count, size_bytes, ingested_at, content_sha256) VALUES (?, 0, ?, ?, ?)",
+                [
+                    (name, entry["size_bytes"], entry["ingested_at"], entry["content_sha256"])
+                    for name, entry in files.items()
+                ],
+            )
+            self._conn.execute(
+                "UPDATE files SET chunk_count = "
+                "(SELECT COUNT(*) FROM chunks WHERE chunks.file_name = files.file_name)"
+            )
+            self._conn.commit()
+
+        logger.info(f"Rebuilt document registry: {len(files)} files, {len(chunk_rows)} chunks")
+        return {"files": len(files), "chunks": len(chunk_rows)}
+
+    def close(self):
+        """
+        Close the SQLite connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+    def _add_chunks(self, file_name: str, chunks: List[Tuple[str, int]]):
+        """
+        Insert chunk rows (caller must hold the lock).
+        """
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO chunks (chunk_id, file_name, chunk_index) VALUES (?, ?, ?)",
+            [(chunk_id, file_name, chunk_index) for chunk_id, chunk_index in chunks],
+        )
+
+    def _refresh_chunk_count(self, file_name: str):
+        """
+        Recount a file's chunks (caller must hold the lock).
+        """
+        self._conn.execute(
+            "UPDATE files SET chunk_count = (SELECT COUNT(*) FROM chunks WHERE file_name = ?) "
+            "WHERE file_name = ?",
+            (file_name, file_name),
+        )
+
+
+_registry: Optional[DocumentRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_document_registry() -> DocumentRegistry:
+    """
+    Get the process-wide document registry (created on first use).
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DocumentRegistry(
+                    db_path=os.path.join(settings.vector_db_dir, "document_registry.sqlite")
+                )
+    return _registry
+
+
+def close_document_registry():
+    """
+    Close the process-wide document registry (called on application shutdown).
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.close()
+            _registry = None
@@ -0,0 +1,275 @@
+"""
+Content-addressed embedding cache.
+
+Two tiers:
+    1. An in-process LRU (OrderedDict) for hot texts such as repeated questions.
+    2. A SQLite file next to the vector store, so cached embeddings survive
+       restarts and are shared by every worker on the machine.
+
+Entries are keyed by sha256(embedding model + text), so changing the
+embedding model never returns stale vectors.
+
+Hits don't write to SQLite: their last_used times are collected and written
+in one transaction every TOUCH_FLUSH_ENTRIES hits or TOUCH_FLUSH_SECONDS, and
+before an eviction. Several processes share the file, so the disk entry count
+is only an estimate per process; it is recounted before evicting and every
+DISK_RECOUNT_SECONDS.
+"""
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pending last_used updates are written once there are this many, or this
+# many seconds after the first one
+TOUCH_FLUSH_ENTRIES = 1000
+TOUCH_FLUSH_SECONDS = 30.0
+# Other processes add entries too: recount at least this often
+DISK_RECOUNT_SECONDS = 60.0
+
+
+class EmbeddingCache:
+    """
+    Two-tier (memory LRU + on-disk SQLite) cache for embedding vectors.
+    """
+    def __init__(
+        self,
+        db_path: str,
+        memory_size: int = 10000,
+        max_disk_entries: int = 200000,
+    ):
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self.max_disk_entries = max_disk_entries
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> last_used not yet written, and when the first was recorded
+        self._touched: Dict[str, float] = {}
+        self._touched_since = 0.0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._recount()
+
+    @staticmethod
+    def make_key(text: str, model: str) -> str:
+        """
+        Build the cache key for a text embedded with a given model.
+        """
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Look up several keys at once.
+
+        Args:
+            keys: Cache keys (see make_key)
+
+        Returns:
+            Dictionary of key -> embedding for every key that was found
+        """
+        found: Dict[str, List[float]] = {}
+        disk_lookup: List[str] = []
+
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                if key in found:
+                    continue
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+                else:
+                    disk_lookup.append(key)
+
+            if disk_lookup:
+                # SQLite limits the number of bound parameters, so look up in slices
+                for i in range(0, len(disk_lookup), 500):
+                    part = disk_lookup[i:i + 500]
+                    placeholders = ",".join("?" for _ in part)
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        part,
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f", blob).tolist()
+                        found[key] = vector
+                        self._remember(key, vector)
+
+                for key in disk_lookup:
+                    if key in found:
+                        self.disk_hits += 1
+                    else:
+                        self.misses += 1
+
+            if found:
+                if not self._touched:
+                    self._touched_since = time.monotonic()
+                for key in found:
+                    self._touched[key] = now
+                if (
+                    len(self._touched) >= TOUCH_FLUSH_ENTRIES
+                    or time.monotonic() - self._touched_since >= TOUCH_FLUSH_SECONDS
+                ):
+                    self._flush_touched()
+                    self._conn.commit()
+
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """
+        Store several embeddings in both tiers, evicting the least recently
+        used disk entries once the size cap is exceeded.
+        """
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()],
+            )
+            self._disk_count += self._conn.total_changes - before
+
+            if self._disk_count > self.max_disk_entries or time.monotonic() - self._counted_at >= DISK_RECOUNT_SECONDS:
+                # The estimate misses other processes' inserts and evictions
+                self._recount()
+            if self._disk_count > self.max_disk_entries:
+                # Recent hits must count before choosing what to evict
+                self._flush_touched()
+                # Evict down to 90% of the cap so we don't evict on every insert
+                target = int(self.max_disk_entries * 0.9)
+                to_evict = self._disk_count - target
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (to_evict,),
+                )
+                self._disk_count -= to_evict
+                self.evictions += to_evict
+                logger.info(f"Embedding cache evicted {to_evict} least recently used entries")
+
+            self._conn.commit()
+
+    def _flush_touched(self):
+        """
+        Write the pending last_used times in one statement (caller must hold
+        the lock and commit).
+        """
+        if not self._touched:
+            return
+        # MAX: another process may have used the entry more recently
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = MAX(last_used, ?) WHERE key = ?",
+            [(last_used, key) for key, last_used in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _recount(self):
+        """
+        Count the disk entries of every process (caller must hold the lock,
+        or be __init__).
+        """
+        self._disk_count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._counted_at = time.monotonic()
+
+    def _remember(self, key: str, vector: List[float]):
+        """
+        Put a vector in the in-memory LRU (caller must hold the lock).
+        """
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """
+        Get hit/miss counters and current sizes.
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._disk_count,
+                "max_disk_entries": self.max_disk_entries,
+            }
+
+    def close(self):
+        """
+        Write the pending last_used times and close the SQLite connection.
+        """
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Get the process-wide embedding cache (created on first use).
+
+    Returns:
+        The shared EmbeddingCache, or None if caching is disabled
+    """
+    global _cache
+    if not settings.embedding_cache_enabled:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    db_path=os.path.join(settings.vector_db_dir, "embedding_cache.sqlite"),
+                    memory_size=settings.embedding_cache_memory_size,
+                    max_disk_entries=settings.embedding_cache_max_entries,
+                )
+    return _cache
+
+
+def close_embedding_cache():
+    """
+    Close the process-wide embedding cache (called on application shutdown).
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
@@ -0,0 +1,160 @@
+"""
+Embedding backends.
+
+EmbeddingService talks to an EmbeddingBackend instead of calling Gemini
+directly, so deployments can choose where embeddings are computed:
+
+    - GeminiEmbeddingBackend: Gemini embedding API (batched, rate-limited).
+    - LocalHashEmbeddingBackend: CPU-only, no network. Texts are turned into
+      signed feature-hashing vectors (word unigrams + character trigrams)
+      and a whole batch is built and normalized as one NumPy matrix, so the
+      cost per chunk is small and predictable. Retrieval quality is lexical
+      rather than semantic, which is the trade-off for fully offline use.
+
+Select one with settings.embedding_backend ("gemini" or "local"). Vectors
+from different backends have different dimensions, so switching backends
+needs a fresh collection (e.g. a new VECTOR_DB_DIR).
+"""
+import asyncio
+import re
+import zlib
+import logging
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interface for anything that turns texts into embedding vectors.
+    """
+    # Identifies the model; part of the embedding cache key
+    name: str = ""
+
+    @abstractmethod
+    def embed(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        Embed a batch of texts, keeping the input order.
+
+        Args:
+            texts: List of text strings to embed
+            batch_size: Optional hint for how many texts to send per call
+        """
+
+    async def embed_async(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        Async version of embed(). Runs embed() in a worker thread by default.
+        """
+        return await asyncio.to_thread(self.embed, texts, batch_size)
+
+    def is_available(self) -> bool:
+        """
+        Whether this backend can embed right now (e.g. an API key is set).
+        """
+        return True
+
+
+class GeminiEmbeddingBackend(EmbeddingBackend):
+    """
+    Embeddings from the Gemini API.
+    """
+    def __init__(self, gemini_client=None):
+        # Imported here so the local backend works without the Gemini SDK configured
+        from app.core.llm.gemini_client import GeminiClient
+
+        self.gemini_client = gemini_client or GeminiClient()
+        self.name = settings.gemini_embed_model
+
+    def embed(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        return self.gemini_client.embed(texts, batch_size=batch_size)
+
+    async def embed_async(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        return await self.gemini_client.embed_async(texts, batch_size=batch_size)
+
+    def is_available(self) -> bool:
+        return bool(settings.gemini_api_key)
+
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=200000)
+def _hash_feature(feature: str, dimension: int) -> Tuple[int, float]:
+    """
+    Map a feature to a (column, sign) pair. crc32 is stable across
+    processes, unlike Python's salted hash().
+    """
+    digest = zlib.crc32(feature.encode("utf-8"))
+    return digest % dimension, (1.0 if (digest >> 31) & 1 == 0 else -1.0)
+
+
+class LocalHashEmbeddingBackend(EmbeddingBackend):
+    """
+    CPU-only embeddings using signed feature hashing.
+    """
+    def __init__(self, dimension: int = 768):
+        self.dimension = dimension
+        self.name = f"local-hash-{dimension}"
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for word in _TOKEN_PATTERN.findall(text.lower()):
+            features.append(word)
+            padded = f"<{word}>"
+            features.extend(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def embed_matrix(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of texts into a (len(texts), dimension) float32 matrix.
+        """
+        rows: List[int] = []
+        columns: List[int] = []
+        signs: List[float] = []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                column, sign = _hash_feature(feature, self.dimension)
+                rows.append(row)
+                columns.append(column)
+                signs.append(sign)
+
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if rows:
+            # One scatter-add for the whole batch
+            np.add.at(matrix, (np.asarray(rows), np.asarray(columns)), np.asarray(signs, dtype=np.float32))
+
+        # Sublinear term frequency, then L2-normalize every row at once
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def embed(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.embed_matrix(texts).tolist()
+
+
+def create_embedding_backend(name: Optional[str] = None, gemini_client=None) -> EmbeddingBackend:
+    """
+    Build the embedding backend selected in settings (or by name).
+
+    Args:
+        name: "gemini" or "local" (default: settings.embedding_backend)
+        gemini_client: Optional shared GeminiClient for the Gemini backend
+
+    Returns:
+        An EmbeddingBackend instance
+    """
+    name = (name or settings.embedding_backend).lower()
+    if name == "local":
+        return LocalHashEmbeddingBackend(dimension=settings.local_embedding_dim)
+    if name == "gemini":
+        return GeminiEmbeddingBackend(gemini_client=gemini_client)
+    raise ValueError(f"Unknown embedding backend: {name}")
@@ -0,0 +1,115 @@
+"""
+Metadata filters for scoped queries.
+
+Filters use Chroma's where syntax, so they are pushed down unchanged to
+ChromaVectorStore and evaluated with matches_where() by the NumPy store.
+Chunk metadata carries file_name, file_type (extension without the dot)
+and ingested_at (Unix time) for this.
+"""
+import json
+import operator
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Set, Union
+
+Timestamp = Union[datetime, float, int]
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$in": lambda value, options: value in options,
+    "$nin": lambda value, options: value not in options,
+}
+
+
+def matches_where(metadata: Optional[Dict], where: Dict) -> bool:
+    """
+    Evaluate a Chroma-style metadata filter ({"field": value},
+    {"field": {"$gte": value}}, {"$and": [...]}, {"$or": [...]}).
+    """
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, argument in condition.items():
+                if op not in _OPERATORS:
+                    raise ValueError(f"Unsupported where operator: {op}")
+                if value is None and op not in ("$ne", "$nin"):
+                    return False
+                try:
+                    if not _OPERATORS[op](value, argument):
+                        return False
+                except TypeError:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def where_fields(where: Dict) -> Set[str]:
+    """
+    Metadata fields a filter refers to.
+    """
+    fields: Set[str] = set()
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            for part in condition:
+                fields |= where_fields(part)
+        else:
+            fields.add(key)
+    return fields
+
+
+def build_where_filter(
+    file_name: Optional[str] = None,
+    file_type: Optional[str] = None,
+    ingested_after: Optional[Timestamp] = None,
+    ingested_before: Optional[Timestamp] = None,
+) -> Optional[Dict]:
+    """
+    Build a where filter from query scoping options.
+
+    Args:
+        file_name: Only chunks of this file
+        file_type: Only chunks of this file type ("pdf", ".docx", ...)
+        ingested_after: Only chunks ingested at or after this time
+        ingested_before: Only chunks ingested at or before this time
+
+    Returns:
+        A where filter, or None if no option is set
+    """
+    conditions = []
+    if file_name:
+        conditions.append({"file_name": file_name})
+    if file_type:
+        conditions.append({"file_type": file_type.lower().lstrip(".")})
+    if ingested_after is not None:
+        conditions.append({"ingested_at": {"$gte": _to_timestamp(ingested_after)}})
+    if ingested_before is not None:
+        conditions.append({"ingested_at": {"$lte": _to_timestamp(ingested_before)}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def filter_key(where: Optional[Dict]) -> str:
+    """
+    Stable string form of a filter, for cache keys.
+    """
+    return json.dumps(where, sort_keys=True) if where else ""
+
+
+def _to_timestamp(value: Timestamp) -> float:
+    return value.timestamp() if isinstance(value, datetime) else float(value)
@@ -0,0 +1,267 @@
+"""
+Column-oriented chunk metadata for fast where filters.
+
+Evaluating a where filter with matches_where() is a Python call per row.
+MetadataColumns keeps every scalar metadata field of numbered rows as a
+NumPy array instead, so a filter is a few vectorized comparisons:
+
+    - string and boolean fields are dictionary-encoded: int32 codes into a
+      table of distinct values, -1 where the field is missing
+    - numeric fields are float64, NaN where the field is missing
+
+Fields whose values mix kinds (or aren't scalars), and conditions the
+arrays can't answer exactly like matches_where() (e.g. $gt on strings),
+fall back to a row-by-row callback. Appends go through GrowableArray, so
+adding rows costs O(rows added), not O(rows stored).
+"""
+from numbers import Number
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+_OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+_COMPARISONS = {
+    "$eq": np.equal,
+    "$ne": np.not_equal,
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+class GrowableArray:
+    """
+    NumPy array with amortized O(1) appends: rows go into spare capacity,
+    which doubles when full, instead of concatenating the whole array.
+    """
+    def __init__(self, dtype, width: Optional[int] = None, fill: Any = 0, size: int = 0):
+        self._dtype = np.dtype(dtype)
+        self._width = width
+        self._fill = fill
+        self._data = self._allocate(max(size, 16))
+        self.size = size
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        The rows, as a view (valid until the next append).
+        """
+        return self._data[:self.size]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, rows: np.ndarray):
+        rows = np.asarray(rows, dtype=self._dtype)
+        end = self.size + len(rows)
+        self._reserve(end)
+        self._data[self.size:end] = rows
+        self.size = end
+
+    def append_fill(self, count: int):
+        """
+        Append count rows of the fill value.
+        """
+        end = self.size + count
+        self._reserve(end)
+        self._data[self.size:end] = self._fill
+        self.size = end
+
+    def replace(self, rows: np.ndarray):
+        """
+        Replace all rows.
+        """
+        self.size = 0
+        self.append(rows)
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        shape = (capacity,) if self._width is None else (capacity, self._width)
+        return np.full(shape, self._fill, dtype=self._dtype)
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self._data):
+            return
+        data = self._allocate(max(capacity, 2 * len(self._data)))
+        data[:self.size] = self._data[:self.size]
+        self._data = data
+
+
+class MetadataColumns:
+    """
+    Scalar metadata fields of numbered rows, as arrays.
+    """
+    def __init__(self):
+        self.size = 0
+        self._categories: Dict[str, Dict[Any, int]] = {}
+        self._codes: Dict[str, GrowableArray] = {}
+        self._numbers: Dict[str, GrowableArray] = {}
+        # Fields only evaluated row by row
+        self._mixed: Set[str] = set()
+
+    def append(self, metadatas: List[Optional[Dict]]):
+        """
+        Add rows (numbered after the existing ones).
+        """
+        count = len(metadatas)
+        fields: Dict[str, List[Any]] = {}
+        for row, metadata in enumerate(metadatas):
+            for field, value in (metadata or {}).items():
+                if value is not None:
+                    fields.setdefault(field, [None] * count)[row] = value
+
+        for field, values in fields.items():
+            if field in self._mixed:
+                continue
+            kind = _kind(values)
+            if kind is None or (field in self._codes and kind != "category") or (field in self._numbers and kind != "number"):
+                self._drop(field)
+            elif kind == "number":
+                column = self._numbers.get(field)
+                if column is None:
+                    column = self._numbers[field] = GrowableArray(np.float64, fill=np.nan, size=self.size)
+                column.append([np.nan if value is None else float(value) for value in values])
+            else:
+                categories = self._categories.setdefault(field, {})
+                column = self._codes.get(field)
+                if column is None:
+                    column = self._codes[field] = GrowableArray(np.int32, fill=-1, size=self.size)
+                column.append([-1 if value is None else categories.setdefault(value, len(categories)) for value in values])
+
+        # Fields missing from this batch
+        for field, column in list(self._codes.items()) + list(self._numbers.items()):
+            if field not in fields:
+                column.append_fill(count)
+        self.size += count
+
+    def update(self, rows: List[int], metadatas: List[Optional[Dict]]):
+        """
+        Replace the metadata of existing rows.
+        """
+        positions = np.asarray(rows, dtype=np.int64)
+        fields = set(self._codes) | set(self._numbers)
+        for metadata in metadatas:
+            fields.update((metadata or {}).keys())
+
+        for field in fields - self._mixed:
+            values = [(metadata or {}).get(field) for metadata in metadatas]
+            kind = _kind(values)
+            present = any(value is not None for value in values)
+            if present and (kind is None or (field in self._codes and kind != "category") or (field in self._numbers and kind != "number")):
+                self._drop(field)
+            elif field in self._numbers or kind == "number":
+                column = self._numbers.get(field)
+                if column is None:
+                    column = self._numbers[field] = GrowableArray(np.float64, fill=np.nan, size=self.size)
+                column.values[positions] = [np.nan if value is None else float(value) for value in values]
+            elif field in self._codes or kind == "category":
+                categories = self._categories.setdefault(field, {})
+                column = self._codes.get(field)
+                if column is None:
+                    column = self._codes[field] = GrowableArray(np.int32, fill=-1, size=self.size)
+                column.values[positions] = [
+                    -1 if value is None else categories.setdefault(value, len(categories)) for value in values
+                ]
+
+    def take(self, rows: np.ndarray):
+        """
+        Keep only the given rows, renumbered in order (e.g. after compaction).
+        """
+        for column in list(self._codes.values()) + list(self._numbers.values()):
+            column.replace(column.values[rows])
+        self.size = len(rows)
+
+    def mask(self, where: Dict, fallback: Callable[[Dict], np.ndarray]) -> np.ndarray:
+        """
+        Boolean mask of the rows matching a where filter, same semantics as
+        matches_where().
+
+        Args:
+            where: Chroma-style filter
+            fallback: Called with a single-condition filter the arrays can't
+                answer; must return its mask over all rows
+        """
+        result = np.ones(self.size, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for part in condition:
+                    result &= self.mask(part, fallback)
+            elif key == "$or":
+                matched = np.zeros(self.size, dtype=bool)
+                for part in condition:
+                    matched |= self.mask(part, fallback)
+                result &= matched
+            elif isinstance(condition, dict):
+                for op, argument in condition.items():
+                    if op not in _OPERATORS:
+                        raise ValueError(f"Unsupported where operator: {op}")
+                    mask = self._condition_mask(key, op, argument)
+                    result &= fallback({key: {op: argument}}) if mask is None else mask
+            else:
+                mask = None if condition is None else self._condition_mask(key, "$eq", condition)
+                result &= fallback({key: condition}) if mask is None else mask
+        return result
+
+    def _condition_mask(self, field: str, op: str, argument: Any) -> Optional[np.ndarray]:
+        """
+        Mask of one condition, or None if it must be evaluated row by row.
+        """
+        if field in self._mixed or argument is None:
+            return None
+        if op in ("$in", "$nin"):
+            if not isinstance(argument, (list, tuple, set)) or any(value is None for value in argument):
+                return None
+
+        numbers = self._numbers.get(field)
+        if numbers is not None:
+            options = argument if op in ("$in", "$nin") else [argument]
+            if not all(_is_number(value) for value in options):
+                return None
+            if op in ("$in", "$nin"):
+                found = np.isin(numbers.values, np.asarray(list(argument), dtype=np.float64))
+                return found if op == "$in" else ~found
+            # NaN (missing) compares False, except for $ne: as matches_where
+            return _COMPARISONS[op](numbers.values, float(argument))
+
+        codes = self._codes.get(field)
+        if op not in ("$eq", "$ne", "$in", "$nin"):
+            # Ordering of strings/booleans, or of a field no row has
+            return None if codes is not None else np.zeros(self.size, dtype=bool)
+        if codes is None:
+            # No row has the field: only negations match
+            return np.full(self.size, op in ("$ne", "$nin"), dtype=bool)
+        categories = self._categories[field]
+        options = argument if op in ("$in", "$nin") else [argument]
+        try:
+            wanted = [categories[value] for value in options if value in categories]
+        except TypeError:
+            return None
+        found = np.isin(codes.values, np.asarray(wanted, dtype=np.int32))
+        return found if op in ("$eq", "$in") else ~found
+
+    def _drop(self, field: str):
+        self._mixed.add(field)
+        self._codes.pop(field, None)
+        self._categories.pop(field, None)
+        self._numbers.pop(field, None)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def _kind(values: Iterable[Any]) -> Optional[str]:
+    """
+    "number", "category" (strings and booleans) or None (mixed/non-scalar).
+    """
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if _is_number(value):
+            kinds.add("number")
+        elif isinstance(value, (str, bool)):
+            kinds.add("category")
+        else:
+            return None
+    return kinds.pop() if len(kinds) == 1 else None
@@ -0,0 +1,145 @@
+"""
+Reranking and diversification of retrieved chunks.
+
+With 200-character chunk overlaps, the top results of a search are often
+neighbouring chunks that say the same thing. The rerank stage therefore
+runs on an over-fetched candidate list (settings.rerank_candidates):
+
+    1. Rescoring: every candidate is embedded on CPU with the feature-hashing
+       model (LocalHashEmbeddingBackend, no network) and its similarity to
+       the question is blended with the retrieval similarity.
+    2. Maximal marginal relevance (MMR): results are picked one at a time,
+       trading relevance against similarity to what was already picked.
+       Pairwise similarities come from one matrix product over the
+       candidate embedding matrix, and every selection step is a vector
+       operation over all remaining candidates.
+"""
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.core.rag.embeddings import LocalHashEmbeddingBackend
+
+logger = logging.getLogger(__name__)
+
+
+def maximal_marginal_relevance(
+    relevance: np.ndarray,
+    embeddings: np.ndarray,
+    top_k: int,
+    mmr_lambda: float = 0.7,
+) -> List[int]:
+    """
+    Select diverse, relevant candidates with MMR.
+
+    Args:
+        relevance: Relevance score of every candidate, shape (n,)
+        embeddings: L2-normalized candidate embeddings, shape (n, dim)
+        top_k: Number of candidates to select
+        mmr_lambda: 1.0 ranks by relevance only, 0.0 by diversity only
+
+    Returns:
+        Indices of the selected candidates, in selection order
+    """
+    count = len(relevance)
+    top_k = min(top_k, count)
+    if top_k <= 0:
+        return []
+
+    similarity = embeddings @ embeddings.T
+    # Highest similarity of each candidate to anything selected so far
+    max_similarity = np.full(count, -np.inf, dtype=np.float32)
+    available = np.ones(count, dtype=bool)
+    selected: List[int] = []
+
+    for _ in range(top_k):
+        if selected:
+            scores = mmr_lambda * relevance - (1.0 - mmr_lambda) * max_similarity
+        else:
+            scores = relevance.astype(np.float32, copy=True)
+        scores = np.where(available, scores, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[:, best], out=max_similarity)
+
+    return selected
+
+
+class Reranker:
+    """
+    Rescores candidate chunks locally and diversifies them with MMR.
+    """
+    def __init__(self, candidates: int = 20, dense_weight: float = 0.5, mmr_lambda: float = 0.7, dimension: int = 768):
+        self.candidates = candidates
+        self.dense_weight = dense_weight
+        self.mmr_lambda = mmr_lambda
+        self.local_model = LocalHashEmbeddingBackend(dimension=dimension)
+
+    def candidate_depth(self, n_results: int) -> int:
+        """
+        How many candidates to fetch for n_results final results.
+        """
+        return max(n_results, self.candidates)
+
+    def rerank_indices(self, question: str, candidates: List[Dict], top_k: int) -> List[int]:
+        """
+        Pick the best top_k candidates.
+
+        Args:
+            question: The user's question
+            candidates: Source dictionaries with "chunk" and "similarity_score"
+            top_k: Number of candidates to keep
+
+        Returns:
+            Indices into candidates, best first
+        """
+        if not candidates:
+            return []
+
+        matrix = self.local_model.embed_matrix([question] + [candidate["chunk"] for candidate in candidates])
+        question_vector, candidate_matrix = matrix[0], matrix[1:]
+
+        local_similarity = candidate_matrix @ question_vector
+        dense_similarity = np.clip(
+            np.asarray([candidate.get("similarity_score", 0.0) for candidate in candidates], dtype=np.float32),
+            0.0, 1.0,
+        )
+        relevance = self.dense_weight * dense_similarity + (1.0 - self.dense_weight) * local_similarity
+
+        return maximal_marginal_relevance(relevance, candidate_matrix, top_k, self.mmr_lambda)
+
+    def rerank(self, question: str, candidates: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Rerank candidate sources and keep the best top_k.
+        """
+        return [candidates[i] for i in self.rerank_indices(question, candidates, top_k)]
+
+
+_reranker: Optional[Reranker] = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Optional[Reranker]:
+    """
+    Get the process-wide reranker (created on first use).
+
+    Returns:
+        The shared Reranker, or None if reranking is disabled
+    """
+    global _reranker
+    if not settings.rerank_enabled:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker(
+                    candidates=settings.rerank_candidates,
+                    dense_weight=settings.rerank_dense_weight,
+                    mmr_lambda=settings.rerank_mmr_lambda,
+                    dimension=settings.local_embedding_dim,
+                )
+    return _reranker
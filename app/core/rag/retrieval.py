@@ -0,0 +1,798 @@
+"""
+Retrieval helpers shared by QueryService and the agents.
+
+Besides rank fusion this module holds the BM25 lexical index used for
+hybrid retrieval. Dense search misses exact matches on part numbers, error
+codes and names; BM25 finds them, and the two rankings are fused with RRF.
+
+Index layout (settings.vector_db_dir/bm25):
+    manifest.json        live segments, tombstones, next segment number,
+                         filter fields of every file
+    seg_000001/          one immutable segment per ingested batch
+        ids.json             chunk IDs, by local document number
+        files.json           file names of the segment's documents
+        doc_files.npy        int32 file of every document (into files.json)
+        vocab.json           term -> term number (terms sorted)
+        doc_lengths.npy      int32 tokens per document
+        offsets.npy          int64 start of each term's postings (+ end sentinel)
+        postings_docs.npy    int32 local document numbers
+        postings_tfs.npy     uint16 term frequencies
+
+Postings are flat NumPy arrays opened with mmap_mode="r", so a large index
+costs page cache rather than heap. Deletes only record tombstones (segment,
+document number) in the manifest.
+
+Merging is tiered: segments are grouped by size (tier t holds segments of
+merge_factor**t to merge_factor**(t+1) live documents), and once a tier has
+merge_factor segments they are merged into one segment of the next tier,
+dropping deleted documents. A document is thus rewritten about
+log_merge_factor(N) times in total instead of on every merge. Beyond
+settings.bm25_max_segments segments the smallest ones are merged as well.
+The merged segment is built without holding the index lock (searches and
+deletes go on) and swapped in atomically; tombstones added meanwhile are
+carried over.
+
+Where filters are evaluated inside the index. Filter fields are per file
+(FILTER_FIELDS: file_name, file_type, ingested_at), so the manifest keeps
+one entry per file and each document only its file number: a filter is
+matched against the files, then becomes a vectorized mask of the documents
+whose file matched. Re-ingesting a file updates its entry, which covers
+chunks that were reused rather than re-indexed. Segments written before
+files were recorded can't be filtered until tag_legacy_segments() has
+rewritten them with their documents' files (done once at startup); merges
+keep such segments untagged rather than guessing.
+
+The manifest is replaced atomically and other processes reload it when its
+mtime changes. Writes are expected from one process at a time (the API
+worker doing the ingestion).
+"""
+import os
+import re
+import json
+import math
+import shutil
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.core.rag.filters import matches_where, where_fields
+
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several ranked ID lists with reciprocal-rank fusion (RRF).
+
+    Each list contributes 1 / (k + rank) for every ID it contains (rank
+    starts at 1). IDs found by several lists therefore rise to the top,
+    without having to compare raw scores from different queries.
+
+    Args:
+        rankings: Ranked lists of IDs, best first
+        k: Damping constant (60 is the value from the original paper)
+
+    Returns:
+        (id, fused score) pairs, best first, without duplicates
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+# Words, plus compounds like "ab-1234" or "v2.1.0" kept as one token
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-.]\w+)*")
+_COMPOUND_SEPARATORS = re.compile(r"[-._]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens for BM25. Compound tokens (part numbers, error
+    codes, versions) are indexed whole and also as their parts, so both
+    "ERR-4012" and "4012" match.
+    """
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = [part for part in _COMPOUND_SEPARATORS.split(token) if part]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+# Chunk metadata the index can filter on; all of it is per file
+FILTER_FIELDS = ("file_name", "file_type", "ingested_at")
+
+
+def _load_array(path: str) -> np.ndarray:
+    """
+    Memory-map a .npy file (empty arrays can't be mapped, so load those).
+    """
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        return np.load(path)
+
+
+class _Segment:
+    """
+    One immutable, memory-mapped index segment.
+    """
+    def __init__(self, path: str):
+        self.name = os.path.basename(path)
+        self.path = path
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as file:
+            self.chunk_ids: List[str] = json.load(file)
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as file:
+            self.vocabulary: Dict[str, int] = json.load(file)
+        self.doc_lengths = _load_array(os.path.join(path, "doc_lengths.npy"))
+        self.offsets = _load_array(os.path.join(path, "offsets.npy"))
+        self.postings_docs = _load_array(os.path.join(path, "postings_docs.npy"))
+        self.postings_tfs = _load_array(os.path.join(path, "postings_tfs.npy"))
+        self.deleted = np.zeros(len(self.chunk_ids), dtype=bool)
+        # Segments written before files were recorded can't be filtered
+        self.files: Optional[List[str]] = None
+        self.doc_files: Optional[np.ndarray] = None
+        files_path = os.path.join(path, "files.json")
+        if os.path.exists(files_path):
+            with open(files_path, "r", encoding="utf-8") as file:
+                self.files = json.load(file)
+            self.doc_files = np.load(os.path.join(path, "doc_files.npy"))
+
+    def file_mask(self, file_names: Iterable[str]) -> np.ndarray:
+        """
+        Mask of the documents belonging to any of the given files.
+        """
+        wanted = set(file_names)
+        numbers = [number for number, name in enumerate(self.files) if name in wanted]
+        return np.isin(self.doc_files, np.asarray(numbers, dtype=np.int32))
+
+    @property
+    def live_count(self) -> int:
+        return len(self.chunk_ids) - int(self.deleted.sum())
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Get (document numbers, term frequencies) of a term's live postings.
+        """
+        term_number = self.vocabulary.get(term)
+        if term_number is None:
+            return None
+        start, end = int(self.offsets[term_number]), int(self.offsets[term_number + 1])
+        docs = np.asarray(self.postings_docs[start:end])
+        tfs = np.asarray(self.postings_tfs[start:end])
+        live = ~self.deleted[docs]
+        if not live.all():
+            docs, tfs = docs[live], tfs[live]
+        return docs, tfs
+
+    @staticmethod
+    def write(
+        path: str,
+        chunk_ids: List[str],
+        doc_lengths: np.ndarray,
+        postings: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        file_names: Optional[List[str]],
+    ):
+        """
+        Write a segment directory (to a temp dir first, then rename).
+
+        Args:
+            path: Segment directory to create
+            chunk_ids: Chunk ID of every local document number
+            doc_lengths: Tokens per document
+            postings: term -> (document numbers, term frequencies)
+            file_names: File of every document ("" if unknown), or None
+                for a segment whose files aren't known (can't be filtered)
+        """
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term][0])
+
+        if terms:
+            postings_docs = np.concatenate([postings[term][0] for term in terms]).astype(np.int32)
+            postings_tfs = np.concatenate([postings[term][1] for term in terms]).astype(np.uint16)
+        else:
+            postings_docs = np.zeros(0, dtype=np.int32)
+            postings_tfs = np.zeros(0, dtype=np.uint16)
+
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, "ids.json"), "w", encoding="utf-8") as file:
+            json.dump(chunk_ids, file)
+        with open(os.path.join(tmp_path, "vocab.json"), "w", encoding="utf-8") as file:
+            json.dump({term: i for i, term in enumerate(terms)}, file)
+        if file_names is not None:
+            file_numbers: Dict[str, int] = {}
+            doc_files = np.asarray([file_numbers.setdefault(name, len(file_numbers)) for name in file_names], dtype=np.int32)
+            with open(os.path.join(tmp_path, "files.json"), "w", encoding="utf-8") as file:
+                json.dump(list(file_numbers), file)
+            np.save(os.path.join(tmp_path, "doc_files.npy"), doc_files)
+        np.save(os.path.join(tmp_path, "doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.int32))
+        np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp_path, "postings_docs.npy"), postings_docs)
+        np.save(os.path.join(tmp_path, "postings_tfs.npy"), postings_tfs)
+        os.replace(tmp_path, path)
+
+
+class BM25Index:
+    """
+    Segmented, incrementally updated BM25 index over chunk texts.
+    """
+    def __init__(self, index_dir: str, k1: float = 1.5, b: float = 0.75, max_segments: int = 32, merge_factor: int = 4):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max(2, max_segments)
+        self.merge_factor = max(2, merge_factor)
+        self._lock = threading.RLock()
+        # Held while a merge is built, so merges don't pick the same segments
+        self._merge_lock = threading.Lock()
+
+        self._segments: List[_Segment] = []
+        self._locations: Dict[str, Tuple[_Segment, int]] = {}
+        # file_name -> filter fields of the file (FILTER_FIELDS besides file_name)
+        self._files: Dict[str, Dict] = {}
+        self._live_length = 0
+        self._next_segment = 1
+        self._manifest_mtime_ns: Optional[int] = None
+
+        os.makedirs(index_dir, exist_ok=True)
+        self._load()
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.index_dir, "manifest.json")
+
+    def add_documents(self, chunk_ids: List[str], texts: List[str], metadatas: Optional[List[Dict]] = None):
+        """
+        Index a batch of chunks as a new segment. Chunks that were indexed
+        before under the same ID are replaced.
+
+        Args:
+            chunk_ids: Chunk IDs (as stored in the vector store)
+            texts: Chunk texts, same order as chunk_ids
+            metadatas: Chunk metadata, for the filter fields; the last
+                chunk of a file sets the file's fields
+        """
+        if not chunk_ids:
+            return
+        metadatas = metadatas or [{} for _ in chunk_ids]
+        file_names = [str((metadata or {}).get("file_name") or "") for metadata in metadatas]
+
+        doc_lengths = np.zeros(len(chunk_ids), dtype=np.int32)
+        term_docs: Dict[str, List[int]] = {}
+        term_tfs: Dict[str, List[int]] = {}
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                term_docs.setdefault(term, []).append(doc)
+                term_tfs.setdefault(term, []).append(min(tf, 65535))
+        postings = {
+            term: (np.asarray(term_docs[term], dtype=np.int32), np.asarray(term_tfs[term], dtype=np.uint16))
+            for term in term_docs
+        }
+
+        with self._lock:
+            self._maybe_reload()
+            for chunk_id in chunk_ids:
+                self._mark_deleted(chunk_id)
+
+            for file_name, metadata in zip(file_names, metadatas):
+                if file_name:
+                    self._files[file_name] = _file_fields(metadata)
+
+            path = os.path.join(self.index_dir, f"seg_{self._next_segment:06d}")
+            self._next_segment += 1
+            _Segment.write(path, list(chunk_ids), doc_lengths, postings, file_names)
+            self._open_segment(path)
+            self._write_manifest()
+
+        self._merge_segments()
+
+    def update_file(self, file_name: str, metadata: Dict):
+        """
+        Set the filter fields of a file's chunks (e.g. its new ingested_at
+        after a re-ingest that reused chunks).
+        """
+        with self._lock:
+            self._maybe_reload()
+            self._files[file_name] = _file_fields(metadata)
+            self._write_manifest()
+
+    def can_filter(self, where: Optional[Dict]) -> bool:
+        """
+        Whether search() can evaluate a where filter: it only uses
+        FILTER_FIELDS and every segment records its documents' files.
+        """
+        if where is None:
+            return True
+        if not where_fields(where) <= set(FILTER_FIELDS):
+            return False
+        with self._lock:
+            self._maybe_reload()
+            return all(segment.files is not None for segment in self._segments)
+
+    def has_legacy_segments(self) -> bool:
+        """
+        Whether some segments don't record their documents' files (written
+        before files were recorded), so where filters can't be evaluated.
+        """
+        with self._lock:
+            self._maybe_reload()
+            return any(segment.files is None for segment in self._segments)
+
+    def tag_legacy_segments(self, chunks: Iterable[Tuple[str, Dict]]) -> Dict:
+        """
+        Rewrite the segments that don't record their documents' files into
+        one segment that does, so every where filter on FILTER_FIELDS is
+        evaluated by the index.
+
+        Args:
+            chunks: (chunk_id, metadata) of the stored chunks; only those in
+                untagged segments are kept
+
+        Returns:
+            Dictionary with the number of segments and chunks tagged
+        """
+        with self._lock:
+            self._maybe_reload()
+            legacy = [segment for segment in self._segments if segment.files is None]
+            wanted = {
+                chunk_id
+                for segment in legacy
+                for chunk_id, deleted in zip(segment.chunk_ids, segment.deleted)
+                if not deleted
+            }
+        if not legacy:
+            return {"segments": 0, "chunks": 0}
+
+        file_by_chunk: Dict[str, str] = {}
+        fields_by_file: Dict[str, Dict] = {}
+        for chunk_id, metadata in chunks:
+            if chunk_id in wanted and (metadata or {}).get("file_name"):
+                file_by_chunk[chunk_id] = str(metadata["file_name"])
+                fields_by_file[file_by_chunk[chunk_id]] = _file_fields(metadata)
+
+        with self._merge_lock:
+            with self._lock:
+                for file_name, fields in fields_by_file.items():
+                    # Files indexed since keep their newer fields
+                    self._files.setdefault(file_name, fields)
+            if not self._merge(legacy, file_by_chunk):
+                return {"segments": 0, "chunks": 0}
+        logger.info(f"Tagged {len(legacy)} BM25 segments with the files of {len(file_by_chunk)} of their {len(wanted)} chunks")
+        return {"segments": len(legacy), "chunks": len(file_by_chunk)}
+
+    def delete_documents(self, chunk_ids: List[str]) -> int:
+        """
+        Tombstone chunks so they stop matching.
+
+        Returns:
+            Number of chunks that were in the index
+        """
+        with self._lock:
+            self._maybe_reload()
+            deleted = sum(1 for chunk_id in chunk_ids if self._mark_deleted(chunk_id))
+            if deleted:
+                self._write_manifest()
+        return deleted
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        allowed_ids: Optional[Iterable[str]] = None,
+        where: Optional[Dict] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        Rank chunks against a query with BM25.
+
+        Args:
+            query: Query text
+            top_k: Number of results
+            allowed_ids: Only score these chunks (e.g. a file's chunks from
+                the document registry)
+            where: Only score chunks matching this filter (see can_filter());
+                term statistics still cover the whole index
+
+        Returns:
+            (chunk_id, score) pairs, best first
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            self._maybe_reload()
+            segments = list(self._segments)
+            live_docs = len(self._locations)
+            live_length = self._live_length
+            allowed = None
+            if allowed_ids is not None:
+                # Per-segment masks of the documents that may be scored
+                allowed = {segment.name: np.zeros(len(segment.chunk_ids), dtype=bool) for segment in segments}
+                for chunk_id in allowed_ids:
+                    location = self._locations.get(chunk_id)
+                    if location is not None:
+                        allowed[location[0].name][location[1]] = True
+            if where is not None:
+                matching_files = [
+                    file_name for file_name, fields in self._files.items()
+                    if matches_where({"file_name": file_name, **fields}, where)
+                ]
+                if not matching_files:
+                    return []
+                file_masks = {segment.name: segment.file_mask(matching_files) for segment in segments}
+                allowed = file_masks if allowed is None else {
+                    name: mask & file_masks[name] for name, mask in allowed.items()
+                }
+        if not terms or live_docs == 0:
+            return []
+
+        avg_length = max(live_length / live_docs, 1.0)
+        scores: Dict[str, np.ndarray] = {}
+        for term in terms:
+            hits = []
+            for segment in segments:
+                found = segment.postings(term)
+                if found is not None and found[0].size:
+                    hits.append((segment, found[0], found[1]))
+            df = sum(docs.size for _, docs, _ in hits)
+            if df == 0:
+                continue
+
+            idf = math.log(1.0 + (live_docs - df + 0.5) / (df + 0.5))
+            for segment, docs, tfs in hits:
+                if allowed is not None:
+                    keep = allowed[segment.name][docs]
+                    if not keep.any():
+                        continue
+                    docs, tfs = docs[keep], tfs[keep]
+                tfs = tfs.astype(np.float32)
+                lengths = np.asarray(segment.doc_lengths[docs], dtype=np.float32)
+                norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+                segment_scores = scores.setdefault(segment.name, np.zeros(len(segment.chunk_ids), dtype=np.float32))
+                # A term appears once per document in its postings, so += is safe
+                segment_scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        results: List[Tuple[str, float]] = []
+        for segment in segments:
+            segment_scores = scores.get(segment.name)
+            if segment_scores is None:
+                continue
+            candidates = np.flatnonzero(segment_scores)
+            if candidates.size > top_k:
+                best = np.argpartition(segment_scores[candidates], -top_k)[-top_k:]
+                candidates = candidates[best]
+            results.extend((segment.chunk_ids[doc], float(segment_scores[doc])) for doc in candidates)
+
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:top_k]
+
+    def rebuild(self, chunks: Iterable[Tuple[str, str, Dict]], batch_size: int = 5000) -> Dict:
+        """
+        Replace the index with the given chunks.
+
+        Args:
+            chunks: (chunk_id, text, metadata) for every chunk in the collection
+
+        Returns:
+            Dictionary with the number of chunks indexed
+        """
+        with self._lock:
+            for segment in self._segments:
+                shutil.rmtree(segment.path, ignore_errors=True)
+            self._segments = []
+            self._locations = {}
+            self._files = {}
+            self._live_length = 0
+            self._write_manifest()
+
+            indexed = 0
+            batch_ids: List[str] = []
+            batch_texts: List[str] = []
+            batch_metadatas: List[Dict] = []
+            for chunk_id, text, metadata in chunks:
+                batch_ids.append(chunk_id)
+                batch_texts.append(text or "")
+                batch_metadatas.append(metadata or {})
+                if len(batch_ids) >= batch_size:
+                    self.add_documents(batch_ids, batch_texts, batch_metadatas)
+                    indexed += len(batch_ids)
+                    batch_ids, batch_texts, batch_metadatas = [], [], []
+            if batch_ids:
+                self.add_documents(batch_ids, batch_texts, batch_metadatas)
+                indexed += len(batch_ids)
+
+            if len(self._segments) > 1:
+                self._merge(list(self._segments))
+
+        logger.info(f"Rebuilt BM25 index: {indexed} chunks")
+        return {"chunks": indexed}
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            self._maybe_reload()
+            return not self._locations
+
+    def stats(self) -> Dict:
+        """
+        Get segment and document counts.
+        """
+        with self._lock:
+            self._maybe_reload()
+            return {
+                "segments": len(self._segments),
+                "documents": len(self._locations),
+                "deleted_documents": sum(int(segment.deleted.sum()) for segment in self._segments),
+            }
+
+    def close(self):
+        """
+        Drop the memory-mapped segments.
+        """
+        with self._lock:
+            self._segments = []
+            self._locations = {}
+            self._files = {}
+            self._live_length = 0
+
+    def _open_segment(self, path: str) -> _Segment:
+        """
+        Open a segment and point its chunk IDs at it (caller must hold the lock).
+        """
+        segment = _Segment(path)
+        self._segments.append(segment)
+        for doc, chunk_id in enumerate(segment.chunk_ids):
+            self._locations[chunk_id] = (segment, doc)
+        self._live_length += int(np.asarray(segment.doc_lengths).sum())
+        return segment
+
+    def _mark_deleted(self, chunk_id: str) -> bool:
+        """
+        Tombstone a chunk's current location (caller must hold the lock).
+        """
+        location = self._locations.pop(chunk_id, None)
+        if location is None:
+            return False
+        segment, doc = location
+        segment.deleted[doc] = True
+        self._live_length -= int(segment.doc_lengths[doc])
+        return True
+
+    def _merge_segments(self):
+        """
+        Run the merges the tiered policy asks for. Called after each write,
+        without the lock held; returns at once if another merge is running.
+        """
+        if not self._merge_lock.acquire(blocking=False):
+            return
+        try:
+            while True:
+                with self._lock:
+                    candidates = self._pick_merge()
+                if not candidates or not self._merge(candidates):
+                    return
+        finally:
+            self._merge_lock.release()
+
+    def _pick_merge(self) -> List[_Segment]:
+        """
+        Choose segments to merge (caller must hold the lock): the lowest tier
+        holding merge_factor segments, else the smallest segments once there
+        are more than max_segments, else nothing.
+        """
+        tiers: Dict[int, List[_Segment]] = {}
+        for segment in self._segments:
+            tier = int(math.log(max(segment.live_count, 1), self.merge_factor))
+            tiers.setdefault(tier, []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tiers[tier][:self.merge_factor]
+        if len(self._segments) > self.max_segments:
+            smallest = sorted(self._segments, key=lambda segment: segment.live_count)
+            return smallest[:len(self._segments) - self.max_segments + 1]
+        return []
+
+    def _merge(self, candidates: List[_Segment], file_by_chunk: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Merge segments into one without their deleted documents. The new
+        segment is written without holding the lock, then swapped in.
+
+        Args:
+            candidates: Segments to merge
+            file_by_chunk: Files of the documents of untagged segments. If
+                None and a candidate is untagged, the merged segment is
+                untagged too
+
+        Returns:
+            False if the index was reloaded meanwhile and the merge dropped
+        """
+        with self._lock:
+            path = os.path.join(self.index_dir, f"seg_{self._next_segment:06d}")
+            self._next_segment += 1
+            # Tombstones as of now; later deletes are carried over on swap
+            snapshot = [segment.deleted.copy() for segment in candidates]
+
+        chunk_ids: List[str] = []
+        tagged = file_by_chunk is not None or all(segment.files is not None for segment in candidates)
+        file_names: List[str] = []
+        lengths: List[np.ndarray] = []
+        merged: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {}
+        mappings: List[np.ndarray] = []
+        for segment, deleted in zip(candidates, snapshot):
+            live = ~deleted
+            # Old document number -> new document number (-1 if deleted)
+            mapping = np.full(len(segment.chunk_ids), -1, dtype=np.int64)
+            mapping[live] = np.arange(len(chunk_ids), len(chunk_ids) + int(live.sum()))
+            mappings.append(mapping)
+            chunk_ids.extend(chunk_id for chunk_id, keep in zip(segment.chunk_ids, live) if keep)
+            if segment.files is None:
+                file_names.extend(
+                    (file_by_chunk or {}).get(chunk_id, "") for chunk_id, keep in zip(segment.chunk_ids, live) if keep
+                )
+            else:
+                file_names.extend(segment.files[number] for number in segment.doc_files[live])
+            lengths.append(np.asarray(segment.doc_lengths)[live])
+
+            for term, term_number in segment.vocabulary.items():
+                start, end = int(segment.offsets[term_number]), int(segment.offsets[term_number + 1])
+                docs = mapping[np.asarray(segment.postings_docs[start:end])]
+                keep = docs >= 0
+                if keep.any():
+                    merged.setdefault(term, []).append((docs[keep], np.asarray(segment.postings_tfs[start:end])[keep]))
+
+        if chunk_ids:
+            postings = {
+                term: (np.concatenate([docs for docs, _ in parts]), np.concatenate([tfs for _, tfs in parts]))
+                for term, parts in merged.items()
+            }
+            _Segment.write(path, chunk_ids, np.concatenate(lengths), postings, file_names if tagged else None)
+
+        with self._lock:
+            self._maybe_reload()
+            if any(segment not in self._segments for segment in candidates):
+                shutil.rmtree(path, ignore_errors=True)
+                logger.warning("BM25 index changed during a merge, merge dropped")
+                return False
+
+            position = self._segments.index(candidates[0])
+            self._segments = [segment for segment in self._segments if segment not in candidates]
+            if chunk_ids:
+                new_segment = _Segment(path)
+                for segment, mapping in zip(candidates, mappings):
+                    # Documents deleted or re-indexed while the merge was built
+                    new_docs = mapping[segment.deleted & (mapping >= 0)]
+                    new_segment.deleted[new_docs] = True
+                    for doc in np.flatnonzero(~segment.deleted):
+                        self._locations[segment.chunk_ids[doc]] = (new_segment, int(mapping[doc]))
+                self._segments.insert(position, new_segment)
+            self._write_manifest()
+
+        # Readers that still map the old files keep working until they reload
+        for segment in candidates:
+            shutil.rmtree(segment.path, ignore_errors=True)
+        logger.info(f"Merged {len(candidates)} BM25 segments into one of {len(chunk_ids)} chunks, {len(self._segments)} segments left")
+        return True
+
+    def _write_manifest(self):
+        """
+        Atomically write segment list and tombstones (caller must hold the lock).
+        """
+        # Files without documents left (deleted, or re-ingested elsewhere) are dropped
+        indexed_files = set()
+        for segment in self._segments:
+            indexed_files.update(segment.files or [])
+        self._files = {file_name: fields for file_name, fields in self._files.items() if file_name in indexed_files}
+        manifest = {
+            "next_segment": self._next_segment,
+            "segments": [segment.name for segment in self._segments],
+            "tombstones": {
+                segment.name: np.flatnonzero(segment.deleted).tolist()
+                for segment in self._segments if segment.deleted.any()
+            },
+            "files": self._files,
+        }
+        tmp_path = f"{self._manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, self._manifest_path)
+        self._manifest_mtime_ns = os.stat(self._manifest_path).st_mtime_ns
+
+    def _maybe_reload(self):
+        """
+        Reload if another process changed the manifest (caller must hold the lock).
+        """
+        try:
+            mtime_ns = os.stat(self._manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns != self._manifest_mtime_ns:
+            self._load()
+
+    def _load(self):
+        """
+        Open the segments and tombstones listed in the manifest.
+        """
+        with self._lock:
+            self._segments = []
+            self._locations = {}
+            self._files = {}
+            self._live_length = 0
+            try:
+                with open(self._manifest_path, "r", encoding="utf-8") as file:
+                    manifest = json.load(file)
+                self._manifest_mtime_ns = os.stat(self._manifest_path).st_mtime_ns
+            except FileNotFoundError:
+                return
+
+            self._next_segment = manifest.get("next_segment", 1)
+            self._files = manifest.get("files", {})
+            tombstones = manifest.get("tombstones", {})
+            for name in manifest.get("segments", []):
+                segment = self._open_segment(os.path.join(self.index_dir, name))
+                for doc in tombstones.get(name, []):
+                    segment.deleted[doc] = True
+            # A chunk ID is live in one segment at most (re-indexed copies are
+            # tombstoned), whatever the segment order after merges
+            self._locations = {
+                segment.chunk_ids[doc]: (segment, int(doc))
+                for segment in self._segments
+                for doc in np.flatnonzero(~segment.deleted)
+            }
+            self._live_length = sum(
+                int(np.asarray(segment.doc_lengths)[~segment.deleted].sum()) for segment in self._segments
+            )
+
+
+def _file_fields(metadata: Optional[Dict]) -> Dict:
+    """
+    The per-file filter fields of a chunk's metadata (besides file_name).
+    """
+    metadata = metadata or {}
+    return {field: metadata[field] for field in FILTER_FIELDS[1:] if metadata.get(field) is not None}
+
+
+_index: Optional[BM25Index] = None
+_index_lock = threading.Lock()
+
+
+def get_bm25_index() -> Optional[BM25Index]:
+    """
+    Get the process-wide BM25 index (created on first use).
+
+    Returns:
+        The shared BM25Index, or None if hybrid retrieval is disabled
+    """
+    global _index
+    if not settings.bm25_enabled:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = BM25Index(
+                    index_dir=os.path.join(settings.vector_db_dir, "bm25"),
+                    k1=settings.bm25_k1,
+                    b=settings.bm25_b,
+                    max_segments=settings.bm25_max_segments,
+                    merge_factor=settings.bm25_merge_factor,
+                )
+    return _index
+
+
+def close_bm25_index():
+    """
+    Close the process-wide BM25 index (called on application shutdown).
+    """
+    global _index
+    with _index_lock:
+        if _index is not None:
+            _index.close()
+            _index = None
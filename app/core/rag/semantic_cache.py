@@ -0,0 +1,266 @@
+"""
+Semantic answer cache.
+
+Users ask the same questions in slightly different words. Instead of
+searching and generating again, QueryService can reuse a stored answer
+when the new question's embedding is close enough (cosine similarity) to
+a cached question's embedding.
+
+Every entry is stamped with the corpus version it was answered against.
+The version is a counter in a small file next to the vector store that
+DocumentService / AdminService bump whenever documents are stored or
+deleted, so answers never outlive the documents they were built from
+(also across workers sharing the same vector_db_dir). Bumps take an
+exclusive lock on a file next to it (fcntl.flock), so concurrent bumps
+from several processes each count. Where fcntl is missing (Windows) only
+threads are serialized, and only one writer process is supported.
+"""
+import os
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_version_lock = threading.Lock()
+_version_cache = {"mtime_ns": None, "value": 0}
+
+
+def _corpus_version_path() -> str:
+    return os.path.join(settings.vector_db_dir, "corpus_version")
+
+
+@contextmanager
+def _corpus_version_lock() -> Iterator[None]:
+    """
+    Hold the lock for a read-increment-write of the corpus version, across
+    threads and (with fcntl) processes.
+    """
+    with _version_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(f"{_corpus_version_path()}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_corpus_version() -> int:
+    """
+    Get the current corpus version (0 if documents were never changed).
+    """
+    path = _corpus_version_path()
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+    with _version_lock:
+        if _version_cache["mtime_ns"] != mtime_ns:
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    _version_cache["value"] = int(file.read().strip() or 0)
+            except (OSError, ValueError):
+                _version_cache["value"] = 0
+            _version_cache["mtime_ns"] = mtime_ns
+        return _version_cache["value"]
+
+
+def bump_corpus_version() -> int:
+    """
+    Increment the corpus version, invalidating every cached answer.
+
+    Returns:
+        The new corpus version
+    """
+    os.makedirs(settings.vector_db_dir, exist_ok=True)
+    path = _corpus_version_path()
+    with _corpus_version_lock():
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                current = int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            current = 0
+        new_version = current + 1
+
+        # Write-then-rename so readers never see a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(str(new_version))
+        os.replace(tmp_path, path)
+
+    logger.info(f"Corpus version bumped to {new_version}")
+    return new_version
+
+
+class SemanticAnswerCache:
+    """
+    In-process cache of answers, looked up by question-embedding similarity.
+    """
+    def __init__(
+        self,
+        similarity_threshold: float = 0.95,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1000,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        # entry_id -> entry, least recently used first
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        # Stacked, normalized question embeddings for vectorized lookup
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, embedding: List[float], scope: str, corpus_version: int) -> Optional[Dict]:
+        """
+        Find a cached answer for a similar question.
+
+        Args:
+            embedding: Embedding of the new question
+            scope: Anything else the answer depends on (e.g. n_results);
+                   only entries with the same scope can match
+            corpus_version: Current corpus version
+
+        Returns:
+            Copy of the cached result dictionary, or None on a miss
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            self._purge(corpus_version)
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._rebuild_matrix()
+
+            if self._matrix.shape[1] != query.shape[0]:
+                # Embedding model changed; nothing here can match
+                self.misses += 1
+                return None
+
+            similarities = self._matrix @ query
+            for position in np.argsort(-similarities):
+                if similarities[position] < self.similarity_threshold:
+                    break
+                entry_id = self._matrix_ids[position]
+                entry = self._entries[entry_id]
+                if entry["scope"] == scope:
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    logger.info(f"Semantic cache hit (similarity {similarities[position]:.3f})")
+                    return copy.deepcopy(entry["result"])
+
+            self.misses += 1
+            return None
+
+    def store(self, embedding: List[float], scope: str, corpus_version: int, result: Dict):
+        """
+        Cache a result for a question, evicting the least recently used
+        entry when the cache is full.
+        """
+        with self._lock:
+            self._entries[self._next_id] = {
+                "embedding": self._normalize(embedding),
+                "scope": scope,
+                "corpus_version": corpus_version,
+                "created_at": time.monotonic(),
+                "result": copy.deepcopy(result),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def _purge(self, corpus_version: int):
+        """
+        Drop expired entries and entries from older corpus versions
+        (caller must hold the lock).
+        """
+        now = time.monotonic()
+        stale = [
+            entry_id
+            for entry_id, entry in self._entries.items()
+            if entry["corpus_version"] != corpus_version
+            or now - entry["created_at"] > self.ttl_seconds
+        ]
+        for entry_id in stale:
+            del self._entries[entry_id]
+        if stale:
+            self.invalidations += len(stale)
+            self._matrix = None
+
+    def _rebuild_matrix(self):
+        self._matrix_ids = list(self._entries.keys())
+        self._matrix = np.vstack([self._entries[entry_id]["embedding"] for entry_id in self._matrix_ids])
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def stats(self) -> Dict:
+        """
+        Get hit/miss counters and current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+_cache: Optional[SemanticAnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticAnswerCache]:
+    """
+    Get the process-wide semantic answer cache (created on first use).
+
+    Returns:
+        The shared SemanticAnswerCache, or None if it is disabled
+    """
+    global _cache
+    if not settings.semantic_cache_enabled:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticAnswerCache(
+                    similarity_threshold=settings.semantic_cache_similarity,
+                    ttl_seconds=settings.semantic_cache_ttl_seconds,
+                    max_entries=settings.semantic_cache_max_entries,
+                )
+    return _cache
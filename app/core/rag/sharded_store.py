@@ -0,0 +1,242 @@
+"""
+Sharded vector store.
+
+Spreads one logical collection over settings.vector_store_shards physical
+collections ("<collection>_shard_<i>"), each an independent ChromaVectorStore
+or NumpyVectorStore, so ingestion and search on one shard don't contend
+with the others:
+
+    - Routing is per file: a chunk goes to the shard owning the hash of its
+      settings.vector_store_shard_key value, one of SHARD_KEYS ("file_name"
+      by default, or "file_type"). Both are written by DocumentService and
+      are the same for every chunk of a file, so a file's chunks always
+      live together and re-ingesting a file hits the shard holding its
+      previous chunks. The 32-bit hash space is split into equal ranges,
+      one per shard.
+    - Writes are grouped by shard and written to the shards in parallel.
+    - Queries fan out concurrently and the per-shard top-k lists are merged
+      by distance. A where filter that pins the shard key (equality or $in,
+      possibly inside $and) only touches the shards owning those values.
+
+Changing the shard count or key does not move existing chunks; re-ingest
+(or rebuild from the old collection) after changing either.
+"""
+import hashlib
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Set, TypeVar
+
+from app.core.rag.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Chunk metadata fields that can route chunks: written by DocumentService
+# for every chunk, with one value per file
+SHARD_KEYS = ("file_name", "file_type")
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    Routes chunks to several vector stores by a metadata key.
+    """
+    def __init__(self, shards: List[VectorStore], shard_key: str = "file_name"):
+        if not shards:
+            raise ValueError("ShardedVectorStore needs at least one shard")
+        if shard_key not in SHARD_KEYS:
+            raise ValueError(f"Unsupported shard key {shard_key!r}: ingestion only writes {', '.join(SHARD_KEYS)}")
+        self.shards = shards
+        self.shard_key = shard_key
+        self._executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="vector-shard")
+
+    def shard_for(self, value) -> int:
+        """
+        Shard owning a shard-key value (hash range partitioning).
+        """
+        digest = hashlib.sha1(str("" if value is None else value).encode("utf-8")).digest()
+        return (int.from_bytes(digest[:4], "big") * len(self.shards)) >> 32
+
+    def add_documents(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict]] = None,
+        embeddings: Optional[List[List[float]]] = None,
+    ):
+        """
+        Add documents, written to their shards in parallel.
+        """
+        groups: Dict[int, List[int]] = {}
+        for i in range(len(ids)):
+            metadata = metadatas[i] if metadatas else None
+            groups.setdefault(self.shard_for((metadata or {}).get(self.shard_key)), []).append(i)
+
+        def write(shard: int) -> None:
+            rows = groups[shard]
+            self.shards[shard].add_documents(
+                ids=[ids[i] for i in rows],
+                documents=[documents[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows] if metadatas else None,
+                embeddings=[embeddings[i] for i in rows] if embeddings is not None else None,
+            )
+
+        self._fan_out(sorted(groups), write)
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        """
+        Replace the metadata of stored chunks, in the shards their shard key
+        routes to (the key is per file, so it doesn't change).
+        """
+        groups: Dict[int, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(self.shard_for((metadata or {}).get(self.shard_key)), []).append(i)
+        self._fan_out(
+            sorted(groups),
+            lambda shard: self.shards[shard].update_metadata(
+                [ids[i] for i in groups[shard]], [metadatas[i] for i in groups[shard]]
+            ),
+        )
+
+    def query(
+        self,
+        query_texts: List[str],
+        n_results: int = 5,
+        where: Optional[Dict] = None,
+        embeddings: Optional[List[List[float]]] = None,
+    ) -> Dict:
+        """
+        Query the relevant shards concurrently and merge the top n_results by distance.
+        """
+        shards = self.route(where)
+        per_shard = self._fan_out(
+            shards,
+            lambda shard: self.shards[shard].query(
+                query_texts=query_texts, n_results=n_results, where=where, embeddings=embeddings
+            ),
+        )
+
+        query_count = len(embeddings) if embeddings is not None else len(query_texts)
+        merged = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in range(query_count):
+            hits = []
+            for results in per_shard:
+                distances = (results.get("distances") or [[]] * query_count)[q] or []
+                for position, distance in enumerate(distances):
+                    hits.append((distance, position, results))
+            for field in merged:
+                merged[field].append([])
+            for distance, position, results in heapq.nsmallest(n_results, hits, key=lambda hit: hit[0]):
+                merged["distances"][q].append(distance)
+                for field in ("ids", "documents", "metadatas"):
+                    values = (results.get(field) or [None] * query_count)[q]
+                    merged[field][q].append(values[position] if values else None)
+        return merged
+
+    def get_documents(self, ids: List[str], include: Optional[List[str]] = None) -> Dict:
+        """
+        Get specific chunks by ID from whichever shards hold them.
+        """
+        include = ["documents", "metadatas"] if include is None else include
+        page = {"ids": [], **{field: [] for field in include}}
+        if not ids:
+            return page
+        for results in self._fan_out(
+            range(len(self.shards)), lambda shard: self.shards[shard].get_documents(ids, include=include)
+        ):
+            page["ids"].extend(results["ids"])
+            for field in include:
+                page[field].extend(list(results.get(field) if results.get(field) is not None else []))
+        return page
+
+    def iter_documents(
+        self,
+        batch_size: int = 1000,
+        include: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+    ) -> Iterator[Dict]:
+        """
+        Page through the relevant shards one after another.
+        """
+        for shard in self.route(where):
+            yield from self.shards[shard].iter_documents(batch_size=batch_size, include=include, where=where)
+
+    def delete_documents(self, ids: List[str]) -> int:
+        """
+        Delete document chunks by ID from the shards that hold them.
+
+        Returns:
+            Number of chunks deleted
+        """
+        if not ids:
+            return 0
+
+        def delete(shard: int) -> int:
+            found = self.shards[shard].get_documents(ids, include=[])["ids"]
+            return self.shards[shard].delete_documents(found) if found else 0
+
+        return sum(self._fan_out(range(len(self.shards)), delete))
+
+    def get_collection_count(self) -> int:
+        return sum(self.shard_counts())
+
+    def shard_counts(self) -> List[int]:
+        """
+        Number of chunks in every shard (to spot an unbalanced key).
+        """
+        return self._fan_out(range(len(self.shards)), lambda shard: self.shards[shard].get_collection_count())
+
+    def persist(self):
+        for shard in self.shards:
+            shard.persist()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self._executor.shutdown(wait=True)
+
+    def route(self, where: Optional[Dict]) -> List[int]:
+        """
+        Shards that can hold chunks matching a where filter.
+        """
+        shards = self._route(where)
+        return sorted(shards) if shards is not None else list(range(len(self.shards)))
+
+    def _route(self, where: Optional[Dict]) -> Optional[Set[int]]:
+        """
+        Shards a filter is limited to, or None if it can match any shard.
+        """
+        if not where:
+            return None
+        shards: Optional[Set[int]] = None
+
+        def restrict(allowed: Optional[Set[int]]):
+            nonlocal shards
+            if allowed is not None:
+                shards = allowed if shards is None else shards & allowed
+
+        condition = where.get(self.shard_key)
+        if condition is not None:
+            if not isinstance(condition, dict):
+                restrict({self.shard_for(condition)})
+            elif "$eq" in condition:
+                restrict({self.shard_for(condition["$eq"])})
+            elif "$in" in condition:
+                restrict({self.shard_for(value) for value in condition["$in"]})
+        for part in where.get("$and", []):
+            restrict(self._route(part))
+        if "$or" in where:
+            parts = [self._route(part) for part in where["$or"]]
+            if all(part is not None for part in parts):
+                restrict(set().union(*parts))
+        return shards
+
+    def _fan_out(self, shards, call: Callable[[int], T]) -> List[T]:
+        """
+        Run call(shard) for every shard concurrently; results in shard order.
+        """
+        shards = list(shards)
+        if len(shards) == 1:
+            return [call(shards[0])]
+        return list(self._executor.map(call, shards))
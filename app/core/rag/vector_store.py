@@ -1,14 +1,168 @@
 import os
-from typing import List, Dict, Optional
-import chromadb
+from abc import ABC, abstractmethod
+from typing import List, Dict, Iterator, Optional
 
 from app.config import settings
 
-class ChromaVectorStore:
+class VectorStore(ABC):
+    """
+    Interface of a chunk store with vector search.
+
+    Results use Chroma's shapes, so callers don't depend on the backend:
+    query() returns {"ids", "documents", "metadatas", "distances"} with one
+    list per query, distances are cosine distances (1 - similarity).
+    Pick a backend with settings.vector_store_backend (see create_vector_store).
+    """
+    @abstractmethod
+    def add_documents(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict]] = None,
+        embeddings: Optional[List[List[float]]] = None,
+    ):
+        """
+        Add documents to the vector store. Without embeddings the backend's
+        default embedding function is used. Existing IDs are replaced.
+        """
+
+    @abstractmethod
+    def query(
+        self,
+        query_texts: List[str],
+        n_results: int = 5,
+        where: Optional[Dict] = None,
+        embeddings: Optional[List[List[float]]] = None,
+    ) -> Dict:
+        """
+        Query the vector store for similar documents (one result list per query).
+        """
+
+    @abstractmethod
+    def get_documents(self, ids: List[str], include: Optional[List[str]] = None) -> Dict:
+        """
+        Get specific chunks by ID.
+        """
+
+    @abstractmethod
+    def iter_documents(
+        self,
+        batch_size: int = 1000,
+        include: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+    ) -> Iterator[Dict]:
+        """
+        Page through the collection in fixed-size batches.
+        """
+
+    @abstractmethod
+    def delete_documents(self, ids: List[str]) -> int:
+        """
+        Delete document chunks by ID.
+        """
+
+    @abstractmethod
+    def get_collection_count(self) -> int:
+        """
+        Get the total number of documents in the collection.
+        """
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        """
+        Replace the metadata of stored chunks, keeping their text and
+        embedding. IDs that aren't stored are skipped. Backends override
+        this with a cheaper in-place update.
+        """
+        stored = self.get_documents(ids, include=["documents", "embeddings"])
+        if not stored["ids"]:
+            return
+        metadata_by_id = dict(zip(ids, metadatas))
+        self.add_documents(
+            ids=stored["ids"],
+            documents=stored["documents"],
+            metadatas=[metadata_by_id[chunk_id] for chunk_id in stored["ids"]],
+            embeddings=[[float(value) for value in embedding] for embedding in stored["embeddings"]],
+        )
+
+    def persist(self):
+        """
+        Flush pending writes to disk (no-op for backends that write through).
+        """
+
+    def close(self):
+        """
+        Release files and caches. Called once on application shutdown.
+        """
+
+    def get_all_documents(self, limit: Optional[int] = None) -> Dict:
+        """
+        Get all documents from the collection with their metadata.
+        Loads everything into memory; prefer iter_documents() for large collections.
+        
+        Args:
+            limit: Optional limit on number of documents to return
+            
+        Returns:
+            Dictionary containing ids, documents, and metadatas
+        """
+        all_docs = {
+            "ids": [],
+            "documents": [],
+            "metadatas": []
+        }
+        for page in self.iter_documents():
+            for field in all_docs:
+                all_docs[field].extend(page[field] or [])
+            if limit and len(all_docs["ids"]) >= limit:
+                break
+
+        if limit:
+            all_docs = {field: values[:limit] for field, values in all_docs.items()}
+        return all_docs
+
+    def delete_documents_by_file_name(self, file_name: str) -> int:
+        """
+        Delete all document chunks associated with a specific file name.
+        
+        Args:
+            file_name: The name of the file to delete
+            
+        Returns:
+            Number of documents deleted
+        """
+        # Let the backend's metadata filter find the chunks instead of scanning the collection
+        ids_to_delete = [
+            chunk_id
+            for page in self.iter_documents(include=[], where={"file_name": file_name})
+            for chunk_id in page["ids"]
+        ]
+        return self.delete_documents(ids_to_delete)
+
+    def get_unique_file_names(self) -> List[str]:
+        """
+        Get a list of all unique file names in the collection.
+        
+        Returns:
+            List of unique file names
+        """
+        # Only metadata is needed, one page at a time
+        file_names = set()
+        for page in self.iter_documents(include=["metadatas"]):
+            for metadata in page["metadatas"] or []:
+                if metadata and "file_name" in metadata:
+                    file_names.add(metadata["file_name"])
+        
+        return sorted(list(file_names))
+
+
+class ChromaVectorStore(VectorStore):
     """
     wrapper around chromaDB for storing and quering document embeddings.
     """
     def __init__(self,collection_name:str="documind_documents"):
+        # Imported here: chromadb is slow to import and not needed by the NumPy backend
+        import chromadb
+
         os.makedirs(settings.vector_db_dir,exist_ok=True)
 
         self.client = chromadb.PersistentClient(
@@ -29,14 +183,23 @@ class ChromaVectorStore:
     ):
 
         """
-        Add documents to the vector store.
+        Add documents to the vector store. Existing IDs are replaced.
         """
-        self.collection.add(
+        self.collection.upsert(
             ids=ids,
             documents=documents,
             metadatas=metadatas,
             embeddings=embeddings,
         )
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        """
+        Replace the metadata of stored chunks (text and embeddings are kept).
+        """
+        found = set(self.collection.get(ids=ids, include=[])["ids"])
+        rows = [i for i, chunk_id in enumerate(ids) if chunk_id in found]
+        if rows:
+            self.collection.update(ids=[ids[i] for i in rows], metadatas=[metadatas[i] for i in rows])
     
     def query(
         self,
@@ -71,68 +234,96 @@ class ChromaVectorStore:
         """
         # PersistentClient automatically persists, no action needed
         pass
+
+    def close(self):
+        """
+        Release the Chroma client and its cached system (file handles, HNSW
+        segments). Called once on application shutdown.
+        """
+        clear_system_cache = getattr(self.client, "clear_system_cache", None)
+        if clear_system_cache is not None:
+            clear_system_cache()
     
-    def get_all_documents(self, limit: Optional[int] = None) -> Dict:
+    def get_documents(self, ids: List[str], include: Optional[List[str]] = None) -> Dict:
         """
-        Get all documents from the collection with their metadata.
-        
+        Get specific chunks by ID.
+
         Args:
-            limit: Optional limit on number of documents to return
-            
+            ids: Chunk IDs
+            include: Fields to load besides ids (default: documents and metadatas)
+
         Returns:
-            Dictionary containing ids, documents, and metadatas
+            Dictionary with "ids" plus the included fields (order not guaranteed)
         """
-        # ChromaDB doesn't have a direct "get all" method, so we query with empty query
-        # We'll use a workaround: get collection count and query with a dummy query
-        count = self.collection.count()
-        
-        if count == 0:
-            return {
-                "ids": [],
-                "documents": [],
-                "metadatas": []
+        include = ["documents", "metadatas"] if include is None else include
+        if not ids:
+            return {"ids": [], **{field: [] for field in include}}
+        results = self.collection.get(ids=ids, include=include)
+        page = {"ids": results.get("ids") or []}
+        for field in include:
+            page[field] = results.get(field)
+        return page
+
+    def iter_documents(
+        self,
+        batch_size: int = 1000,
+        include: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+    ) -> Iterator[Dict]:
+        """
+        Page through the collection in fixed-size batches, so peak memory is
+        bounded by one batch instead of the whole collection.
+
+        Args:
+            batch_size: Number of chunks per page
+            include: Fields to load besides ids, any of "documents", "metadatas",
+                "embeddings" (default: documents and metadatas). Pass ["metadatas"]
+                to skip chunk text, or [] for ids only.
+            where: Optional metadata filter
+
+        Yields:
+            One dictionary per page with "ids" plus the included fields
+        """
+        include = ["documents", "metadatas"] if include is None else include
+        offset = 0
+        while True:
+            get_params = {
+                "limit": batch_size,
+                "offset": offset,
+                "include": include,
             }
-        
-        # Get all documents by querying with a large n_results
-        # Note: This is a workaround since ChromaDB doesn't have direct "get all"
-        results = self.collection.get(
-            limit=limit if limit else count
-        )
-        
-        return {
-            "ids": results.get("ids", []),
-            "documents": results.get("documents", []),
-            "metadatas": results.get("metadatas", [])
-        }
-    
-    def delete_documents_by_file_name(self, file_name: str) -> int:
+            # ChromaDB doesn't accept where=None
+            if where is not None:
+                get_params["where"] = where
+
+            results = self.collection.get(**get_params)
+            ids = results.get("ids") or []
+            if not ids:
+                return
+
+            page = {"ids": ids}
+            for field in include:
+                page[field] = results.get(field)
+            yield page
+
+            if len(ids) < batch_size:
+                return
+            offset += batch_size
+
+    def delete_documents(self, ids: List[str]) -> int:
         """
-        Delete all document chunks associated with a specific file name.
-        
+        Delete document chunks by ID.
+
         Args:
-            file_name: The name of the file to delete
-            
+            ids: IDs of the chunks to delete
+
         Returns:
-            Number of documents deleted
+            Number of IDs passed for deletion
         """
-        # Get all documents to find ones matching the file name
-        all_docs = self.get_all_documents()
-        metadatas = all_docs.get("metadatas", [])
-        ids = all_docs.get("ids", [])
-        
-        # Find IDs where file_name matches
-        ids_to_delete = [
-            doc_id 
-            for doc_id, metadata in zip(ids, metadatas) 
-            if metadata and metadata.get("file_name") == file_name
-        ]
-        
-        if not ids_to_delete:
+        if not ids:
             return 0
-        
-        # Delete the documents
-        self.collection.delete(ids=ids_to_delete)
-        return len(ids_to_delete)
+        self.collection.delete(ids=ids)
+        return len(ids)
     
     def get_collection_count(self) -> int:
         """
@@ -142,21 +333,38 @@ class ChromaVectorStore:
             Total count of documents
         """
         return self.collection.count()
-    
-    def get_unique_file_names(self) -> List[str]:
-        """
-        Get a list of all unique file names in the collection.
-        
-        Returns:
-            List of unique file names
-        """
-        all_docs = self.get_all_documents()
-        metadatas = all_docs.get("metadatas", [])
-        
-        # Extract unique file names
-        file_names = set()
-        for metadata in metadatas:
-            if metadata and "file_name" in metadata:
-                file_names.add(metadata["file_name"])
-        
-        return sorted(list(file_names))
\ No newline at end of file
+
+
+def create_vector_store(collection_name: str = "documind_documents") -> VectorStore:
+    """
+    Build the vector store selected in settings.vector_store_backend,
+    sharded over settings.vector_store_shards collections when above 1.
+
+    Args:
+        collection_name: Name of the collection to open
+
+    Returns:
+        ChromaVectorStore ("chroma") or NumpyVectorStore ("numpy"), or a
+        ShardedVectorStore of them
+    """
+    if settings.vector_store_shards > 1:
+        # Imported here to avoid circular imports (the stores subclass VectorStore)
+        from app.core.rag.sharded_store import ShardedVectorStore
+        return ShardedVectorStore(
+            shards=[
+                _create_backend(f"{collection_name}_shard_{shard}")
+                for shard in range(settings.vector_store_shards)
+            ],
+            shard_key=settings.vector_store_shard_key,
+        )
+    return _create_backend(collection_name)
+
+
+def _create_backend(collection_name: str) -> VectorStore:
+    backend = settings.vector_store_backend.lower()
+    if backend == "chroma":
+        return ChromaVectorStore(collection_name=collection_name)
+    if backend == "numpy":
+        from app.core.rag.numpy_store import NumpyVectorStore
+        return NumpyVectorStore(collection_name=collection_name)
+    raise ValueError(f"Unknown vector store backend: {backend}")
@@ -0,0 +1,131 @@
+"""
+Spooling uploaded files to disk.
+
+Uploads are copied to a temporary file in fixed-size chunks
+(settings.upload_chunk_bytes), never read into memory whole, so memory per
+upload stays constant whatever the file size. The SHA-256 of the content
+is computed during the same pass, and the copy stops as soon as
+settings.upload_max_bytes is exceeded.
+
+The multipart body is parsed (and its file parts buffered by Starlette)
+before the route runs, so the limit is also enforced earlier, on the raw
+request stream, by UploadSizeLimitMiddleware: a request announcing a larger
+Content-Length is rejected before its body is read, and a chunked request
+without one is cut off with 413 as soon as its body passes the limit.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Allowance for the multipart framing around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """
+    Raised when an upload exceeds the configured maximum size.
+    """
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds the maximum upload size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware limiting the request body size of upload routes to
+    settings.upload_max_bytes (plus multipart framing), counted on the
+    receive stream.
+    """
+    def __init__(self, app: ASGIApp, path_prefix: str = "/documents/upload"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        limit = settings.upload_max_bytes + MULTIPART_OVERHEAD_BYTES
+        detail = f"File exceeds the maximum upload size of {settings.upload_max_bytes} bytes"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised while the route reads its body; FastAPI passes
+                    # HTTPExceptions through, so the client gets a 413
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def spool_upload(
+    file: UploadFile,
+    suffix: str = "",
+    max_bytes: Optional[int] = None,
+    chunk_bytes: Optional[int] = None,
+    directory: Optional[str] = None,
+) -> Dict:
+    """
+    Copy an upload to a temporary file, hashing it on the way.
+
+    Args:
+        file: The uploaded file
+        suffix: Suffix of the temporary file (parsers pick by extension)
+        max_bytes: Size limit (default: settings.upload_max_bytes)
+        chunk_bytes: Bytes read per chunk (default: settings.upload_chunk_bytes)
+        directory: Directory of the file (default: the system temp directory)
+
+    Returns:
+        Dictionary with "path", "size_bytes" and "sha256" of the temporary
+        file; the caller deletes it
+
+    Raises:
+        UploadTooLargeError: If the upload is larger than max_bytes (the
+            partial temporary file is removed)
+    """
+    max_bytes = max_bytes or settings.upload_max_bytes
+    chunk_bytes = chunk_bytes or settings.upload_chunk_bytes
+    digest = hashlib.sha256()
+    size = 0
+
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory)
+    try:
+        with temp_file:
+            while True:
+                chunk = await file.read(chunk_bytes)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                await asyncio.to_thread(temp_file.write, chunk)
+    except BaseException:
+        os.remove(temp_file.name)
+        raise
+
+    logger.info(f"Spooled upload {file.filename} to disk - {size} bytes")
+    return {"path": temp_file.name, "size_bytes": size, "sha256": digest.hexdigest()}
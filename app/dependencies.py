@@ -0,0 +1,212 @@
+"""
+Process-lifetime singletons for the API.
+
+Building a service used to open a new Chroma PersistentClient, reload the
+collection, re-run genai.configure and create a new GenerativeModel on
+every request. Here each of those is created once per process and shared:
+
+    - Routes receive services via FastAPI Depends(get_query_service), ...
+    - Non-HTTP code (e.g. the LangGraph agents) calls the getters directly.
+    - The app lifespan calls init_dependencies() and warm_up() on startup,
+      starts the ingestion workers, and calls close_dependencies() on shutdown.
+"""
+import logging
+import threading
+from functools import lru_cache, wraps
+from typing import Callable, Optional, TypeVar
+
+from app.config import settings
+from app.core.llm.gemini_client import GeminiClient
+from app.core.rag.vector_store import VectorStore, create_vector_store
+from app.core.rag.embedding_cache import close_embedding_cache
+from app.core.rag.document_registry import DocumentRegistry, get_document_registry, close_document_registry
+from app.core.rag.retrieval import BM25Index, get_bm25_index, close_bm25_index
+from app.core.rag.reranking import get_reranker
+from app.core.ingestion_jobs import IngestionJobStore, get_ingestion_job_store, close_ingestion_job_store
+from app.core.executors import shutdown_executors
+from app.services.embedding_service import EmbeddingService
+from app.services.query_service import QueryService
+from app.services.document_service import DocumentService
+from app.services.admin_service import AdminService
+from app.services.ingestion_service import IngestionService
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_init_lock = threading.RLock()
+
+
+def _shared(factory: Callable[[], T]) -> Callable[[], T]:
+    """
+    Cache a getter's instance for the process. The first call is serialized,
+    so requests arriving while startup is still running can't build a
+    second instance.
+    """
+    cached = lru_cache(maxsize=None)(factory)
+
+    @wraps(factory)
+    def getter() -> T:
+        if cached.cache_info().currsize:
+            return cached()
+        with _init_lock:
+            return cached()
+
+    getter.cache_clear = cached.cache_clear
+    getter.cache_info = cached.cache_info
+    return getter
+
+
+@_shared
+def get_gemini_client() -> GeminiClient:
+    return GeminiClient()
+
+
+@_shared
+def get_vector_store() -> VectorStore:
+    return create_vector_store()
+
+
+@_shared
+def get_registry() -> DocumentRegistry:
+    return get_document_registry()
+
+
+@_shared
+def get_lexical_index() -> Optional[BM25Index]:
+    return get_bm25_index()
+
+
+@_shared
+def get_embedding_service() -> EmbeddingService:
+    return EmbeddingService(gemini_client=get_gemini_client())
+
+
+@_shared
+def get_query_service() -> QueryService:
+    return QueryService(
+        vector_store=get_vector_store(),
+        embedding_service=get_embedding_service(),
+        gemini_client=get_gemini_client(),
+        lexical_index=get_lexical_index(),
+        registry=get_registry(),
+    )
+
+
+@_shared
+def get_document_service() -> DocumentService:
+    return DocumentService(
+        vector_store=get_vector_store(),
+        embedding_service=get_embedding_service(),
+        registry=get_registry(),
+        lexical_index=get_lexical_index(),
+    )
+
+
+@_shared
+def get_admin_service() -> AdminService:
+    return AdminService(
+        vector_store=get_vector_store(),
+        registry=get_registry(),
+        lexical_index=get_lexical_index(),
+    )
+
+
+@_shared
+def get_job_store() -> IngestionJobStore:
+    return get_ingestion_job_store()
+
+
+@_shared
+def get_ingestion_service() -> IngestionService:
+    return IngestionService(
+        job_store=get_job_store(),
+        document_service=get_document_service(),
+    )
+
+
+_GETTERS = (
+    get_gemini_client,
+    get_vector_store,
+    get_registry,
+    get_lexical_index,
+    get_embedding_service,
+    get_query_service,
+    get_document_service,
+    get_admin_service,
+    get_job_store,
+    get_ingestion_service,
+)
+
+
+def init_dependencies():
+    """
+    Create all shared instances up front, so the first request doesn't pay
+    for opening Chroma or configuring Gemini.
+    """
+    for getter in _GETTERS:
+        getter()
+
+    if settings.pdf_parse_processes <= 0:
+        logger.warning(
+            "PDF_PARSE_PROCESSES=0: PDF pages are extracted in the parsing thread, "
+            "one at a time and without the per-page timeout (PDF_PAGE_TIMEOUT_SECONDS is ignored)"
+        )
+
+    # Collections created before the registry / BM25 index existed: build them once
+    if get_registry().is_empty() and get_vector_store().get_collection_count() > 0:
+        get_admin_service().rebuild_registry()
+    lexical_index = get_lexical_index()
+    if lexical_index is not None and lexical_index.is_empty() and get_vector_store().get_collection_count() > 0:
+        get_admin_service().rebuild_lexical_index()
+    elif lexical_index is not None and lexical_index.has_legacy_segments():
+        get_admin_service().tag_lexical_index()
+    logger.info("Shared services initialized")
+
+
+def warm_up():
+    """
+    Run one search against every index a query uses, so the first real
+    query doesn't pay for loading them: Chroma loads its HNSW index on the
+    first query, memory-mapped files are paged in, and the reranker's local
+    model is exercised. Uses a stored chunk as the query, so no embedding
+    API call is made.
+    """
+    vector_store = get_vector_store()
+    sample = next(iter(vector_store.iter_documents(batch_size=1, include=["documents", "embeddings"])), None)
+    if not sample or not sample["ids"]:
+        logger.info("Vector store is empty, nothing to warm up")
+        return
+
+    text = sample["documents"][0] or ""
+    embedding = [float(value) for value in sample["embeddings"][0]]
+    vector_store.query(query_texts=[text], n_results=1, embeddings=[embedding])
+
+    lexical_index = get_lexical_index()
+    if lexical_index is not None:
+        lexical_index.search(text[:200], top_k=1)
+    reranker = get_reranker()
+    if reranker is not None:
+        reranker.rerank(text[:200], [{"chunk": text, "similarity_score": 1.0}], top_k=1)
+    logger.info("Warm-up query completed")
+
+
+def close_dependencies():
+    """
+    Release shared resources and forget the singletons.
+    """
+    if get_vector_store.cache_info().currsize:
+        try:
+            get_vector_store().close()
+        except Exception as e:
+            logger.warning(f"Failed to close vector store: {str(e)}")
+
+    shutdown_executors()
+    close_embedding_cache()
+    close_document_registry()
+    close_bm25_index()
+    close_ingestion_job_store()
+
+    for getter in _GETTERS:
+        getter.cache_clear()
+    logger.info("Shared services closed")
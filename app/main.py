@@ -1,23 +1,82 @@
 import time
+_import_start=time.perf_counter()
+
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI,Request
+from fastapi.responses import JSONResponse
 from app.config import settings
+from app.dependencies import init_dependencies, warm_up, close_dependencies, get_ingestion_service
 from app.api.routes import documents
 from app.api.routes import query
 from app.api.routes import admin
 from app.core.logging_config import setup_logging
+from app.core.uploads import UploadSizeLimitMiddleware
 
+IMPORT_MS=round((time.perf_counter()-_import_start)*1000,2)
 
 setup_logging()
 
+logger=logging.getLogger(__name__)
 request_logger=logging.getLogger("app.middleware.request_logger")
 
 
+async def start_ingestion_workers():
+    await get_ingestion_service().start()
+
+
+async def start_up(app: FastAPI):
+    """
+    Startup phases, run in the background so /health answers immediately:
+    shared services are created, the ingestion workers start (picking up
+    jobs left from a previous run), then a warm-up query loads the indexes.
+    /ready reports 503 until every phase has finished. Phase timings are
+    logged and returned by /ready to track cold-start regressions.
+    """
+    startup=app.state.startup
+    started=time.perf_counter()
+    phases=(("dependencies",init_dependencies),("ingestion_workers",start_ingestion_workers))
+    if settings.startup_warmup_enabled:
+        phases+=(("warm_up",warm_up),)
+    try:
+        for name,step in phases:
+            phase_start=time.perf_counter()
+            if asyncio.iscoroutinefunction(step):
+                await step()
+            else:
+                await asyncio.to_thread(step)
+            startup["phases_ms"][name]=round((time.perf_counter()-phase_start)*1000,2)
+            logger.info(f"Startup phase {name} took {startup['phases_ms'][name]:.2f}ms")
+        startup["status"]="ready"
+        logger.info(f"Ready in {(time.perf_counter()-started)*1000:.2f}ms after {IMPORT_MS:.2f}ms of imports - phases: {startup['phases_ms']}")
+    except Exception as e:
+        startup["status"]="failed"
+        startup["error"]=str(e)
+        logger.error(f"Startup failed: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create shared services (in the background) at startup and release them on shutdown.
+    """
+    app.state.startup={"status":"starting","phases_ms":{"import":IMPORT_MS},"error":None}
+    startup_task=asyncio.create_task(start_up(app))
+    yield
+    # Don't close services while startup is still creating them
+    await startup_task
+    if get_ingestion_service.cache_info().currsize:
+        await get_ingestion_service().stop()
+    await asyncio.to_thread(close_dependencies)
+
+
 #create FastAPI app instance
 app=FastAPI(
     title=settings.app_name,
     version="1.0.0",
-    description="DocuMind AI - Multi-Agent Document Intelligence System"
+    description="DocuMind AI - Multi-Agent Document Intelligence System",
+    lifespan=lifespan
 )
 
 
@@ -41,6 +100,9 @@ async def log_requests(request: Request,call_next):
         request_logger.info(log_message)
     return response
     
+# Upload size limit on the raw body stream, enforced before multipart parsing buffers it
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # Include routers
 app.include_router(documents.router)
 app.include_router(query.router)
@@ -60,6 +122,18 @@ async def health_check():
         "version":"1.0.0"
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe: 200 once startup and warm-up have finished, 503 before
+    that (or if startup failed). Route traffic on this, not /health.
+    """
+    startup=app.state.startup
+    return JSONResponse(
+        status_code=200 if startup["status"]=="ready" else 503,
+        content=startup
+    )
+
 @app.get("/")
 async def root():
     """
@@ -70,5 +144,6 @@ async def root():
         "message":"Welcome to DocuMind AI API",
         "version":"1.0.0",
         "docs":"/docs",
-        "health":"/health"
+        "health":"/health",
+        "ready":"/ready"
     }
\ No newline at end of file
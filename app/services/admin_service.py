@@ -1,6 +1,11 @@
 from typing import List, Dict, Optional
 import logging
-from app.core.rag.vector_store import ChromaVectorStore
+from app.core.rag.vector_store import VectorStore, create_vector_store
+from app.core.rag.embedding_cache import get_embedding_cache
+from app.core.rag.document_registry import DocumentRegistry, get_document_registry
+from app.core.rag.retrieval import BM25Index, get_bm25_index
+from app.core.rag.semantic_cache import get_semantic_cache, bump_corpus_version
+from app.core.llm.scheduler import get_gemini_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -10,11 +15,19 @@ class AdminService:
     Handles listing, deleting, and getting statistics about documents.
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        vector_store: Optional[VectorStore] = None,
+        registry: Optional[DocumentRegistry] = None,
+        lexical_index: Optional[BM25Index] = None,
+    ):
         """
         Initialize the admin service.
+        A shared vector store, document registry and lexical index can be injected.
         """
-        self.vector_store = ChromaVectorStore()
+        self.vector_store = vector_store or create_vector_store()
+        self.registry = registry or get_document_registry()
+        self.lexical_index = lexical_index or get_bm25_index()
     
     def list_all_documents(self) -> Dict:
         """
@@ -24,33 +37,16 @@ class AdminService:
             Dictionary containing:
                 - total_count: Total number of document chunks
                 - unique_files: Number of unique files
-                - files: List of file details with chunk counts
+                - files: List of file details with chunk counts, sizes and ingest times
         """
         logger.info("Listing all documents")
         
-        # Step 1: Get all documents from vector store
-        all_docs = self.vector_store.get_all_documents()
-        metadatas = all_docs.get("metadatas", [])
-        
-        # Step 2: Count chunks per file
-        file_chunk_count = {}
-        for metadata in metadatas:
-            if metadata and "file_name" in metadata:
-                file_name = metadata["file_name"]
-                file_chunk_count[file_name] = file_chunk_count.get(file_name, 0) + 1
-        
-        # Step 3: Build file details list
-        files = [
-            {
-                "file_name": file_name,
-                "chunk_count": count
-            }
-            for file_name, count in file_chunk_count.items()
-        ]
+        # The registry keeps per-file counts, so no chunk has to be loaded
+        files = self.registry.list_files()
         
         return {
-            "total_count": len(all_docs.get("ids", [])),
-            "unique_files": len(file_chunk_count),
+            "total_count": self.registry.total_chunks(),
+            "unique_files": len(files),
             "files": files
         }
     
@@ -66,8 +62,19 @@ class AdminService:
         """
         logger.info(f"Deleting document: {file_name}")
         
-        # Call vector store to delete
-        deleted_count = self.vector_store.delete_documents_by_file_name(file_name)
+        # Look the chunk IDs up in the registry; fall back to a metadata
+        # filter for chunks the registry doesn't know about
+        chunk_ids = self.registry.get_chunk_ids(file_name)
+        if not chunk_ids:
+            chunk_ids = [
+                chunk_id
+                for page in self.vector_store.iter_documents(include=[], where={"file_name": file_name})
+                for chunk_id in page["ids"]
+            ]
+        deleted_count = self.vector_store.delete_documents(chunk_ids)
+        self.registry.remove_file(file_name)
+        if self.lexical_index is not None:
+            self.lexical_index.delete_documents(chunk_ids)
         
         # Check if deletion was successful
         if deleted_count == 0:
@@ -76,7 +83,10 @@ class AdminService:
                 "message": f"Document '{file_name}' not found",
                 "deleted_count": 0
             }
-        
+
+        # Cached answers may cite the deleted chunks
+        bump_corpus_version()
+
         return {
             "success": True,
             "message": f"Successfully deleted {deleted_count} chunk(s) for file '{file_name}'",
@@ -94,10 +104,105 @@ class AdminService:
         logger.info("Getting collection statistics")
         
         total_count = self.vector_store.get_collection_count()
-        unique_files = self.vector_store.get_unique_file_names()
+        unique_files = [file["file_name"] for file in self.registry.list_files()]
         
         return {
             "total_chunks": total_count,
             "unique_files": len(unique_files),
             "file_names": unique_files
-        }
\ No newline at end of file
+        }
+
+    def rebuild_registry(self) -> Dict:
+        """
+        Rebuild the document registry from the chunk metadata in the vector store.
+
+        Returns:
+            Dictionary with the number of files and chunks registered
+        """
+        logger.info("Rebuilding document registry")
+        # Page through metadata only; chunk text is never loaded
+        chunks = (
+            (chunk_id, metadata)
+            for page in self.vector_store.iter_documents(include=["metadatas"])
+            for chunk_id, metadata in zip(page["ids"], page["metadatas"] or [])
+        )
+        return self.registry.rebuild(chunks)
+
+    def rebuild_lexical_index(self) -> Dict:
+        """
+        Rebuild the BM25 index from the chunk texts and metadata in the vector store.
+
+        Returns:
+            Dictionary with the number of chunks indexed
+        """
+        if self.lexical_index is None:
+            return {"chunks": 0}
+        logger.info("Rebuilding BM25 index")
+        chunks = (
+            (chunk_id, document, metadata)
+            for page in self.vector_store.iter_documents(include=["documents", "metadatas"])
+            for chunk_id, document, metadata in zip(page["ids"], page["documents"] or [], page["metadatas"] or [])
+        )
+        return self.lexical_index.rebuild(chunks)
+
+    def tag_lexical_index(self) -> Dict:
+        """
+        Record the files of the BM25 segments written before files were
+        recorded, so filtered queries are ranked by the index alone.
+
+        Returns:
+            Dictionary with the number of segments and chunks tagged
+        """
+        if self.lexical_index is None or not self.lexical_index.has_legacy_segments():
+            return {"segments": 0, "chunks": 0}
+        logger.info("Tagging BM25 segments with their files")
+        chunks = (
+            (chunk_id, metadata)
+            for page in self.vector_store.iter_documents(include=["metadatas"])
+            for chunk_id, metadata in zip(page["ids"], page["metadatas"] or [])
+        )
+        return self.lexical_index.tag_legacy_segments(chunks)
+
+    def get_lexical_index_statistics(self) -> Dict:
+        """
+        Get segment and document counts of the BM25 index.
+
+        Returns:
+            Dictionary containing index statistics
+        """
+        if self.lexical_index is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.lexical_index.stats()}
+
+    def get_embedding_cache_statistics(self) -> Dict:
+        """
+        Get hit/miss counters of the embedding cache.
+
+        Returns:
+            Dictionary containing cache statistics
+        """
+        cache = get_embedding_cache()
+        if cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **cache.stats()}
+
+    def get_answer_cache_statistics(self) -> Dict:
+        """
+        Get hit/miss counters of the semantic answer cache.
+
+        Returns:
+            Dictionary containing cache statistics
+        """
+        cache = get_semantic_cache()
+        if cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **cache.stats()}
+
+    def get_llm_scheduler_statistics(self) -> Dict:
+        """
+        Get queue depth and wait times of the Gemini call scheduler.
+
+        Returns:
+            Dictionary containing scheduler statistics
+        """
+        return get_gemini_scheduler().stats()
@@ -1,101 +1,476 @@
 import os
-from typing import List,Optional
+import hashlib
+from typing import Callable,Dict,Iterator,List,Optional
 import logging
 import uuid
+import time
+import asyncio
 
 from ingestion.parsers.pdf_parser import PDFParser
 from ingestion.parsers.docx_parser import DOCXParser
 from ingestion.parsers.text_parser import TextParser
 from ingestion.chunkers.text_splitter import TextSplitter
-from app.core.rag.vector_store import ChromaVectorStore
+from ingestion.pipeline import iter_batches, run_pipeline
+from app.core.rag.vector_store import VectorStore, create_vector_store
 from app.services.embedding_service import EmbeddingService
+from app.core.executors import get_parse_executor, get_pdf_process_pool
+from app.core.rag.semantic_cache import bump_corpus_version
+from app.core.rag.document_registry import DocumentRegistry, get_document_registry
+from app.core.rag.retrieval import BM25Index, get_bm25_index
 from app.config import settings
 
 logger=logging.getLogger(__name__)
 
+
+# Namespace of the deterministic chunk IDs (uuid5)
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c2b0e-3d4a-5e8f-9a7b-1c2d3e4f5a6b")
+
+
+def chunk_id_for(file_name: str, chunk: str, occurrence: int = 0) -> str:
+    """
+    Deterministic chunk ID from the file identity (its name) and the chunk
+    content, so re-ingesting a file maps unchanged chunks to the IDs they
+    are stored under. occurrence tells repeated texts in one file apart.
+    TextSplitter cuts chunks at content-defined boundaries, so an edit only
+    changes the IDs of the chunks around it, not of every chunk after it.
+    """
+    content_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{file_name}\x00{content_hash}\x00{occurrence}"))
+
+
+def _file_sha256(file_path: str, block_bytes: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_bytes), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _no_progress(**updates):
+    pass
+
+
+def _then(items: Iterator[str], callback: Callable[[], None]) -> Iterator[str]:
+    """
+    Yield the items, then call callback once they are exhausted.
+    """
+    yield from items
+    callback()
+
+
 class DocumentService:
     """
     Service for processing documents-parsing and chunking
     """
-    def __init__(self):
+    def __init__(
+        self,
+        vector_store: Optional[VectorStore] = None,
+        embedding_service: Optional[EmbeddingService] = None,
+        registry: Optional[DocumentRegistry] = None,
+        lexical_index: Optional[BM25Index] = None,
+    ):
 
         """
-        Initialize the document service with parsing and splitter
+        Initialize the document service with parsing and splitter.
+        Shared vector store / embedding service / registry / lexical index instances can be injected.
         """
-        self.pdf_parser=PDFParser()
+        self.pdf_parser=PDFParser(
+            executor=get_pdf_process_pool(),
+            pages_per_task=settings.pdf_pages_per_task,
+            page_timeout=settings.pdf_page_timeout_seconds,
+            max_in_flight=2*max(1,settings.pdf_parse_processes),
+        )
         self.docx_parser=DOCXParser()
         self.text_parser=TextParser()
         self.text_splitter=TextSplitter()
-        self.vector_store = ChromaVectorStore()
-        self.embedding_service = EmbeddingService()
+        self.vector_store = vector_store or create_vector_store()
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.registry = registry or get_document_registry()
+        self.lexical_index = lexical_index or get_bm25_index()
 
 
-    def process_document(self,file_path: str) -> Optional[List[str]]:
+    def iter_document_chunks(self,file_path: str,progress: Optional[Callable[...,None]]=None) -> Optional[Iterator[str]]:
         """
-        it will take a file path and return a list of chunks of text based on the file type
+        Stream a document's chunks: the parser yields pages and the splitter
+        turns them into chunks as they come, so the whole text is never held.
+        Nothing is read until the iterator is consumed.
+
+        Args:
+            file_path: Path to the document file
+            progress: Optional callback receiving keyword updates (pages_parsed)
+
+        Returns:
+            Iterator over the chunks, or None if the file type is not supported
         """
+        progress=progress or _no_progress
         file_extension=os.path.splitext(file_path)[1].lower()
-        text=None
         if file_extension=='.pdf':
-            text=self.pdf_parser.parse(file_path)
+            pages=self.pdf_parser.iter_pages(file_path,on_page=lambda pages: progress(pages_parsed=pages))
         elif file_extension=='.docx':
-            text=self.docx_parser.parse(file_path)
+            pages=_then(self.docx_parser.iter_pages(file_path),lambda: progress(pages_parsed=1))
         elif file_extension==".txt":
-            text=self.text_parser.parse(file_path)
+            pages=_then(self.text_parser.iter_pages(file_path),lambda: progress(pages_parsed=1))
         else:
             logger.error(f"Unsupported file type: {file_extension}")
             return None
-        if not text:
+        return self.text_splitter.split_stream(pages)
+
+    def process_document(self,file_path: str,progress: Optional[Callable[...,None]]=None) -> Optional[List[str]]:
+        """
+        it will take a file path and return a list of chunks of text based on the file type
+
+        progress, if given, is called with keyword updates (stage, pages_parsed).
+        """
+        progress=progress or _no_progress
+        progress(stage="parsing")
+        chunk_stream=self.iter_document_chunks(file_path,progress)
+        if chunk_stream is None:
+            return None
+        try:
+            chunks=list(chunk_stream)
+        except Exception as e:
+            logger.error(f"Failed to parse file:{file_path}: {str(e)}")
+            return None
+        if not chunks:
             logger.error(f"Failed to parse file:{file_path}")
             return None
-        
-        ##split text into chunks
-        chunks=self.text_splitter.split_text(text)
 
         logger.info(f"successfully processed document: {file_path} into {len(chunks)} chunks")
         return chunks
     
-    def store_document_in_vector_store(self, file_path: str) -> Optional[tuple]:
+    def store_document_in_vector_store(
+        self,
+        file_path: str,
+        file_name: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        progress: Optional[Callable[..., None]] = None,
+        keep_chunks: bool = True,
+    ) -> Optional[Dict]:
         """
         Process a document and store it in the vector store with embeddings.
+
+        The document is streamed: chunks are embedded and stored in batches of
+        settings.ingestion_batch_chunks as the file is parsed, so memory stays
+        flat and the first chunks are searchable before the file is done.
+
+        Storing a file under a name that is already stored updates it
+        incrementally: chunk IDs are derived from the file name and the chunk
+        content, so unchanged chunks are reused, only new chunks are embedded,
+        and chunks no longer in the file are deleted. A byte-identical file
+        (same content hash) returns right away.
         
         Args:
             file_path: Path to the document file
+            file_name: Name to store the document under (default: basename of file_path).
+                Uploads are parsed from a temp file, so the route passes the original name.
+            content_hash: SHA-256 of the file (computed if not given), stored
+                in the registry and the chunk metadata
+            progress: Optional callback receiving keyword progress updates
+                (stage, pages_parsed, chunks_total, chunks_embedded, chunks_reused, chunks_stored)
+            keep_chunks: Return the chunk texts (set False for large files)
             
         Returns:
-            Tuple of (chunks, chunk_ids) if successful, None if failed
+            Dictionary with chunk_count, chunk_ids, chunks (None unless
+            keep_chunks), chunks_reused, chunks_embedded, chunks_deleted and
+            unchanged, or None if the file type is unsupported or has no text
+
+        Raises:
+            Exception: If parsing or storing fails part way; the chunks added
+                by this upload are removed again and the previous version is kept
         """
-        chunks = self.process_document(file_path)
-        if not chunks:
+        progress = progress or _no_progress
+        ingest_start = time.perf_counter()
+        progress(stage="parsing")
+        chunk_stream = self.iter_document_chunks(file_path, progress)
+        if chunk_stream is None:
             return None
-        
-        # Try to generate embeddings with Gemini, but if it fails, use ChromaDB's default
-        embeddings = None
+
+        ingestion = self._start_ingestion(file_path, file_name, content_hash, keep_chunks)
+        unchanged = self._unchanged_result(ingestion)
+        if unchanged is not None:
+            return unchanged
+        try:
+            for batch in self._iter_chunk_batches(chunk_stream, progress):
+                plan = self._plan_batch(ingestion, batch)
+                progress(stage="embedding")
+                embeddings = self._embed_batch([batch[i] for i in plan["new"]]) if plan["new"] else None
+                self._store_batch(ingestion, batch, plan, embeddings, progress)
+        except BaseException:
+            self._roll_back(ingestion)
+            raise
+        return self._finish_ingestion(ingestion, ingest_start)
+
+    async def store_document_in_vector_store_async(
+        self,
+        file_path: str,
+        file_name: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        progress: Optional[Callable[..., None]] = None,
+        keep_chunks: bool = True,
+    ) -> Optional[Dict]:
+        """
+        Async version of store_document_in_vector_store().
+
+        Parsing and chunking run on the bounded parse executor, concurrently
+        with embedding and storing the previous batches. At most
+        settings.ingestion_max_pending_batches chunked batches wait for
+        embedding; beyond that parsing pauses (backpressure). Embeddings are
+        awaited and the vector store writes run in a worker thread, so the
+        event loop is never blocked by an upload.
+
+        Args:
+            file_path: Path to the document file
+            file_name: Name to store the document under (default: basename of file_path)
+            content_hash: SHA-256 of the file (computed if not given)
+            progress: Optional callback receiving keyword progress updates
+                (called from worker threads too)
+            keep_chunks: Return the chunk texts (set False for large files)
+
+        Returns:
+            Same dictionary as store_document_in_vector_store(), or None if
+            the file type is unsupported or has no text
+
+        Raises:
+            Exception: If parsing or storing fails part way (or the task is
+                cancelled); the chunks added by this upload are removed again
+        """
+        progress = progress or _no_progress
+        ingest_start = time.perf_counter()
+        progress(stage="parsing")
+        chunk_stream = self.iter_document_chunks(file_path, progress)
+        if chunk_stream is None:
+            return None
+
+        ingestion = await asyncio.to_thread(self._start_ingestion, file_path, file_name, content_hash, keep_chunks)
+        unchanged = await asyncio.to_thread(self._unchanged_result, ingestion)
+        if unchanged is not None:
+            return unchanged
+
+        async def embed_and_store(batch: List[str]):
+            plan = self._plan_batch(ingestion, batch)
+            progress(stage="embedding")
+            embeddings = await self._embed_batch_async([batch[i] for i in plan["new"]]) if plan["new"] else None
+            await asyncio.to_thread(self._store_batch, ingestion, batch, plan, embeddings, progress)
+
         try:
-            if settings.gemini_api_key:
-                embeddings = self.embedding_service.generate_embeddings(chunks)
-                logger.info("Using Gemini embeddings")
-            else:
-                logger.info("No Gemini API key, using ChromaDB default embeddings")
+            await run_pipeline(
+                self._iter_chunk_batches(chunk_stream, progress),
+                embed_and_store,
+                max_pending=settings.ingestion_max_pending_batches,
+                executor=get_parse_executor(),
+            )
+        except BaseException:
+            await asyncio.to_thread(self._roll_back, ingestion)
+            raise
+        return await asyncio.to_thread(self._finish_ingestion, ingestion, ingest_start)
+
+    def _start_ingestion(
+        self,
+        file_path: str,
+        file_name: Optional[str],
+        content_hash: Optional[str],
+        keep_chunks: bool,
+    ) -> Dict:
+        """
+        State of one file being stored batch by batch, including the chunks
+        stored for a previous version of the file.
+        """
+        file_name = file_name or os.path.basename(file_path)
+        return {
+            "file_path": file_path,
+            "file_name": file_name,
+            "file_type": os.path.splitext(file_name)[1].lower().lstrip("."),
+            "file_size": os.path.getsize(file_path),
+            "content_hash": content_hash or _file_sha256(file_path),
+            "ingested_at": time.time(),
+            "previous": self.registry.get_file(file_name),
+            "previous_indexes": self.registry.get_chunk_indexes(file_name),
+            "chunk_ids": [],
+            "seen_ids": set(),
+            "added_ids": [],
+            # Metadata of the moved chunks before they were rewritten, by ID
+            "moved_metadatas": {},
+            "unmoved_ids": [],
+            "unmoved_indexes": [],
+            "chunks": [] if keep_chunks else None,
+            "embedded": 0,
+            "reused": 0,
+        }
+
+    def _unchanged_result(self, ingestion: Dict) -> Optional[Dict]:
+        """
+        Result for a file that is stored already with the same content hash,
+        or None if it has to be (re-)ingested.
+        """
+        previous = ingestion["previous"]
+        if not previous or not previous["chunk_count"] or previous["content_sha256"] != ingestion["content_hash"]:
+            return None
+        chunk_ids = self.registry.get_chunk_ids(ingestion["file_name"])
+        chunks = None
+        if ingestion["chunks"] is not None:
+            stored = self.vector_store.get_documents(chunk_ids, include=["documents"])
+            text_by_id = dict(zip(stored["ids"], stored["documents"]))
+            chunks = [text_by_id.get(chunk_id, "") for chunk_id in chunk_ids]
+        logger.info(f"{ingestion['file_name']} is unchanged (sha256 {ingestion['content_hash'][:12]}), reusing {len(chunk_ids)} chunks")
+        return {
+            "chunk_count": len(chunk_ids),
+            "chunk_ids": chunk_ids,
+            "chunks": chunks,
+            "chunks_reused": len(chunk_ids),
+            "chunks_embedded": 0,
+            "chunks_deleted": 0,
+            "unchanged": True,
+        }
+
+    @staticmethod
+    def _iter_chunk_batches(chunk_stream: Iterator[str], progress: Callable[..., None]) -> Iterator[List[str]]:
+        chunk_count = 0
+        for batch in iter_batches(chunk_stream, settings.ingestion_batch_chunks):
+            chunk_count += len(batch)
+            progress(chunks_total=chunk_count)
+            yield batch
+
+    @staticmethod
+    def _plan_batch(ingestion: Dict, chunks: List[str]) -> Dict:
+        """
+        Assign the batch's chunk IDs and indexes and sort the chunks into
+        new (to embed), moved (stored before at another index) and reused.
+
+        Returns:
+            Dictionary with ids, indexes, and the batch positions of the
+            new and moved chunks
+        """
+        plan = {"ids": [], "indexes": [], "new": [], "moved": []}
+        first_index = len(ingestion["chunk_ids"])
+        for i, chunk in enumerate(chunks):
+            occurrence = 0
+            chunk_id = chunk_id_for(ingestion["file_name"], chunk, occurrence)
+            # The same text twice in one file: the nth occurrence gets its own ID
+            while chunk_id in ingestion["seen_ids"]:
+                occurrence += 1
+                chunk_id = chunk_id_for(ingestion["file_name"], chunk, occurrence)
+            ingestion["seen_ids"].add(chunk_id)
+
+            chunk_index = first_index + i
+            previous_index = ingestion["previous_indexes"].get(chunk_id)
+            if previous_index is None:
+                plan["new"].append(i)
+            elif previous_index != chunk_index:
+                plan["moved"].append(i)
+            plan["ids"].append(chunk_id)
+            plan["indexes"].append(chunk_index)
+        return plan
+    def _embed_batch(self, chunks: List[str]) -> Optional[List[List[float]]]:
+        """
+        Embed a batch of chunks, or None to let the vector store embed them.
+        """
+        try:
+            if self.embedding_service.is_available():
+                return self.embedding_service.generate_embeddings(chunks)
+            logger.info("Embedding backend unavailable (no Gemini API key), using ChromaDB default embeddings")
         except Exception as e:
-            logger.warning(f"Failed to generate Gemini embeddings: {str(e)}. Using ChromaDB default embeddings.")
-            embeddings = None
-        
-        # Create unique IDs for each chunk
-        chunk_ids = [f"{uuid.uuid4()}" for _ in chunks]
-        
-        # Create metadata for each chunk
-        file_name = os.path.basename(file_path)
-        metadatas = [
-            {
-                "file_path": file_path,
-                "file_name": file_name,
-                "chunk_index": i,
-                "total_chunks": len(chunks)
-            }
-            for i in range(len(chunks))
-        ]
-        
+            logger.warning(f"Failed to generate embeddings: {str(e)}. Using ChromaDB default embeddings.")
+        return None
+
+    async def _embed_batch_async(self, chunks: List[str]) -> Optional[List[List[float]]]:
+        try:
+            if self.embedding_service.is_available():
+                return await self.embedding_service.generate_embeddings_async(chunks)
+            logger.info("Embedding backend unavailable (no Gemini API key), using ChromaDB default embeddings")
+        except Exception as e:
+            logger.warning(f"Failed to generate embeddings: {str(e)}. Using ChromaDB default embeddings.")
+        return None
+
+    def _store_batch(
+        self,
+        ingestion: Dict,
+        chunks: List[str],
+        plan: Dict,
+        embeddings: Optional[List[List[float]]],
+        progress: Callable[..., None],
+    ):
+        """
+        Write the new chunks of a batch and rewrite the moved ones with their
+        stored embeddings. The reused ones are left alone until the file is
+        done (see _refresh_unmoved_chunks).
+        """
+        def pick(values: List, positions: List[int]) -> List:
+            return [values[i] for i in positions]
+
+        new, moved = plan["new"], plan["moved"]
+        ingestion["embedded"] += len(new)
+        progress(stage="storing", chunks_embedded=ingestion["embedded"])
+        if new:
+            new_ids = pick(plan["ids"], new)
+            # Recorded first, so a failed write is rolled back too
+            ingestion["added_ids"].extend(new_ids)
+            self._write_chunks(ingestion, new_ids, pick(chunks, new), pick(plan["indexes"], new), embeddings)
+        if moved:
+            self._move_chunks(ingestion, pick(plan["ids"], moved), pick(chunks, moved), pick(plan["indexes"], moved))
+        unmoved = sorted(set(range(len(chunks))) - set(new) - set(moved))
+        ingestion["unmoved_ids"].extend(pick(plan["ids"], unmoved))
+        ingestion["unmoved_indexes"].extend(pick(plan["indexes"], unmoved))
+
+        ingestion["reused"] += len(chunks) - len(new)
+        ingestion["chunk_ids"].extend(plan["ids"])
+        if ingestion["chunks"] is not None:
+            ingestion["chunks"].extend(chunks)
+        progress(chunks_reused=ingestion["reused"], chunks_stored=len(ingestion["chunk_ids"]))
+
+    def _move_chunks(self, ingestion: Dict, chunk_ids: List[str], chunks: List[str], chunk_indexes: List[int]):
+        """
+        Rewrite stored chunks whose position in the file changed, reusing
+        their stored embeddings (chunks missing from the store are embedded).
+        """
+        stored = self.vector_store.get_documents(chunk_ids, include=["embeddings", "metadatas"])
+        for chunk_id, metadata in zip(stored["ids"], stored["metadatas"]):
+            # Recorded first, so a failed rewrite is rolled back too
+            ingestion["moved_metadatas"].setdefault(chunk_id, metadata)
+        embedding_by_id = {
+            chunk_id: [float(value) for value in embedding]
+            for chunk_id, embedding in zip(stored["ids"], stored["embeddings"])
+            if embedding is not None
+        }
+        found = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id in embedding_by_id]
+        missing = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id not in embedding_by_id]
+        if found:
+            self._write_chunks(
+                ingestion,
+                [chunk_ids[i] for i in found],
+                [chunks[i] for i in found],
+                [chunk_indexes[i] for i in found],
+                [embedding_by_id[chunk_ids[i]] for i in found],
+            )
+        if missing:
+            missing_chunks = [chunks[i] for i in missing]
+            # Not in the store (for the previous version either): removed on rollback
+            ingestion["added_ids"].extend(chunk_ids[i] for i in missing)
+            ingestion["embedded"] += len(missing)
+            ingestion["reused"] -= len(missing)
+            self._write_chunks(
+                ingestion,
+                [chunk_ids[i] for i in missing],
+                missing_chunks,
+                [chunk_indexes[i] for i in missing],
+                self._embed_batch(missing_chunks),
+            )
+
+    def _write_chunks(
+        self,
+        ingestion: Dict,
+        chunk_ids: List[str],
+        chunks: List[str],
+        chunk_indexes: List[int],
+        embeddings: Optional[List[List[float]]],
+    ):
+        """
+        Write chunks (and their embeddings, if any) to the vector store and
+        register them in the document registry and the BM25 index, so they
+        are searchable right away. Chunks stored before under the same ID
+        are replaced.
+        """
+        metadatas = [self._chunk_metadata(ingestion, chunk_index) for chunk_index in chunk_indexes]
+
         # Store in vector store (if embeddings is None, ChromaDB will generate them)
         self.vector_store.add_documents(
             ids=chunk_ids,
@@ -103,12 +478,141 @@ class DocumentService:
             metadatas=metadatas,
             embeddings=embeddings
         )
-        
+
         # Persist to disk
         self.vector_store.persist()
-        
-        logger.info(f"Stored {len(chunks)} chunks in vector store for {file_name}")
-        return (chunks, chunk_ids)
-        
 
+        self.registry.register_file(
+            ingestion["file_name"],
+            chunk_ids,
+            size_bytes=ingestion["file_size"],
+            ingested_at=ingestion["ingested_at"],
+            chunk_indexes=chunk_indexes,
+        )
+        if self.lexical_index is not None:
+            self.lexical_index.add_documents(chunk_ids, chunks, metadatas)
+
+    @staticmethod
+    def _chunk_metadata(ingestion: Dict, chunk_index: int) -> Dict:
+        return {
+            "file_path": ingestion["file_path"],
+            "file_name": ingestion["file_name"],
+            "file_type": ingestion["file_type"],
+            "chunk_index": chunk_index,
+            "file_size": ingestion["file_size"],
+            "ingested_at": ingestion["ingested_at"],
+            "content_sha256": ingestion["content_hash"]
+        }
+
+    def _refresh_unmoved_chunks(self, ingestion: Dict):
+        """
+        Give the chunks reused at their old index the metadata of this
+        ingestion (ingested_at, content_sha256, ...), and the file its new
+        ingested_at in the registry and the BM25 index, so filters see every
+        chunk of the file as ingested now. Done once the file is stored, so
+        a failed ingestion leaves the previous version's metadata as it was.
+        """
+        chunk_ids, chunk_indexes = ingestion["unmoved_ids"], ingestion["unmoved_indexes"]
+        batch_size = max(1, settings.ingestion_batch_chunks)
+        for start in range(0, len(chunk_ids), batch_size):
+            self.vector_store.update_metadata(
+                chunk_ids[start:start + batch_size],
+                [self._chunk_metadata(ingestion, chunk_index) for chunk_index in chunk_indexes[start:start + batch_size]],
+            )
+        if chunk_ids:
+            self.vector_store.persist()
+        self.registry.register_file(
+            ingestion["file_name"],
+            [],
+            size_bytes=ingestion["file_size"],
+            ingested_at=ingestion["ingested_at"],
+        )
+        if self.lexical_index is not None:
+            self.lexical_index.update_file(ingestion["file_name"], self._chunk_metadata(ingestion, 0))
+
+    def _roll_back(self, ingestion: Dict):
+        """
+        Undo an ingestion that failed: remove the chunks it added, and give
+        the chunks it moved their previous metadata and chunk index back.
+        The previous version of the file is left as it was.
+        """
+        chunk_ids = ingestion["added_ids"]
+        moved = ingestion["moved_metadatas"]
+        if not chunk_ids and not moved:
+            return
+        if chunk_ids:
+            self.vector_store.delete_documents(chunk_ids)
+            self.registry.remove_chunks(ingestion["file_name"], chunk_ids)
+            if self.lexical_index is not None:
+                self.lexical_index.delete_documents(chunk_ids)
+
+        previous = ingestion["previous"]
+        if previous is not None:
+            moved_ids = list(moved)
+            if moved_ids:
+                self.vector_store.update_metadata(moved_ids, [moved[chunk_id] for chunk_id in moved_ids])
+                self.vector_store.persist()
+            # Also puts back the file's size and ingested_at
+            self.registry.register_file(
+                ingestion["file_name"],
+                moved_ids,
+                size_bytes=previous["size_bytes"],
+                ingested_at=previous["ingested_at"],
+                chunk_indexes=[ingestion["previous_indexes"][chunk_id] for chunk_id in moved_ids],
+            )
+            if self.lexical_index is not None:
+                self.lexical_index.update_file(
+                    ingestion["file_name"],
+                    {"file_type": ingestion["file_type"], "ingested_at": previous["ingested_at"]},
+                )
+        bump_corpus_version()
+        logger.warning(
+            f"Rolled back a failed ingestion of {ingestion['file_name']}: removed {len(chunk_ids)} chunks, "
+            f"restored {len(moved)} moved chunks"
+        )
+
+    def _finish_ingestion(self, ingestion: Dict, ingest_start: float) -> Optional[Dict]:
+        """
+        Delete the chunks of the previous version that are no longer in the
+        file, refresh the metadata of the reused ones and record the file's
+        content hash.
+        """
+        chunk_count = len(ingestion["chunk_ids"])
+        if not chunk_count:
+            logger.error(f"Failed to parse file:{ingestion['file_path']} (no text)")
+            return None
+
+        stale_ids = [chunk_id for chunk_id in ingestion["previous_indexes"] if chunk_id not in ingestion["seen_ids"]]
+        if stale_ids:
+            self.vector_store.delete_documents(stale_ids)
+            self.registry.remove_chunks(ingestion["file_name"], stale_ids)
+            if self.lexical_index is not None:
+                self.lexical_index.delete_documents(stale_ids)
+        self._refresh_unmoved_chunks(ingestion)
+        self.registry.set_content_hash(ingestion["file_name"], ingestion["content_hash"])
+        # New content can change answers, so invalidate the semantic answer
+        # cache: once per file, after its last batch
+        bump_corpus_version()
+
+        if ingestion["embedded"] and self.embedding_service.is_available():
+            logger.info(f"Using {self.embedding_service.backend_name} embeddings")
+        logger.info(
+            f"{ingestion['file_name']}: {ingestion['reused']} chunks reused, "
+            f"{ingestion['embedded']} embedded, {len(stale_ids)} stale chunks deleted"
+        )
+        self._log_ingest(ingestion["file_name"], chunk_count, ingest_start)
+        return {
+            "chunk_count": chunk_count,
+            "chunk_ids": ingestion["chunk_ids"],
+            "chunks": ingestion["chunks"],
+            "chunks_reused": ingestion["reused"],
+            "chunks_embedded": ingestion["embedded"],
+            "chunks_deleted": len(stale_ids),
+            "unchanged": False,
+        }
 
+    @staticmethod
+    def _log_ingest(file_path: str, chunk_count: int, ingest_start: float):
+        elapsed = time.perf_counter() - ingest_start
+        throughput = chunk_count / elapsed if elapsed > 0 else float(chunk_count)
+        logger.info(f"Stored {chunk_count} chunks in vector store for {os.path.basename(file_path)} in {elapsed:.2f}s ({throughput:.1f} chunks/sec)")
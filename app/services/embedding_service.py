@@ -1,7 +1,10 @@
-from typing import List
+from typing import List, Optional, Dict, Tuple
+import asyncio
 import logging
+import time
 
-from app.core.llm.gemini_client import GeminiClient
+from app.core.rag.embeddings import EmbeddingBackend, create_embedding_backend
+from app.core.rag.embedding_cache import EmbeddingCache, get_embedding_cache
 
 logger=logging.getLogger(__name__)
 
@@ -9,30 +12,130 @@ class EmbeddingService:
 
      """
     Service for generating embeddings from text.
+    The embedding backend (Gemini or local) is chosen by settings.embedding_backend.
     """
-     def __init__(self):
-        self.gemini_client=GeminiClient()
-    
-     def generate_embeddings(self,texts:List[str])->List[List[float]]:
+     def __init__(self,backend:Optional[EmbeddingBackend]=None,gemini_client=None):
+        self.backend=backend or create_embedding_backend(gemini_client=gemini_client)
+        self.cache=get_embedding_cache()
+
+     @property
+     def backend_name(self)->str:
+        return self.backend.name
+
+     def is_available(self)->bool:
+         """
+        Whether the configured backend can embed (e.g. Gemini needs an API key).
+        """
+         return self.backend.is_available()
+
+     def generate_embeddings(self,texts:List[str],batch_size:Optional[int]=None)->List[List[float]]:
          """
         Generate embeddings for a list of texts.
-        
+
+        Cached embeddings are served from the embedding cache; only the
+        cache misses are sent to the embedding backend.
+
         Args:
             texts: List of text strings to embed
-            
+            batch_size: Optional number of texts per API call
+
         Returns:
             List of embedding vectors
         """
          if not texts:
             return []
-         
-         logger.info(f"Generating embeddings for {len(texts)} texts")
-         embeddings = self.gemini_client.embed(texts)
-         logger.info(f"Successfully generated {len(embeddings)} embeddings")
-        
-         return embeddings
 
+         if self.cache is None:
+            return self._embed_uncached(texts, batch_size)
+
+         keys, cached, missing = self._lookup(texts)
+         if missing:
+            new_embeddings = self._embed_uncached(list(missing.values()), batch_size)
+            cached.update(self._store(missing, new_embeddings))
+
+         return [cached[key] for key in keys]
+
+     async def generate_embeddings_async(self,texts:List[str],batch_size:Optional[int]=None)->List[List[float]]:
+         """
+        Async version of generate_embeddings(). Cache I/O runs in a worker
+        thread and cache misses are embedded with the backend's embed_async.
+
+        Args:
+            texts: List of text strings to embed
+            batch_size: Optional number of texts per API call
+
+        Returns:
+            List of embedding vectors
+        """
+         if not texts:
+            return []
 
+         if self.cache is None:
+            return await self._embed_uncached_async(texts, batch_size)
 
+         keys, cached, missing = await asyncio.to_thread(self._lookup, texts)
+         if missing:
+            new_embeddings = await self._embed_uncached_async(list(missing.values()), batch_size)
+            cached.update(await asyncio.to_thread(self._store, missing, new_embeddings))
 
+         return [cached[key] for key in keys]
 
+     def _lookup(self,texts:List[str])->Tuple[List[str],Dict[str,List[float]],Dict[str,str]]:
+         """
+        Split texts into cached embeddings and texts that still need embedding.
+
+        Returns:
+            Tuple of (keys in input order, cached key -> embedding, missing key -> text)
+        """
+         keys = [EmbeddingCache.make_key(text, self.backend.name) for text in texts]
+         cached = self.cache.get_many(keys)
+
+         # Embed each missing text once, even if it appears several times in the input
+         missing: Dict[str, str] = {}
+         for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+         logger.info(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} texts cached")
+         return keys, cached, missing
+
+     def _store(self,missing:Dict[str,str],embeddings:List[List[float]])->Dict[str,List[float]]:
+         """
+        Write freshly generated embeddings to the cache.
+        """
+         fresh = dict(zip(missing.keys(), embeddings))
+         self.cache.put_many(fresh)
+         return fresh
+
+     def _embed_uncached(self,texts:List[str],batch_size:Optional[int]=None)->List[List[float]]:
+         """
+        Send texts to the embedding backend and log the throughput.
+        """
+         logger.info(f"Generating {self.backend.name} embeddings for {len(texts)} texts")
+         start_time = time.perf_counter()
+         embeddings = self.backend.embed(texts, batch_size=batch_size)
+         self._log_throughput(len(embeddings), time.perf_counter() - start_time)
+         return embeddings
+
+     async def _embed_uncached_async(self,texts:List[str],batch_size:Optional[int]=None)->List[List[float]]:
+         """
+        Async version of _embed_uncached().
+        """
+         logger.info(f"Generating {self.backend.name} embeddings for {len(texts)} texts")
+         start_time = time.perf_counter()
+         embeddings = await self.backend.embed_async(texts, batch_size=batch_size)
+         self._log_throughput(len(embeddings), time.perf_counter() - start_time)
+         return embeddings
+
+     @staticmethod
+     def _log_throughput(count:int,elapsed:float):
+         throughput = count / elapsed if elapsed > 0 else float(count)
+         logger.info(f"Successfully generated {count} embeddings in {elapsed:.2f}s ({throughput:.1f} chunks/sec)")
+
+     def cache_stats(self)->Dict:
+         """
+        Get embedding cache hit/miss counters.
+        """
+         if self.cache is None:
+            return {"enabled": False}
+         return {"enabled": True, **self.cache.stats()}
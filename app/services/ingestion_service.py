@@ -0,0 +1,224 @@
+import os
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.config import settings
+from app.core.ingestion_jobs import (
+    IngestionJobStore,
+    STATUS_QUEUED,
+    STATUS_RUNNING,
+    STATUS_COMPLETED,
+    STATUS_FAILED,
+)
+from app.services.document_service import DocumentService
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionQueueFullError(Exception):
+    """
+    Raised when too many ingestion jobs are already pending.
+    """
+    def __init__(self, max_pending: int):
+        super().__init__(f"Ingestion queue is full ({max_pending} pending jobs), retry later")
+        self.max_pending = max_pending
+
+
+class IngestionService:
+    """
+    Background ingestion: uploads become jobs that a bounded pool of
+    asyncio workers (settings.ingestion_workers) processes one at a time
+    each. Jobs live in the IngestionJobStore, so queued jobs, and jobs
+    interrupted by a shutdown, run again after a restart. Jobs for the
+    same file name run one at a time, each diffing against the version the
+    previous one stored.
+    """
+    def __init__(self, job_store: IngestionJobStore, document_service: DocumentService):
+        self.job_store = job_store
+        self.document_service = document_service
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._finished: Dict[str, asyncio.Event] = {}
+        # file_name -> [lock, jobs holding or waiting for it]
+        self._file_locks: Dict[str, list] = {}
+
+    async def start(self):
+        """
+        Requeue unfinished jobs from a previous run and start the workers.
+        Must be called from the event loop.
+        """
+        if self._workers:
+            return
+        pruned = self.job_store.prune(settings.ingestion_job_retention_seconds)
+        if pruned:
+            logger.info(f"Pruned {pruned} finished ingestion jobs")
+
+        # No await until the workers exist, so a concurrent submit() can't enqueue a job twice
+        self._queue = asyncio.Queue()
+        requeued = 0
+        for job in self.job_store.unfinished():
+            if job["status"] == STATUS_RUNNING:
+                self.job_store.update(job["job_id"], status=STATUS_QUEUED, stage=STATUS_QUEUED)
+            self._queue.put_nowait(job["job_id"])
+            requeued += 1
+
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"ingestion-worker-{i}")
+            for i in range(max(1, settings.ingestion_workers))
+        ]
+        logger.info(f"Started {len(self._workers)} ingestion workers, {requeued} jobs pending from a previous run")
+
+    async def stop(self):
+        """
+        Stop the workers. Jobs they were running stay "running" in the store
+        and are requeued by the next start().
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        logger.info("Ingestion workers stopped")
+
+    def submit(
+        self,
+        file_name: str,
+        file_path: str,
+        content_sha256: Optional[str] = None,
+        size_bytes: int = 0,
+        include_chunks: bool = False,
+    ) -> Dict:
+        """
+        Queue an uploaded file for ingestion.
+
+        Args:
+            file_name: Original file name
+            file_path: Spooled upload; the job deletes it when finished
+            content_sha256: SHA-256 of the file
+            size_bytes: File size
+            include_chunks: Keep the chunk texts in the job result
+
+        Returns:
+            The queued job
+
+        Raises:
+            IngestionQueueFullError: If settings.ingestion_max_pending jobs are pending
+        """
+        if self.job_store.count_unfinished() >= settings.ingestion_max_pending:
+            raise IngestionQueueFullError(settings.ingestion_max_pending)
+        job = self.job_store.create(
+            file_name=file_name,
+            file_path=file_path,
+            content_sha256=content_sha256,
+            size_bytes=size_bytes,
+            include_chunks=include_chunks,
+        )
+        # Before start() the job is only persisted; start() picks it up
+        if self._queue is not None:
+            self._queue.put_nowait(job["job_id"])
+        logger.info(f"Queued ingestion job {job['job_id']} for {file_name}")
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        return self.job_store.get(job_id)
+
+    async def wait(self, job_id: str) -> Optional[Dict]:
+        """
+        Wait until a job has completed or failed.
+
+        Returns:
+            The finished job, or None if it doesn't exist
+        """
+        job = self.job_store.get(job_id)
+        if job is None or job["status"] in (STATUS_COMPLETED, STATUS_FAILED):
+            return job
+        await self._finished.setdefault(job_id, asyncio.Event()).wait()
+        return self.job_store.get(job_id)
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion worker error on job {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        """
+        Process one job and record its outcome.
+        """
+        job = self.job_store.get(job_id)
+        if job is None or job["status"] != STATUS_QUEUED:
+            return
+        # Stays queued while another job stores the same file
+        async with self._file_lock(job["file_name"]):
+            await self._run_locked(job)
+
+    @asynccontextmanager
+    async def _file_lock(self, file_name: str) -> AsyncIterator[None]:
+        entry = self._file_locks.get(file_name)
+        if entry is None:
+            entry = self._file_locks[file_name] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._file_locks[file_name]
+
+    async def _run_locked(self, job: Dict):
+        job_id = job["job_id"]
+        self.job_store.update(job_id, status=STATUS_RUNNING, stage="parsing", started_at=time.time())
+
+        def progress(**updates):
+            self.job_store.update(job_id, **updates)
+
+        start = time.perf_counter()
+        try:
+            if not os.path.exists(job["file_path"]):
+                raise FileNotFoundError("Uploaded file is missing from the spool directory")
+            result = await self.document_service.store_document_in_vector_store_async(
+                job["file_path"],
+                file_name=job["file_name"],
+                content_hash=job["content_sha256"],
+                progress=progress,
+                keep_chunks=job["include_chunks"],
+            )
+            if not result:
+                raise ValueError("Failed to process and store document")
+            self.job_store.update(
+                job_id,
+                status=STATUS_COMPLETED,
+                stage=STATUS_COMPLETED,
+                chunk_count=result["chunk_count"],
+                chunks=result["chunks"],
+                chunks_embedded=result["chunks_embedded"],
+                chunks_reused=result["chunks_reused"],
+                chunks_deleted=result["chunks_deleted"],
+                finished_at=time.time(),
+            )
+            logger.info(
+                f"Ingestion job {job_id} completed in {(time.perf_counter() - start):.2f}s - {result['chunk_count']} chunks "
+                f"({result['chunks_reused']} reused, {result['chunks_embedded']} embedded, {result['chunks_deleted']} deleted)"
+            )
+        except asyncio.CancelledError:
+            # Left "running" with its file in place; requeued on the next start
+            raise
+        except Exception as e:
+            self.job_store.update(job_id, status=STATUS_FAILED, stage=STATUS_FAILED, error=str(e), finished_at=time.time())
+            logger.error(f"Ingestion job {job_id} failed: {str(e)}")
+
+        if os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+        event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
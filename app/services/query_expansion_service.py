@@ -1,4 +1,3 @@
-##will update later if i want based on the usecase currently putting on hold
 from typing import List, Optional
 import logging
 from app.core.llm.gemini_client import GeminiClient
@@ -14,8 +13,8 @@ class QueryExpansionService:
     This service uses LLM to generate alternative query formulations,
     which helps find relevant documents even if they use different wording.
     """
-    def __init__(self):
-        self.gemini_client=GeminiClient()
+    def __init__(self,gemini_client: Optional[GeminiClient]=None):
+        self.gemini_client=gemini_client or GeminiClient()
     
     def expand_query(self,original_query: str,num_expansions: int = 3)-> List[str]:
         """
@@ -35,7 +34,32 @@ class QueryExpansionService:
             return [original_query]
 
         try:
-            expansion_prompt=f"""you are search query expert.Given a user's question,generate {num_expansions} alternative ways to ask the same question or search for the same information.
+            response=self.gemini_client.chat(self._build_prompt(original_query,num_expansions))
+            return self._parse_response(original_query,response,num_expansions)
+        except Exception as e:
+            logger.error(f"Failed to expand query: {str(e)}. Returning original query only.")
+            return [original_query]
+
+    async def expand_query_async(self,original_query: str,num_expansions: int = 3)-> List[str]:
+        """
+        Async version of expand_query().
+        """
+        logger.info(f"Expanding query: {original_query}")
+
+        if not settings.gemini_api_key:
+            logger.warning("No Gemini Api Key found. Returning original query only.")
+            return [original_query]
+
+        try:
+            response=await self.gemini_client.chat_async(self._build_prompt(original_query,num_expansions))
+            return self._parse_response(original_query,response,num_expansions)
+        except Exception as e:
+            logger.error(f"Failed to expand query: {str(e)}. Returning original query only.")
+            return [original_query]
+
+    @staticmethod
+    def _build_prompt(original_query: str,num_expansions: int)->str:
+        return f"""you are search query expert.Given a user's question,generate {num_expansions} alternative ways to ask the same question or search for the same information.
             original question:{original_query}
             Generate {num_expansions} alternative queries that:
             1.Use different wording but mean the same thing
@@ -50,22 +74,20 @@ Explain machine learning
 Machine learning definition
 
 Alternative queries:"""
-            response=self.gemini_client.chat(expansion_prompt)
-            expanded_queries=[
-                line.strip()
-                for line in response.split('\n')
-                if line.strip() and not line.strip().startswith(('Alternative', 'Example', 'Original'))
-            ]
-
-            expanded_queries=expanded_queries[:num_expansions]
-
-            all_queries=[original_query]+expanded_queries
-            logger.info(f"Generated {len(expanded_queries)} expanded queries")
-            return all_queries
-        
-        except Exception as e:
-            logger.error(f"Failed to expand query: {str(e)}. Returning original query only.")
-            return [original_query]
+
+    @staticmethod
+    def _parse_response(original_query: str,response: str,num_expansions: int)->List[str]:
+        expanded_queries=[
+            line.strip()
+            for line in response.split('\n')
+            if line.strip() and not line.strip().startswith(('Alternative', 'Example', 'Original'))
+        ]
+
+        expanded_queries=expanded_queries[:num_expansions]
+
+        all_queries=[original_query]+expanded_queries
+        logger.info(f"Generated {len(expanded_queries)} expanded queries")
+        return all_queries
 
 
 
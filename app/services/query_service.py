@@ -1,125 +1,799 @@
-from typing import List,Dict,Optional
+from typing import List,Dict,Optional,AsyncIterator
+import asyncio
 import logging
-from app.core.rag.vector_store import ChromaVectorStore
+import time
+import numpy as np
+from app.core.rag.vector_store import VectorStore, create_vector_store
+from app.core.rag.retrieval import BM25Index, get_bm25_index, reciprocal_rank_fusion
+from app.core.rag.document_registry import DocumentRegistry, get_document_registry
 from app.services.embedding_service import EmbeddingService
+from app.services.query_expansion_service import QueryExpansionService
 from app.core.llm.gemini_client import GeminiClient
+from app.core.rag.semantic_cache import get_semantic_cache, get_corpus_version
+from app.core.rag.context_packer import ContextPacker
+from app.core.rag.reranking import Reranker, get_reranker
+from app.core.rag.filters import filter_key
 from app.config import settings
 
 logger=logging.getLogger(__name__)
 
+RETRIEVAL_STANDARD="standard"
+RETRIEVAL_MULTI_QUERY="multi_query"
+
 class QueryService:
     """
     Service for querying documents using RAG (Retrieval-Augmented Generation).
+
+    Retrieval modes:
+        - "standard": one dense search for the question.
+        - "multi_query": the question plus LLM-generated rewrites are embedded
+          in one batch, searched with one vector store call, and fused with
+          reciprocal-rank fusion.
+
+    In both modes a BM25 ranking per query (settings.bm25_enabled) is fused
+    with the dense rankings, so exact terms like part numbers still match.
+    The fused candidates (settings.rerank_candidates deep) are then rescored
+    locally and diversified with MMR before the top n_results are used.
+
+    query_batch_async() answers many questions at once: one embedding call,
+    one vector store call for every query of the batch, and answers
+    generated concurrently (settings.query_batch_concurrency at a time).
+
+    An optional where filter (see app.core.rag.filters) scopes a query: it
+    is pushed down to the vector store, evaluated inside the BM25 index to
+    limit the chunks it scores, and is part of the semantic cache key.
     """
-    def __init__(self):
-        self.vector_store=ChromaVectorStore()
-        self.embedding_service=EmbeddingService()
-        self.gemini_client=GeminiClient()
+    def __init__(
+        self,
+        vector_store: Optional[VectorStore]=None,
+        embedding_service: Optional[EmbeddingService]=None,
+        gemini_client: Optional[GeminiClient]=None,
+        query_expansion_service: Optional[QueryExpansionService]=None,
+        lexical_index: Optional[BM25Index]=None,
+        reranker: Optional[Reranker]=None,
+        registry: Optional[DocumentRegistry]=None,
+    ):
+        # Shared instances are injected by app.dependencies; build our own otherwise
+        self.gemini_client=gemini_client or GeminiClient()
+        self.vector_store=vector_store or create_vector_store()
+        self.embedding_service=embedding_service or EmbeddingService(gemini_client=self.gemini_client)
+        self.query_expansion_service=query_expansion_service or QueryExpansionService(gemini_client=self.gemini_client)
+        self.answer_cache=get_semantic_cache()
+        self.lexical_index=lexical_index or get_bm25_index()
+        self.registry=registry or get_document_registry()
+        self.reranker=reranker or get_reranker()
+        self.context_packer=ContextPacker(
+            token_budget=settings.context_token_budget,
+            max_overlap_chars=settings.context_max_overlap_chars
+        )
 
-    def query(self,question:str,n_results: int=5)->Dict:
+    def query(self,question:str,n_results: int=5,retrieval_mode: str=RETRIEVAL_STANDARD,where: Optional[Dict]=None)->Dict:
         """
         Query documents using RAG (Retrieval-Augmented Generation).
-        
+
         Args:
             question: The user's question
             n_results: Number of relevant chunks to retrieve (default: 5)
-        
+            retrieval_mode: "standard" or "multi_query"
+            where: Optional metadata filter limiting which chunks are searched
+
         Returns:
             Dictionary containing:
                 - answer: AI-generated answer
                 - sources: List of relevant document chunks with metadata
+                - metrics: Per-stage latencies in milliseconds
         """
 
         logger.info(f"Processing query:{question}")
-    
-        # Try to generate Gemini embeddings, fall back to ChromaDB default if it fails
-        question_embedding = None
+        metrics: Dict[str, float] = {}
+
+        question_embedding = self._embed_question(question)
+        corpus_version = get_corpus_version()
+        scope = self._cache_scope(n_results, retrieval_mode, where)
+        cached = self._cached_answer(question_embedding, scope, corpus_version)
+        if cached:
+            return cached
+
+        queries = [question]
+        if retrieval_mode == RETRIEVAL_MULTI_QUERY:
+            stage_start = time.perf_counter()
+            queries = self.query_expansion_service.expand_query(question)
+            metrics["query_expansion_ms"] = self._elapsed_ms(stage_start)
+
+        sources = self._retrieve(queries, n_results, question_embedding, metrics, where)
+        if not sources:
+            return self._no_documents_response(metrics)
+
+        prompt = self._build_prompt(question, sources, metrics)
+
+        # Try to generate answer with Gemini, but provide fallback if it fails
         try:
             if settings.gemini_api_key:
-                question_embedding = self.embedding_service.generate_embeddings([question])[0]
-                logger.info("Using Gemini embeddings for query")
+                stage_start = time.perf_counter()
+                answer = self.gemini_client.chat(prompt)
+                metrics["generation_ms"] = self._elapsed_ms(stage_start)
+                logger.info(f"Generated answer for query: {question[:50]}...")
+                self._remember_answer(question_embedding, scope, corpus_version, answer, sources)
+            else:
+                answer = self._no_api_key_answer(sources)
         except Exception as e:
-            logger.warning(f"Failed to generate Gemini embeddings: {str(e)}. Using ChromaDB default embeddings.")
-            question_embedding = None
+            logger.warning(f"Failed to generate answer with Gemini: {str(e)}")
+            answer = self._api_failure_answer(question, sources)
 
-        # Query vector store - if we have Gemini embedding, use it; otherwise ChromaDB will use its default
-        if question_embedding:
+        return {
+            "answer": answer,
+            "sources": sources,
+            "metrics": metrics
+        }
+
+    async def query_async(self,question:str,n_results: int=5,retrieval_mode: str=RETRIEVAL_STANDARD,where: Optional[Dict]=None)->Dict:
+        """
+        Async version of query(). Embedding and generation are awaited and the
+        blocking Chroma search runs in a worker thread, so the event loop can
+        serve other requests while this one waits.
+
+        Args:
+            question: The user's question
+            n_results: Number of relevant chunks to retrieve (default: 5)
+            retrieval_mode: "standard" or "multi_query"
+            where: Optional metadata filter limiting which chunks are searched
+
+        Returns:
+            Same dictionary as query()
+        """
+
+        logger.info(f"Processing query:{question}")
+        metrics: Dict[str, float] = {}
+
+        question_embedding = await self._embed_question_async(question)
+        corpus_version = get_corpus_version()
+        scope = self._cache_scope(n_results, retrieval_mode, where)
+        cached = self._cached_answer(question_embedding, scope, corpus_version)
+        if cached:
+            return cached
+
+        queries = await self._expand_async(question, retrieval_mode, metrics)
+        sources = await asyncio.to_thread(self._retrieve, queries, n_results, question_embedding, metrics, where)
+        return await self._answer_async(question, sources, question_embedding, scope, corpus_version, metrics)
+
+    async def query_batch_async(self,requests:List[Dict])->List[Dict]:
+        """
+        Answer many questions at once. All questions are embedded in one
+        call and all their queries are searched with one vector store call;
+        answers are generated concurrently, at most
+        settings.query_batch_concurrency at a time.
+
+        Args:
+            requests: Dictionaries with "question" and optionally "n_results",
+                "retrieval_mode" and "where"
+
+        Returns:
+            One dictionary per request, in order: the same dictionary as
+            query(), or {"error": ...} if that request failed
+        """
+        logger.info(f"Processing batch of {len(requests)} queries")
+        questions = [request["question"] for request in requests]
+        n_results = [request.get("n_results") or 5 for request in requests]
+        modes = [request.get("retrieval_mode") or RETRIEVAL_STANDARD for request in requests]
+        wheres = [request.get("where") for request in requests]
+        metrics = [{} for _ in requests]
+        results: List[Optional[Dict]] = [None] * len(requests)
+
+        stage_start = time.perf_counter()
+        question_embeddings = await self._embed_questions_async(questions)
+        embedding_ms = self._elapsed_ms(stage_start)
+        corpus_version = get_corpus_version()
+        scopes = [self._cache_scope(n, mode, where) for n, mode, where in zip(n_results, modes, wheres)]
+
+        pending = []
+        for i in range(len(requests)):
+            metrics[i]["embedding_ms"] = embedding_ms
+            results[i] = self._cached_answer(question_embeddings[i], scopes[i], corpus_version)
+            if results[i] is None:
+                pending.append(i)
+
+        semaphore = asyncio.Semaphore(settings.query_batch_concurrency)
+
+        async def expand(i:int)->List[str]:
+            async with semaphore:
+                return await self._expand_async(questions[i], modes[i], metrics[i])
+
+        expanded = await asyncio.gather(*(expand(i) for i in pending), return_exceptions=True)
+        searchable = []
+        for i, queries in zip(pending, expanded):
+            if isinstance(queries, Exception):
+                results[i] = {"error": f"Failed to process query: {str(queries)}"}
+            else:
+                searchable.append((i, queries))
+
+        if searchable:
+            try:
+                sources_per_item = await asyncio.to_thread(
+                    self._retrieve_batch,
+                    [queries for _, queries in searchable],
+                    [n_results[i] for i, _ in searchable],
+                    [question_embeddings[i] for i, _ in searchable],
+                    [metrics[i] for i, _ in searchable],
+                    [wheres[i] for i, _ in searchable],
+                )
+            except Exception as e:
+                logger.error(f"Batch retrieval failed: {str(e)}")
+                for i, _ in searchable:
+                    results[i] = {"error": f"Failed to process query: {str(e)}"}
+                searchable, sources_per_item = [], []
+
+            async def answer(i:int, sources:List[Dict])->Dict:
+                try:
+                    async with semaphore:
+                        return await self._answer_async(
+                            questions[i], sources, question_embeddings[i], scopes[i], corpus_version, metrics[i]
+                        )
+                except Exception as e:
+                    logger.error(f"Error processing batch query {i}: {str(e)}")
+                    return {"error": f"Failed to process query: {str(e)}"}
+
+            answers = await asyncio.gather(*(
+                answer(i, sources) for (i, _), sources in zip(searchable, sources_per_item)
+            ))
+            for (i, _), result in zip(searchable, answers):
+                results[i] = result
+
+        return results
+
+    async def query_stream_async(self,question:str,n_results: int=5,retrieval_mode: str=RETRIEVAL_STANDARD,where: Optional[Dict]=None)->AsyncIterator[Dict]:
+        """
+        Streaming version of query_async().
+
+        Yields events in order:
+            - {"event": "sources", "data": {"question": ..., "sources": [...]}}
+            - {"event": "token", "data": {"text": ...}} for every piece of the answer
+            - {"event": "done", "data": {"time_to_first_token_ms": ..., "total_time_ms": ..., ...}}
+        If generation fails after some tokens were sent, an "error" event is
+        yielded before "done".
+
+        Args:
+            question: The user's question
+            n_results: Number of relevant chunks to retrieve (default: 5)
+            retrieval_mode: "standard" or "multi_query"
+            where: Optional metadata filter limiting which chunks are searched
+        """
+        start_time = time.perf_counter()
+        first_token_time = None
+        metrics: Dict[str, float] = {}
+        logger.info(f"Processing streaming query:{question}")
+
+        question_embedding = await self._embed_question_async(question)
+        corpus_version = get_corpus_version()
+        scope = self._cache_scope(n_results, retrieval_mode, where)
+        cached = self._cached_answer(question_embedding, scope, corpus_version)
+        if cached:
+            sources = cached["sources"]
+        else:
+            queries = await self._expand_async(question, retrieval_mode, metrics)
+            sources = await asyncio.to_thread(self._retrieve, queries, n_results, question_embedding, metrics, where)
+
+        yield {"event": "sources", "data": {"question": question, "sources": sources}}
+
+        if cached:
+            first_token_time = time.perf_counter()
+            yield {"event": "token", "data": {"text": cached["answer"]}}
+        elif not sources:
+            first_token_time = time.perf_counter()
+            yield {"event": "token", "data": {"text": self._no_documents_response()["answer"]}}
+        elif not settings.gemini_api_key:
+            first_token_time = time.perf_counter()
+            yield {"event": "token", "data": {"text": self._no_api_key_answer(sources)}}
+        else:
+            prompt = self._build_prompt(question, sources, metrics)
+            answer_parts = []
+            try:
+                async for text in self.gemini_client.chat_stream_async(prompt):
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter()
+                    answer_parts.append(text)
+                    yield {"event": "token", "data": {"text": text}}
+                self._remember_answer(question_embedding, scope, corpus_version, "".join(answer_parts), sources)
+            except Exception as e:
+                logger.warning(f"Failed to stream answer with Gemini: {str(e)}")
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                    yield {"event": "token", "data": {"text": self._api_failure_answer(question, sources)}}
+                else:
+                    yield {"event": "error", "data": {"detail": "Answer generation was interrupted"}}
+
+        end_time = time.perf_counter()
+        ttft_ms = ((first_token_time or end_time) - start_time) * 1000
+        total_ms = (end_time - start_time) * 1000
+        logger.info(f"Streamed answer for query: {question[:50]}... - ttft {ttft_ms:.2f}ms - total {total_ms:.2f}ms")
+
+        yield {
+            "event": "done",
+            "data": {
+                "time_to_first_token_ms": round(ttft_ms, 2),
+                "total_time_ms": round(total_ms, 2),
+                **metrics
+            }
+        }
+
+    async def _expand_async(self,question:str,retrieval_mode:str,metrics:Dict[str,float])->List[str]:
+        """
+        Get the queries to search for: the question, plus rewrites in multi_query mode.
+        """
+        if retrieval_mode != RETRIEVAL_MULTI_QUERY:
+            return [question]
+        stage_start = time.perf_counter()
+        queries = await self.query_expansion_service.expand_query_async(question)
+        metrics["query_expansion_ms"] = self._elapsed_ms(stage_start)
+        return queries
+
+    def _retrieve(
+        self,
+        queries:List[str],
+        n_results:int,
+        question_embedding:Optional[List[float]],
+        metrics:Dict[str,float],
+        where:Optional[Dict]=None,
+    )->List[Dict]:
+        """
+        Retrieve source chunks for one or more queries (the first one is the
+        original question). Dense and BM25 rankings are fused with RRF when
+        the lexical index is enabled, then reranked. Per-stage latencies go
+        into metrics.
+        """
+        stage_start = time.perf_counter()
+        depth = self._candidate_depth(n_results)
+        lexical_rankings = self._lexical_search(queries, depth, metrics, where)
+
+        vector_start = time.perf_counter()
+        if len(queries) == 1:
+            results = self._search(queries[0], depth, question_embedding, where)
+        else:
+            results = self._multi_query_search(queries, depth, where)
+        metrics["vector_search_ms"] = self._elapsed_ms(vector_start)
+
+        sources = self._rank_sources(queries, n_results, depth, results, lexical_rankings, question_embedding, metrics)
+        metrics["retrieval_ms"] = self._elapsed_ms(stage_start)
+        return sources
+
+    def _retrieve_batch(
+        self,
+        queries_per_item:List[List[str]],
+        n_results_per_item:List[int],
+        question_embeddings:List[Optional[List[float]]],
+        metrics_per_item:List[Dict[str,float]],
+        wheres:Optional[List[Optional[Dict]]]=None,
+    )->List[List[Dict]]:
+        """
+        Retrieve sources for many questions with one vector store call per
+        distinct filter, covering every query of those questions. BM25,
+        fusion and reranking then run per question as in _retrieve().
+        """
+        wheres = wheres or [None] * len(queries_per_item)
+        groups: Dict[str, List[int]] = {}
+        for i, where in enumerate(wheres):
+            groups.setdefault(filter_key(where), []).append(i)
+
+        sources_per_item: List[List[Dict]] = [[] for _ in queries_per_item]
+        for items in groups.values():
+            where = wheres[items[0]]
+            group_queries = [queries_per_item[i] for i in items]
+            depths = [self._candidate_depth(n_results_per_item[i]) for i in items]
+            all_queries = [query for queries in group_queries for query in queries]
+
+            vector_start = time.perf_counter()
             results = self.vector_store.query(
-            query_texts=[question],
+                query_texts=all_queries,
+                n_results=max(depths),
+                where=where,
+                embeddings=self._batch_query_embeddings(group_queries, [question_embeddings[i] for i in items])
+            )
+            vector_ms = self._elapsed_ms(vector_start)
+            logger.info(f"Searched {len(all_queries)} queries in one vector store call - {vector_ms:.2f}ms")
+
+            offset = 0
+            for i, queries, depth in zip(items, group_queries, depths):
+                stage_start = time.perf_counter()
+                metrics = metrics_per_item[i]
+                # This question's rankings, cut to its own depth
+                item_results = {
+                    field: [ranking[:depth] for ranking in (results.get(field) or [])[offset:offset + len(queries)]]
+                    for field in ("ids", "documents", "metadatas", "distances")
+                }
+                offset += len(queries)
+
+                lexical_rankings = self._lexical_search(queries, depth, metrics, where)
+                metrics["vector_search_ms"] = vector_ms
+                sources_per_item[i] = self._rank_sources(
+                    queries, n_results_per_item[i], depth, item_results, lexical_rankings, question_embeddings[i], metrics
+                )
+                metrics["retrieval_ms"] = round(vector_ms + self._elapsed_ms(stage_start), 2)
+        return sources_per_item
+
+    def _batch_query_embeddings(
+        self,
+        queries_per_item:List[List[str]],
+        question_embeddings:List[Optional[List[float]]],
+    )->Optional[List[List[float]]]:
+        """
+        Embeddings for every query of a batch, in order. Questions are
+        already embedded; multi_query rewrites are embedded in one call.
+        Returns None (default embeddings for all) if any is unavailable.
+        """
+        if any(embedding is None for embedding in question_embeddings):
+            return None
+        rewrites = [query for queries in queries_per_item for query in queries[1:]]
+        rewrite_embeddings = []
+        if rewrites:
+            try:
+                rewrite_embeddings = self.embedding_service.generate_embeddings(rewrites)
+            except Exception as e:
+                logger.warning(f"Failed to generate embeddings: {str(e)}. Using ChromaDB default embeddings.")
+                return None
+
+        embeddings = []
+        position = 0
+        for queries, question_embedding in zip(queries_per_item, question_embeddings):
+            embeddings.append(question_embedding)
+            embeddings.extend(rewrite_embeddings[position:position + len(queries) - 1])
+            position += len(queries) - 1
+        return embeddings
+
+    def _candidate_depth(self,n_results:int)->int:
+        return self.reranker.candidate_depth(n_results) if self.reranker is not None else n_results
+
+    def _rank_sources(
+        self,
+        queries:List[str],
+        n_results:int,
+        depth:int,
+        results:Dict,
+        lexical_rankings:List[List[str]],
+        question_embedding:Optional[List[float]],
+        metrics:Dict[str,float],
+    )->List[Dict]:
+        """
+        Turn vector store results and BM25 rankings into the final n_results sources.
+        """
+        if len(queries) == 1 and not lexical_rankings:
+            sources = self._format_sources(results)
+        else:
+            fusion_start = time.perf_counter()
+            sources = self._fuse_sources(results, depth, lexical_rankings, question_embedding)
+            metrics["fusion_ms"] = self._elapsed_ms(fusion_start)
+
+        if self.reranker is not None and len(sources) > 1:
+            rerank_start = time.perf_counter()
+            sources = self.reranker.rerank(queries[0], sources, top_k=n_results)
+            metrics["rerank_ms"] = self._elapsed_ms(rerank_start)
+        else:
+            sources = sources[:n_results]
+        return sources
+
+    def _lexical_search(self,queries:List[str],n_results:int,metrics:Dict[str,float],where:Optional[Dict]=None)->List[List[str]]:
+        """
+        Rank chunks for every query with the BM25 index. With a where
+        filter only the chunks matching it are scored: the index evaluates
+        it itself. If it can't (segments from before it recorded files,
+        until they are tagged at startup), a file_name filter takes the
+        file's chunk IDs from the registry; other filters skip BM25 and
+        leave the filtering to the vector search.
+
+        Returns:
+            One ranked list of chunk IDs per query that matched anything
+        """
+        if self.lexical_index is None:
+            return []
+        stage_start = time.perf_counter()
+        try:
+            allowed_ids = None
+            index_where = where
+            if where is not None and not self.lexical_index.can_filter(where):
+                index_where = None
+                if set(where) == {"file_name"} and isinstance(where["file_name"], str):
+                    allowed_ids = set(self.registry.get_chunk_ids(where["file_name"]))
+                else:
+                    logger.debug("BM25 index can't evaluate this filter, using vector search only")
+                    allowed_ids = set()
+            rankings = [
+                [
+                    chunk_id
+                    for chunk_id, _ in self.lexical_index.search(query, top_k=n_results, allowed_ids=allowed_ids, where=index_where)
+                ]
+                for query in queries
+            ] if allowed_ids is None or allowed_ids else []
+        except Exception as e:
+            logger.warning(f"BM25 search failed: {str(e)}. Using vector search only.")
+            rankings = []
+        metrics["lexical_search_ms"] = self._elapsed_ms(stage_start)
+        return [ranking for ranking in rankings if ranking]
+
+    def _multi_query_search(self,queries:List[str],n_results:int,where:Optional[Dict]=None)->Dict:
+        """
+        Embed all queries in one batch and search them with one vector store call.
+        """
+        embeddings = None
+        try:
+            if self.embedding_service.is_available():
+                embeddings = self.embedding_service.generate_embeddings(queries)
+        except Exception as e:
+            logger.warning(f"Failed to generate embeddings: {str(e)}. Using ChromaDB default embeddings.")
+
+        return self.vector_store.query(
+            query_texts=queries,
             n_results=n_results,
-            embeddings=[question_embedding]
+            where=where,
+            embeddings=embeddings
         )
-        else:
-            # Use ChromaDB's default embedding function
-            results = self.vector_store.query(
+
+    def _fuse_sources(
+        self,
+        results:Dict,
+        n_results:int,
+        extra_rankings:Optional[List[List[str]]]=None,
+        question_embedding:Optional[List[float]]=None,
+    )->List[Dict]:
+        """
+        Turn vector store results (one ranking per query) plus any extra
+        rankings (e.g. BM25) into deduplicated, RRF-ranked sources.
+        """
+        ids_per_query = results.get('ids') or []
+        documents_per_query = results.get('documents') or []
+        metadatas_per_query = results.get('metadatas') or []
+        distances_per_query = results.get('distances') or []
+
+        # Keep the best (smallest) distance seen for every chunk
+        chunks_by_id: Dict[str, Dict] = {}
+        for query_index, ids in enumerate(ids_per_query):
+            documents = documents_per_query[query_index] if query_index < len(documents_per_query) else []
+            metadatas = (metadatas_per_query[query_index] if query_index < len(metadatas_per_query) else None) or []
+            distances = (distances_per_query[query_index] if query_index < len(distances_per_query) else None) or []
+            for i, chunk_id in enumerate(ids):
+                distance = distances[i] if i < len(distances) else 1.0
+                known = chunks_by_id.get(chunk_id)
+                if known is None or distance < known["distance"]:
+                    chunks_by_id[chunk_id] = {
+                        "chunk": documents[i],
+                        "metadata": (metadatas[i] if i < len(metadatas) else None) or {},
+                        "distance": distance
+                    }
+
+        fused = reciprocal_rank_fusion(list(ids_per_query) + list(extra_rankings or []))[:n_results]
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in chunks_by_id]
+        if missing:
+            chunks_by_id.update(self._fetch_chunks(missing, question_embedding))
+        if not fused:
+            logger.warning("No relevant document found")
+
+        sources = []
+        for chunk_id, _ in fused:
+            found = chunks_by_id.get(chunk_id)
+            if found is None:
+                # Indexed lexically but already deleted from the vector store
+                continue
+            sources.append({
+                "chunk": found["chunk"],
+                "file_name": found["metadata"].get("file_name", "Unknown"),
+                "chunk_index": found["metadata"].get("chunk_index", 0),
+                "similarity_score": 1.0 - found["distance"]
+            })
+        return sources
+
+    def _fetch_chunks(self,chunk_ids:List[str],question_embedding:Optional[List[float]])->Dict[str,Dict]:
+        """
+        Load chunks that only the lexical search found. Their similarity to
+        the question is computed from the stored embeddings when available.
+        """
+        include = ["documents", "metadatas"] + (["embeddings"] if question_embedding else [])
+        fetched = self.vector_store.get_documents(chunk_ids, include=include)
+        documents = fetched.get("documents") or []
+        metadatas = fetched.get("metadatas") or []
+        embeddings = fetched.get("embeddings")
+
+        similarities = None
+        if question_embedding and embeddings is not None and len(embeddings):
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            query = np.asarray(question_embedding, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+            similarities = (matrix @ query) / np.where(norms > 0, norms, 1.0)
+
+        chunks_by_id = {}
+        for i, chunk_id in enumerate(fetched.get("ids", [])):
+            similarity = float(similarities[i]) if similarities is not None else 0.0
+            chunks_by_id[chunk_id] = {
+                "chunk": documents[i] if i < len(documents) else "",
+                "metadata": (metadatas[i] if i < len(metadatas) else None) or {},
+                "distance": 1.0 - similarity
+            }
+        return chunks_by_id
+
+    @staticmethod
+    def _cache_scope(n_results:int,retrieval_mode:str,where:Optional[Dict]=None)->str:
+        """
+        Everything besides the question that a cached answer depends on.
+        """
+        return f"{n_results}:{retrieval_mode}:{filter_key(where)}"
+
+    def _cached_answer(self,question_embedding:Optional[List[float]],scope:str,corpus_version:int)->Optional[Dict]:
+        """
+        Look up a previously generated answer for a similar question.
+        """
+        if self.answer_cache is None or not question_embedding:
+            return None
+        return self.answer_cache.lookup(question_embedding, scope=scope, corpus_version=corpus_version)
+
+    def _remember_answer(self,question_embedding:Optional[List[float]],scope:str,corpus_version:int,answer:str,sources:List[Dict]):
+        """
+        Cache a generated answer. Fallback answers are never cached.
+        """
+        if self.answer_cache is None or not question_embedding:
+            return
+        self.answer_cache.store(
+            question_embedding,
+            scope=scope,
+            corpus_version=corpus_version,
+            result={"answer": answer, "sources": sources, "metrics": {}}
+        )
+
+    def _embed_question(self,question:str)->Optional[List[float]]:
+        """
+        Try to embed the question with the configured embedding backend.
+        Returns None so ChromaDB falls back to its default embeddings.
+        """
+        try:
+            if self.embedding_service.is_available():
+                question_embedding = self.embedding_service.generate_embeddings([question])[0]
+                logger.info(f"Using {self.embedding_service.backend_name} embeddings for query")
+                return question_embedding
+        except Exception as e:
+            logger.warning(f"Failed to generate embeddings: {str(e)}. Using ChromaDB default embeddings.")
+        return None
+
+    async def _embed_question_async(self,question:str)->Optional[List[float]]:
+        """
+        Async version of _embed_question().
+        """
+        return (await self._embed_questions_async([question]))[0]
+
+    async def _embed_questions_async(self,questions:List[str])->List[Optional[List[float]]]:
+        """
+        Embed several questions in one batched call; None for each if embedding fails.
+        """
+        try:
+            if self.embedding_service.is_available():
+                question_embeddings = await self.embedding_service.generate_embeddings_async(questions)
+                logger.info(f"Using {self.embedding_service.backend_name} embeddings for {len(questions)} query(ies)")
+                return list(question_embeddings)
+        except Exception as e:
+            logger.warning(f"Failed to generate embeddings: {str(e)}. Using ChromaDB default embeddings.")
+        return [None] * len(questions)
+
+    def _search(self,question:str,n_results:int,question_embedding:Optional[List[float]],where:Optional[Dict]=None)->Dict:
+        """
+        Query the vector store - if we have a question embedding, use it;
+        otherwise ChromaDB will use its default embedding function.
+        """
+        if question_embedding:
+            return self.vector_store.query(
                 query_texts=[question],
-                n_results=n_results
+                n_results=n_results,
+                where=where,
+                embeddings=[question_embedding]
             )
+        return self.vector_store.query(
+            query_texts=[question],
+            n_results=n_results,
+            where=where
+        )
 
+    @staticmethod
+    def _format_sources(results:Dict)->List[Dict]:
+        """
+        Turn a vector store result into a list of source dictionaries.
+        """
         if not results['documents'] or len(results['documents'][0])==0:
             logger.warning("No relevant document found")
-            return {
-                "answer": "I couldn't find any relevant information in the uploaded documents to answer your question.",
-                "sources": []
-            }
+            return []
+
         retrieved_chunks = results['documents'][0]  # First query result
         metadatas = results['metadatas'][0] if results['metadatas'] else []
         distances = results['distances'][0] if results['distances'] else []
 
-        context_parts = []
         sources = []
-
         for i, chunk in enumerate(retrieved_chunks):
             metadata = metadatas[i] if i < len(metadatas) else {}
             distance = distances[i] if i < len(distances) else 1.0
-            
-            # Build source info
-            source_info = {
+
+            sources.append({
                 "chunk": chunk,
                 "file_name": metadata.get("file_name", "Unknown"),
                 "chunk_index": metadata.get("chunk_index", i),
                 "similarity_score": 1.0 - distance  # Convert distance to similarity
-            }
-            sources.append(source_info)
-            
-            # Add chunk to context
-            context_parts.append(f"[Document {i+1}]: {chunk}")
-        
-        # Combine all chunks into context
-        context = "\n\n".join(context_parts)
-        
-        # Step 5: Generate answer using Gemini with context
-        prompt = f"""Based on the following document excerpts, please answer the question.
-        
-If the answer cannot be found in the provided context, please say so.
+            })
+        return sources
 
-Question: {question}
+    async def _answer_async(
+        self,
+        question:str,
+        sources:List[Dict],
+        question_embedding:Optional[List[float]],
+        scope:str,
+        corpus_version:int,
+        metrics:Dict[str,float],
+    )->Dict:
+        """
+        Generate the answer for retrieved sources, with the usual fallbacks.
+        """
+        if not sources:
+            return self._no_documents_response(metrics)
 
-Document excerpts:
-{context}
+        prompt = self._build_prompt(question, sources, metrics)
 
-Answer:"""
-        
-        # Try to generate answer with Gemini, but provide fallback if it fails
         try:
             if settings.gemini_api_key:
-                
-                answer = self.gemini_client.chat(prompt)
+                stage_start = time.perf_counter()
+                answer = await self.gemini_client.chat_async(prompt)
+                metrics["generation_ms"] = self._elapsed_ms(stage_start)
                 logger.info(f"Generated answer for query: {question[:50]}...")
+                self._remember_answer(question_embedding, scope, corpus_version, answer, sources)
             else:
-                # No API key, provide a simple answer based on retrieved chunks
-                answer = f"I found {len(sources)} relevant document chunk(s) related to your question. Please review the sources below for the answer."
+                answer = self._no_api_key_answer(sources)
         except Exception as e:
             logger.warning(f"Failed to generate answer with Gemini: {str(e)}")
-            # Fallback: provide a summary of what was found
-            answer = f"I found {len(sources)} relevant document chunk(s) related to your question, but couldn't generate an AI answer due to API limitations. Please review the sources below for the answer to your question: '{question}'"
-        
+            answer = self._api_failure_answer(question, sources)
+
         return {
             "answer": answer,
-            "sources": sources
+            "sources": sources,
+            "metrics": metrics
         }
 
+    def _build_prompt(self,question:str,sources:List[Dict],metrics:Dict[str,float])->str:
+        """
+        Combine the retrieved chunks into the answer prompt. Adjacent chunks
+        are merged (without their duplicated overlap) and packed into the
+        context token budget; the token savings are recorded in metrics.
+        """
+        blocks, packing = self.context_packer.pack(sources)
+        metrics.update(packing)
+        if packing["context_tokens_saved"]:
+            logger.info(
+                f"Packed {len(sources)} chunks into {len(blocks)} blocks - "
+                f"{packing['context_tokens_packed']} tokens (saved {packing['context_tokens_saved']})"
+            )
+
+        context = "\n\n".join(
+            f"[Document {i+1}] ({block['file_name']}): {block['text']}" for i, block in enumerate(blocks)
+        )
+
+        return f"""Based on the following document excerpts, please answer the question.
 
+If the answer cannot be found in the provided context, please say so.
+
+Question: {question}
+
+Document excerpts:
+{context}
+
+Answer:"""
+
+    @staticmethod
+    def _elapsed_ms(stage_start:float)->float:
+        return round((time.perf_counter() - stage_start) * 1000, 2)
+
+    @staticmethod
+    def _no_documents_response(metrics:Optional[Dict[str,float]]=None)->Dict:
+        return {
+            "answer": "I couldn't find any relevant information in the uploaded documents to answer your question.",
+            "sources": [],
+            "metrics": metrics or {}
+        }
 
+    @staticmethod
+    def _no_api_key_answer(sources:List[Dict])->str:
+        # No API key, provide a simple answer based on retrieved chunks
+        return f"I found {len(sources)} relevant document chunk(s) related to your question. Please review the sources below for the answer."
 
-   
+    @staticmethod
+    def _api_failure_answer(question:str,sources:List[Dict])->str:
+        # Fallback: provide a summary of what was found
+        return f"I found {len(sources)} relevant document chunk(s) related to your question, but couldn't generate an AI answer due to API limitations. Please review the sources below for the answer to your question: '{question}'"
@@ -1,8 +1,13 @@
-from typing import List
+from typing import Iterable, Iterator, List
 import logging
+import re
 
 logger=logging.getLogger(__name__)
 
+# Preferred chunk boundaries, best first
+_SEPARATORS=("\n\n","\n",". ","! ","? "," ")
+_WHITESPACE=re.compile(r"\s+")
+
 class TextSplitter:
     """
     simple text splitter that splits text into chunks.
@@ -14,18 +19,74 @@ class TextSplitter:
     def split_text(self,text:str)->List[str]:
         if not text:
             return []
-        chunks=[]
+        chunks=list(self.split_stream([text]))
+        logger.info(f"Split text into {len(chunks)} chunks")
+        return chunks
+
+    def split_stream(self,pieces:Iterable[str])->Iterator[str]:
+        """
+        Split a text given as consecutive pieces (e.g. pages) into chunks,
+        yielding each chunk as soon as it is complete. The chunks are the
+        same as split_text() of the joined text, whatever the pieces; only
+        about one chunk of text is held.
+
+        Boundaries are content-defined rather than every chunk_size
+        characters: a chunk ends at the last paragraph break, else line
+        break, sentence end or space in the second half of its window (a
+        hard cut only if there is none), and the next chunk starts at the
+        first word boundary chunk_overlap characters before that. An insert
+        or delete therefore only changes the chunks around it; once a
+        window reaches the same break as before, the following chunks are
+        identical again (which lets re-ingestion reuse them).
+
+        Args:
+            pieces: Consecutive parts of the text
+
+        Returns:
+            Iterator over the non-empty chunks
+        """
+        buffer=""
         start=0
-        text_length=len(text)
-        while start<text_length:
-            ##calculate end position 
-            end=start+self.chunk_size
+        for piece in pieces:
+            if not buffer:
+                # Leading whitespace of the text is stripped
+                piece=piece.lstrip()
+            if not piece:
+                continue
+            buffer=buffer[start:]+piece
+            start=0
+            # Cut while more text follows the window than fits in it
+            while len(buffer)-start>self.chunk_size:
+                end=self._chunk_end(buffer,start)
+                chunk=buffer[start:end].strip()
+                if chunk:
+                    yield chunk
+                start=self._next_start(buffer,start,end)
 
-            chunk=text[start:end]
-            chunks.append(chunk.strip())
+        # Trailing whitespace of the text is stripped
+        chunk=buffer[start:].strip()
+        if chunk:
+            yield chunk
 
-            start=end-self.chunk_overlap
-            if start>=end:
-                start=end
-        logger.info(f"Split text into {len(chunks)} chunks")
-        return chunks
\ No newline at end of file
+    def _chunk_end(self,text:str,start:int)->int:
+        """
+        End of the chunk starting at start: just after the preferred break
+        in the second half of the window.
+        """
+        low=start+max(1,self.chunk_size//2)
+        high=start+self.chunk_size
+        for separator in _SEPARATORS:
+            position=text.rfind(separator,low,high)
+            if position>=0:
+                return position+len(separator)
+        return high
+
+    def _next_start(self,text:str,start:int,end:int)->int:
+        """
+        Start of the chunk after [start, end): the first word boundary at
+        least chunk_overlap characters before end.
+        """
+        if self.chunk_overlap<=0:
+            return end
+        match=_WHITESPACE.search(text,max(end-self.chunk_overlap,start+1),end)
+        return match.end() if match else end
@@ -1,5 +1,4 @@
-from typing import Optional
-from docx import Document
+from typing import Iterator, Optional
 import logging
 
 logger=logging.getLogger(__name__)
@@ -19,15 +18,27 @@ class DOCXParser:
             Extracted text as a string,or None if parsing fails
         """
         try:
-            doc=Document(file_path)
-            text=""
-
-            for paragraph in doc.paragraphs:
-                text+=paragraph.text +"\n"
-
-            logger.info(f"Successfully Parsed DOCX file: {file_path}")
-            return text.strip()
+            # Single join (repeated += is quadratic)
+            return "".join(self.iter_pages(file_path)).strip()
         except Exception as e:
             logger.error(f"Error parsing DOCX file: {file_path}:{str(e)}")
             return None
 
+    def iter_pages(self, file_path:str) -> Iterator[str]:
+        """
+        Yield the text of every paragraph, in order, each followed by a
+        newline (DOCX files have no fixed pages).
+
+        Args:
+            file_path:path to the DOCX file
+
+        Raises:
+            Exception: If the file can't be read as a DOCX file
+        """
+        from docx import Document  # Imported on first use to keep startup fast
+
+        doc=Document(file_path)
+        for paragraph in doc.paragraphs:
+            yield paragraph.text+"\n"
+        logger.info(f"Successfully Parsed DOCX file: {file_path}")
+
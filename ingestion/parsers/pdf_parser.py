@@ -1,33 +1,213 @@
-from typing import Optional
-from PyPDF2 import PdfReader
+from collections import OrderedDict, deque
+from concurrent.futures import Executor
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
 import logging
+import os
+import signal
+import threading
+import time
 
 logger=logging.getLogger(__name__)
 
+# Readers opened by this (pool worker) process, by (path, mtime, size). The
+# pool hands a file's page ranges to whichever worker is free, so a worker
+# usually gets several ranges of a file and parses its cross-reference table
+# and page tree once for all of them. A reader reads from its open file
+# instead of a copy of the whole file, and drops the objects it resolved
+# after every range, so it costs about the size of the page tree.
+_READER_CACHE_SIZE=2
+_readers:"OrderedDict[Tuple[str,int,int],Tuple[object,BinaryIO]]"=OrderedDict()
+
+
+class PageTimeoutError(BaseException):
+    """
+    Raised inside a worker when one page takes longer than the page timeout.
+    A BaseException, so PyPDF2's own "except Exception" handlers can't swallow it.
+    """
+
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeoutError()
+
+
+def _cached_reader(file_path:str):
+    """
+    This process's PdfReader of a file, opened (page tree loaded) on first use.
+    """
+    from PyPDF2 import PdfReader
+
+    # Spooled uploads are deleted after their job: drop their readers
+    for key in [key for key in _readers if not os.path.exists(key[0])]:
+        _readers.pop(key)[1].close()
+    stat=os.stat(file_path)
+    key=(file_path,stat.st_mtime_ns,stat.st_size)
+    entry=_readers.get(key)
+    if entry is None:
+        file=open(file_path,"rb")
+        try:
+            reader=PdfReader(file)
+            len(reader.pages)
+        except BaseException:
+            file.close()
+            raise
+        _readers[key]=(reader,file)
+        while len(_readers)>_READER_CACHE_SIZE:
+            _readers.popitem(last=False)[1][1].close()
+    else:
+        reader=entry[0]
+        _readers.move_to_end(key)
+    return reader
+
+
+def _count_pages(file_path:str) -> int:
+    """
+    Number of pages of a PDF. Runs in a pool process, whose cached reader
+    then serves the file's first ranges; the parsing process never opens
+    the file.
+    """
+    return len(_cached_reader(file_path).pages)
+
+
+def _extract_pages(file_path:str, start:int, stop:int, page_timeout:Optional[float]) -> Tuple[List[str],List[Tuple[int,str]]]:
+    """
+    Extract the text of pages [start, stop) of a PDF. Runs in a pool process.
+
+    A page that fails or exceeds page_timeout seconds yields "" and is
+    reported in the failures, so one malformed page doesn't lose the file.
+    The timeout needs SIGALRM, i.e. a POSIX worker process. The reader is
+    reused across calls for the same file (see _cached_reader).
+
+    Returns:
+        (page texts in order, [(page index, error)])
+    """
+    use_alarm=bool(page_timeout) and hasattr(signal,"SIGALRM") and threading.current_thread() is threading.main_thread()
+    # Page tree loaded before the per-page timer starts
+    reader=_cached_reader(file_path)
+    if use_alarm:
+        previous_handler=signal.signal(signal.SIGALRM,_raise_page_timeout)
+    texts=[]
+    failures=[]
+    try:
+        for index in range(start,stop):
+            try:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL,page_timeout)
+                texts.append(reader.pages[index].extract_text() or "")
+            except PageTimeoutError:
+                texts.append("")
+                failures.append((index,f"timed out after {page_timeout}s"))
+            except Exception as e:
+                texts.append("")
+                failures.append((index,str(e)))
+            finally:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL,0)
+    finally:
+        if use_alarm:
+            signal.signal(signal.SIGALRM,previous_handler)
+        # Content streams, fonts etc. of these pages: read again if needed
+        reader.resolved_objects.clear()
+    return texts,failures
+
+
 class PDFParser:
     """
     Parser for extracting text from PDF files.
+
+    With an executor (a process pool), the pages are split into ranges of
+    pages_per_task that are extracted in parallel (at most max_in_flight
+    ranges at a time), each page limited to page_timeout seconds. Without
+    one, pages are extracted in the calling thread (no timeout).
     """
-    def parse(self, file_path:str) -> Optional[str]:
+    def __init__(
+        self,
+        executor:Optional[Executor]=None,
+        pages_per_task:int=32,
+        page_timeout:Optional[float]=30.0,
+        max_in_flight:int=8,
+    ):
+        self.executor=executor
+        self.pages_per_task=max(1,pages_per_task)
+        self.page_timeout=page_timeout
+        self.max_in_flight=max(1,max_in_flight)
+
+    def parse(self, file_path:str, on_page:Optional[Callable[[int],None]]=None) -> Optional[str]:
         """
         Extract text from a PDF files.
 
         Args:
             file_path:path to the PDF file
+            on_page:Optional callback, called with the number of pages parsed so far
 
         Returns:
             Extracted text as a string,or None if parsing fails
         """
         try:
-            reader=PdfReader(file_path)
-            text=""
-
-            #Extract text from each page
-            for page in reader.pages:
-                text+=page.extract_text() + "\n"
-
-            logger.info(f"Successfully Parsed PDF file: {file_path}")
-            return text.strip()
+            # Single join in page order (repeated += is quadratic)
+            return "".join(self.iter_pages(file_path,on_page)).strip()
         except Exception as e:
             logger.error(f"Error parsing PDF file: {file_path}:{str(e)}")
             return None
+
+    def iter_pages(self, file_path:str, on_page:Optional[Callable[[int],None]]=None) -> Iterator[str]:
+        """
+        Yield the text of every page, in order, each followed by a newline.
+        Pages are yielded as their range is done, so only max_in_flight
+        ranges of text are held at a time.
+
+        Args:
+            file_path:path to the PDF file
+            on_page:Optional callback, called with the number of pages parsed so far
+
+        Raises:
+            Exception: If the file can't be read as a PDF
+        """
+        start_time=time.perf_counter()
+        pages_done=0
+        for texts,failures in self._iter_ranges(file_path):
+            for index,error in failures:
+                logger.warning(f"Skipped page {index+1} of {file_path}: {error}")
+            for text in texts:
+                yield text+"\n"
+            pages_done+=len(texts)
+            if on_page:
+                on_page(pages_done)
+
+        elapsed=time.perf_counter()-start_time
+        logger.info(
+            f"Successfully Parsed PDF file: {file_path} - {pages_done} pages in {elapsed:.2f}s "
+            f"({pages_done/max(elapsed,1e-9):.1f} pages/s)"
+        )
+
+    def _iter_ranges(self, file_path:str) -> Iterator[Tuple[List[str],List[Tuple[int,str]]]]:
+        """
+        (texts, failures) of consecutive page ranges, in page order.
+        """
+        if self.executor is None:
+            from PyPDF2 import PdfReader  # Imported on first use to keep startup fast
+
+            with open(file_path,"rb") as file:
+                reader=PdfReader(file)
+                for index in range(len(reader.pages)):
+                    try:
+                        yield [reader.pages[index].extract_text() or ""],[]
+                    except Exception as e:
+                        yield [""],[(index,str(e))]
+            return
+
+        # Counted by a worker: this process holds no reader while ranges are in flight
+        page_count=self.executor.submit(_count_pages,file_path).result()
+        pending=deque()
+        try:
+            for start in range(0,page_count,self.pages_per_task):
+                pending.append(self.executor.submit(
+                    _extract_pages,file_path,start,min(start+self.pages_per_task,page_count),self.page_timeout
+                ))
+                if len(pending)>=self.max_in_flight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Stopped early (error or consumer gave up): don't extract the rest
+            for future in pending:
+                future.cancel()
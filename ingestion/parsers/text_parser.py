@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Iterator, Optional
 import logging
 
 logger=logging.getLogger(__name__)
@@ -7,6 +7,8 @@ class TextParser:
     """
     parser for extracting text from plain text files (.txt files).
     """
+    def __init__(self,block_chars:int=64*1024):
+        self.block_chars=block_chars
 
     def parse(self,file_path:str) -> Optional[str]:
         """
@@ -34,4 +36,21 @@ class TextParser:
                 return None
         except Exception as e:
             logger.error(f"Error parsing text file {file_path}: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+    def iter_pages(self,file_path:str) -> Iterator[str]:
+        """
+        Yield the text in blocks of block_chars characters, so a large file
+        is never read whole. Invalid UTF-8 bytes are skipped.
+        Args:
+            file_path:path to the text file
+        Raises:
+            OSError: If the file can't be read
+        """
+        with open(file_path,'r',encoding='utf-8',errors='ignore') as file:
+            while True:
+                block=file.read(self.block_chars)
+                if not block:
+                    break
+                yield block
+        logger.info(f"Successfully Parsed text file: {file_path}")
@@ -0,0 +1,123 @@
+"""
+Streaming ingestion pipeline.
+
+A document flows through generators instead of being materialized at
+every step:
+
+    parser.iter_pages(path)            -> page texts
+    TextSplitter.split_stream(pages)   -> chunks (overlap carried across pages)
+    iter_batches(chunks, n)            -> micro-batches of n chunks
+    run_pipeline(batches, consume)     -> consume(batch): embed + store
+
+run_pipeline pulls batches in a worker thread while the previous batch is
+being consumed, with at most max_pending batches waiting in between: when
+embedding/storing falls behind, parsing blocks (backpressure). Memory is
+bounded by a few batches whatever the file size, and the first batches are
+stored (searchable) while the rest of the file is still being parsed.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Executor, TimeoutError as FuturesTimeoutError
+from itertools import islice
+from typing import Awaitable, Callable, Iterable, Iterator, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_END = object()
+
+
+class _ProducerError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def iter_batches(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """
+    Group an iterable into lists of batch_size items (the last may be shorter).
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, max(1, batch_size)))
+        if not batch:
+            return
+        yield batch
+
+
+async def run_pipeline(
+    batches: Iterator[T],
+    consume: Callable[[T], Awaitable[None]],
+    max_pending: int = 2,
+    executor: Optional[Executor] = None,
+) -> int:
+    """
+    Feed batches from a blocking iterator to an async consumer, in order.
+
+    The iterator runs in a thread of the given executor (default: the loop's
+    default executor), at most max_pending produced batches wait for the
+    consumer, and the producer blocks while that many are waiting.
+
+    Args:
+        batches: Iterator producing the batches (may block, e.g. parsing)
+        consume: Coroutine function called with every batch, one at a time
+        max_pending: Batches buffered between producer and consumer
+        executor: Executor to run the iterator in
+
+    Returns:
+        Number of batches consumed
+
+    Raises:
+        Exception: The first error of the producer or the consumer; the
+            other side is stopped
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_pending))
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        # Wait for room, but give up once the consumer has stopped
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except FuturesTimeoutError:
+                if stopped.is_set():
+                    future.cancel()
+                    return False
+
+    def produce() -> None:
+        try:
+            for batch in batches:
+                if stopped.is_set() or not put(batch):
+                    return
+            put(_END)
+        except BaseException as e:
+            if not stopped.is_set():
+                put(_ProducerError(e))
+        finally:
+            close = getattr(batches, "close", None)
+            if close is not None:
+                close()
+
+    producer = loop.run_in_executor(executor, produce)
+    consumed = 0
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                break
+            if isinstance(item, _ProducerError):
+                raise item.error
+            await consume(item)
+            consumed += 1
+    finally:
+        stopped.set()
+        # Unblock a producer waiting for room in the queue, then let it finish
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.wait([producer], timeout=0.05)
+    return consumed
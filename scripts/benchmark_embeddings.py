@@ -0,0 +1,70 @@
+"""
+Benchmark embedding throughput (chunks/sec) for an embedding backend.
+
+Usage:
+    python scripts/benchmark_embeddings.py --backend local --chunks 2000 --batch-size 100
+    python scripts/benchmark_embeddings.py --backend gemini --chunks 300
+
+The embedding cache is bypassed, so every chunk is really embedded.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.rag.embeddings import create_embedding_backend  # noqa: E402
+
+WORDS = (
+    "document retrieval embedding vector index query answer context chunk "
+    "policy invoice contract error code part number warranty section clause "
+    "customer service report revenue quarter product release manual"
+).split()
+
+
+def make_chunks(count: int, chunk_chars: int, seed: int = 42):
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        words = []
+        while sum(len(word) + 1 for word in words) < chunk_chars:
+            words.append(rng.choice(WORDS))
+        chunks.append(" ".join(words))
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backend throughput")
+    parser.add_argument("--backend", default=None, help="gemini or local (default: settings.embedding_backend)")
+    parser.add_argument("--chunks", type=int, default=1000, help="Number of synthetic chunks")
+    parser.add_argument("--chunk-chars", type=int, default=1000, help="Characters per chunk")
+    parser.add_argument("--batch-size", type=int, default=100, help="Chunks per embed call")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs")
+    args = parser.parse_args()
+
+    backend = create_embedding_backend(args.backend)
+    if not backend.is_available():
+        print(f"Backend {backend.name} is not available (missing API key?)")
+        return
+
+    chunks = make_chunks(args.chunks, args.chunk_chars)
+    throughputs = []
+    for run in range(args.repeats):
+        start = time.perf_counter()
+        for i in range(0, len(chunks), args.batch_size):
+            backend.embed(chunks[i:i + args.batch_size], batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        throughputs.append(len(chunks) / elapsed)
+        print(f"run {run + 1}: {len(chunks)} chunks in {elapsed:.3f}s ({throughputs[-1]:.1f} chunks/sec)")
+
+    print(
+        f"{backend.name}: median {statistics.median(throughputs):.1f} chunks/sec "
+        f"(batch size {args.batch_size}, {args.chunk_chars} chars/chunk)"
+    )
+
+
+if __name__ == "__main__":
+    main()
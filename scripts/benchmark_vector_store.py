@@ -0,0 +1,131 @@
+"""
+Benchmark vector store backends: recall@k against exact search,
+per-query latency (p50 / p99) and the size of the data scanned in memory.
+Only the quantized NumPy sizes are read from the store (its code arrays);
+the others are computed as vectors x dim x 4 bytes and marked "*". Chroma's
+actual memory use (HNSW graph, SQLite) is not measured.
+
+Usage:
+    python scripts/benchmark_vector_store.py --vectors 100000 --dim 768 --queries 200 --k 10
+    python scripts/benchmark_vector_store.py --backends numpy-flat numpy-ivf --nprobe 16
+    python scripts/benchmark_vector_store.py --backends numpy-flat numpy-flat-int8 numpy-flat-binary
+
+NumPy backends are named numpy-<flat|ivf>[-<int8|binary>].
+
+Vectors are synthetic (clustered, like chunk embeddings of a few topics) and
+written to a temporary directory, so the real vector store is not touched.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings  # noqa: E402
+from app.core.rag.vector_store import ChromaVectorStore  # noqa: E402
+from app.core.rag.numpy_store import NumpyVectorStore  # noqa: E402
+
+
+def make_vectors(count: int, dim: int, topics: int, seed: int = 42) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, topics, size=count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def open_store(backend: str, directory: str):
+    if backend == "chroma":
+        settings.vector_db_dir = directory
+        return ChromaVectorStore(collection_name="benchmark")
+    parts = backend.split("-")
+    return NumpyVectorStore(
+        collection_name="benchmark",
+        index_dir=directory,
+        index_mode=parts[1],
+        quantization=parts[2] if len(parts) > 2 else "none",
+    )
+
+
+def memory_mb(store, backend: str, vectors: int, dim: int) -> Tuple[float, bool]:
+    """
+    Size of the data scanned in memory, and whether it was computed rather
+    than read from the store.
+    """
+    code_bytes = 0 if backend == "chroma" else store.stats()["code_bytes"]
+    if code_bytes:
+        return code_bytes / 1e6, False
+    return vectors * dim * 4 / 1e6, True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector store recall and latency")
+    parser.add_argument("--backends", nargs="+", default=["chroma", "numpy-flat", "numpy-ivf"],
+                        help="Any of chroma, numpy-flat, numpy-ivf, numpy-flat-int8, numpy-ivf-binary, ...")
+    parser.add_argument("--vectors", type=int, default=20000, help="Number of stored vectors")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension")
+    parser.add_argument("--topics", type=int, default=50, help="Number of synthetic clusters")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF clusters scanned per query")
+    parser.add_argument("--rescore-factor", type=int, default=None, help="Rows rescored per result with int8 codes")
+    parser.add_argument("--binary-rescore-factor", type=int, default=None, help="Rows rescored per result with binary codes")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Vectors per add_documents call")
+    args = parser.parse_args()
+
+    if args.nprobe:
+        settings.numpy_ivf_nprobe = args.nprobe
+    if args.rescore_factor:
+        settings.numpy_rescore_factor = args.rescore_factor
+    if args.binary_rescore_factor:
+        settings.numpy_binary_rescore_factor = args.binary_rescore_factor
+
+    vectors = make_vectors(args.vectors + args.queries, args.dim, args.topics)
+    corpus, queries = vectors[:args.vectors], vectors[args.vectors:]
+    ids = [f"chunk_{i}" for i in range(args.vectors)]
+
+    # Ground truth by brute force
+    truth = np.argsort(-(queries @ corpus.T), axis=1)[:, :args.k]
+    truth_ids = [{ids[i] for i in row} for row in truth]
+
+    print(f"{args.vectors} vectors, dim {args.dim}, {args.queries} queries, k={args.k}")
+    print(f"{'backend':<18} {'ingest s':>9} {'memory MB':>10} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for backend in args.backends:
+        with tempfile.TemporaryDirectory() as directory:
+            store = open_store(backend, directory)
+
+            start = time.perf_counter()
+            for i in range(0, args.vectors, args.batch_size):
+                batch = slice(i, i + args.batch_size)
+                store.add_documents(
+                    ids=ids[batch],
+                    documents=[""] * len(ids[batch]),
+                    metadatas=[{"n": n} for n in range(i, i + len(ids[batch]))],
+                    embeddings=corpus[batch].tolist(),
+                )
+            ingest_seconds = time.perf_counter() - start
+
+            latencies, recalls = [], []
+            for query, expected in zip(queries, truth_ids):
+                start = time.perf_counter()
+                results = store.query(query_texts=[""], n_results=args.k, embeddings=[query.tolist()])
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(len(expected & set(results["ids"][0])) / args.k)
+            scanned_mb, computed = memory_mb(store, backend, args.vectors, args.dim)
+            store.close()
+
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        memory = f"{scanned_mb:.1f}{'*' if computed else ''}"
+        print(f"{backend:<18} {ingest_seconds:>9.2f} {memory:>10} {statistics.mean(recalls):>9.3f} "
+              f"{statistics.median(latencies):>8.2f} {p99:>8.2f}")
+    print("* computed (vectors x dim x 4 bytes), not measured")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Rebuild the per-file document registry from the chunks stored in Chroma.
+
+Usage:
+    python scripts/rebuild_registry.py
+
+Run it after restoring a vector store from backup, or if the registry file
+(document_registry.sqlite in VECTOR_DB_DIR) was lost or got out of sync.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.rag.document_registry import close_document_registry  # noqa: E402
+from app.core.rag.vector_store import create_vector_store  # noqa: E402
+from app.services.admin_service import AdminService  # noqa: E402
+
+
+def main():
+    vector_store = create_vector_store()
+    try:
+        result = AdminService(vector_store=vector_store).rebuild_registry()
+        print(f"Registered {result['files']} files ({result['chunks']} chunks)")
+    finally:
+        vector_store.close()
+        close_document_registry()
+
+
+if __name__ == "__main__":
+    main()
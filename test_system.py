@@ -22,7 +22,8 @@ def test_upload_document(file_path: str):
     
     with open(file_path, "rb") as f:
         files = {"file": (os.path.basename(file_path), f, "application/pdf")}
-        response = requests.post(f"{BASE_URL}/documents/upload", files=files)
+        # wait=true: respond once the background ingestion job has finished
+        response = requests.post(f"{BASE_URL}/documents/upload", params={"wait": "true"}, files=files)
     
     print(f"Status: {response.status_code}")
     if response.status_code == 200:
@@ -0,0 +1,68 @@
+"""
+Shared fixtures. The tests run offline: local hash embeddings, no Gemini
+key, and every store under a temporary directory.
+"""
+import os
+import tempfile
+
+# Before any app module reads the settings
+os.environ.setdefault("VECTOR_DB_DIR", tempfile.mkdtemp(prefix="documind-tests-"))
+os.environ["EMBEDDING_BACKEND"] = "local"
+os.environ["GEMINI_API_KEY"] = ""
+os.environ["PDF_PARSE_PROCESSES"] = "0"
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+import pytest
+
+from app.config import settings
+from app.core.rag.document_registry import DocumentRegistry
+from app.core.rag.numpy_store import NumpyVectorStore
+from app.core.rag.retrieval import BM25Index
+from app.services.document_service import DocumentService
+from app.services.embedding_service import EmbeddingService
+
+
+@pytest.fixture
+def vector_store(tmp_path):
+    store = NumpyVectorStore(index_dir=str(tmp_path / "numpy_store"), index_mode="flat", quantization="none")
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = DocumentRegistry(str(tmp_path / "registry.sqlite"))
+    yield registry
+    registry.close()
+
+
+@pytest.fixture
+def lexical_index(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25"))
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def document_service(vector_store, registry, lexical_index, monkeypatch):
+    # Small batches, so a file is stored over several of them
+    monkeypatch.setattr(settings, "ingestion_batch_chunks", 4)
+    return DocumentService(
+        vector_store=vector_store,
+        embedding_service=EmbeddingService(),
+        registry=registry,
+        lexical_index=lexical_index,
+    )
+
+
+def paragraphs(count: int, seed: int = 0):
+    """
+    Distinct paragraphs of a few hundred characters.
+    """
+    import random
+
+    rng = random.Random(seed)
+    return [
+        " ".join(f"w{rng.randint(0, 99999)}" for _ in range(rng.randint(40, 140))) + "."
+        for _ in range(count)
+    ]
@@ -0,0 +1,164 @@
+import asyncio
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes import documents
+from app.config import settings
+from app.core.ingestion_jobs import IngestionJobStore, STATUS_COMPLETED, STATUS_QUEUED, STATUS_RUNNING
+from app.core.uploads import MULTIPART_OVERHEAD_BYTES, UploadSizeLimitMiddleware
+from app.dependencies import get_ingestion_service
+from app.services.ingestion_service import IngestionService
+from tests.conftest import paragraphs
+
+
+# Upload size limit
+
+@pytest.fixture
+def upload_client(document_service, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "upload_max_bytes", 1024)
+    monkeypatch.setattr(settings, "ingestion_spool_dir", str(tmp_path / "spool"))
+    job_store = IngestionJobStore(str(tmp_path / "jobs.sqlite"))
+    # Not started: accepted uploads are only queued
+    service = IngestionService(job_store, document_service)
+
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware)
+    app.include_router(documents.router)
+    app.dependency_overrides[get_ingestion_service] = lambda: service
+    yield TestClient(app)
+    job_store.close()
+
+
+def test_upload_within_limit_is_accepted(upload_client):
+    response = upload_client.post("/documents/upload", files={"file": ("a.txt", b"x" * 1000)})
+    assert response.status_code == 202
+    assert response.json()["size_bytes"] == 1000
+
+
+def test_upload_over_limit_is_rejected_by_the_route(upload_client):
+    # Within the multipart allowance, so only the spooling limit catches it
+    response = upload_client.post("/documents/upload", files={"file": ("a.txt", b"x" * 2000)})
+    assert response.status_code == 413
+
+
+def test_upload_with_large_content_length_is_rejected_before_reading(upload_client):
+    body = b"x" * (1024 + MULTIPART_OVERHEAD_BYTES + 1)
+    response = upload_client.post(
+        "/documents/upload",
+        content=body,
+        headers={"content-type": "multipart/form-data; boundary=b"},
+    )
+    assert response.status_code == 413
+
+
+def test_chunked_upload_over_limit_is_cut_off(upload_client):
+    def body():
+        yield b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.txt\"\r\n\r\n"
+        for _ in range(200):
+            yield b"x" * 1024
+
+    # No Content-Length: counted on the receive stream
+    response = upload_client.post(
+        "/documents/upload",
+        content=body(),
+        headers={"content-type": "multipart/form-data; boundary=b"},
+    )
+    assert response.status_code == 413
+
+
+def test_size_limit_ignores_other_routes(monkeypatch):
+    monkeypatch.setattr(settings, "upload_max_bytes", 10)
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware)
+
+    @app.post("/query")
+    async def query(payload: dict):
+        return {"length": len(payload["question"])}
+
+    response = TestClient(app).post("/query", json={"question": "q" * (MULTIPART_OVERHEAD_BYTES + 100)})
+    assert response.status_code == 200
+
+
+def test_upload_with_wait_reports_the_job_outcome(document_service, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ingestion_spool_dir", str(tmp_path / "spool"))
+    job_store = IngestionJobStore(str(tmp_path / "jobs.sqlite"))
+    service = IngestionService(job_store, document_service)
+
+    app = FastAPI()
+    app.include_router(documents.router)
+    app.dependency_overrides[get_ingestion_service] = lambda: service
+    app.router.on_startup.append(service.start)
+    app.router.on_shutdown.append(service.stop)
+    with TestClient(app) as client:
+        text = "\n\n".join(paragraphs(5)).encode()
+        completed = client.post("/documents/upload?wait=true", files={"file": ("a.txt", text)})
+        failed = client.post("/documents/upload?wait=true", files={"file": ("b.txt", b"")})
+
+    assert completed.status_code == 200
+    assert completed.json()["status"] == STATUS_COMPLETED
+    assert failed.status_code == 500
+    assert "Failed to process" in failed.json()["detail"]
+    job_store.close()
+
+
+# Ingestion jobs
+
+def test_jobs_are_requeued_after_restart(document_service, registry, tmp_path):
+    job_store = IngestionJobStore(str(tmp_path / "jobs.sqlite"))
+    uploads = []
+    for i in range(2):
+        path = tmp_path / f"upload-{i}.txt"
+        path.write_text("\n\n".join(paragraphs(10, seed=i)))
+        uploads.append(str(path))
+
+    # Submitted before the workers started, and one interrupted while running
+    service = IngestionService(job_store, document_service)
+    queued = service.submit("queued.txt", uploads[0])
+    interrupted = service.submit("interrupted.txt", uploads[1])
+    job_store.update(interrupted["job_id"], status=STATUS_RUNNING, stage="embedding")
+    assert job_store.get(queued["job_id"])["status"] == STATUS_QUEUED
+
+    async def restart():
+        restarted = IngestionService(job_store, document_service)
+        await restarted.start()
+        try:
+            return [await restarted.wait(job["job_id"]) for job in (queued, interrupted)]
+        finally:
+            await restarted.stop()
+
+    jobs = asyncio.run(restart())
+    assert [job["status"] for job in jobs] == [STATUS_COMPLETED, STATUS_COMPLETED]
+    assert all(job["chunk_count"] > 0 for job in jobs)
+    assert {entry["file_name"] for entry in registry.list_files()} == {"queued.txt", "interrupted.txt"}
+    # The spooled uploads are deleted once their job is done
+    assert not any(os.path.exists(path) for path in uploads)
+    job_store.close()
+
+
+def test_jobs_for_the_same_file_run_one_at_a_time(document_service, vector_store, registry, tmp_path):
+    job_store = IngestionJobStore(str(tmp_path / "jobs.sqlite"))
+    parts = paragraphs(20)
+    uploads = []
+    for i in range(3):
+        path = tmp_path / f"upload-{i}.txt"
+        path.write_text("\n\n".join(parts[i:] + [f"Version {i}."]))
+        uploads.append(str(path))
+
+    async def ingest_all():
+        service = IngestionService(job_store, document_service)
+        await service.start()
+        try:
+            jobs = [service.submit("doc.txt", path) for path in uploads]
+            return [await service.wait(job["job_id"]) for job in jobs]
+        finally:
+            await service.stop()
+
+    jobs = asyncio.run(ingest_all())
+    assert [job["status"] for job in jobs] == [STATUS_COMPLETED] * 3
+    # The last job's version is stored, with nothing left over from the others
+    assert registry.get_chunk_ids("doc.txt") and len(registry.get_chunk_ids("doc.txt")) == jobs[-1]["chunk_count"]
+    assert vector_store.get_collection_count() == jobs[-1]["chunk_count"]
+    job_store.close()
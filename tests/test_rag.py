@@ -0,0 +1,454 @@
+import asyncio
+import json
+import multiprocessing
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.core.llm.gemini_client import GeminiClient
+from app.core.llm.scheduler import GeminiScheduler
+from app.config import settings
+from app.core.rag import embedding_cache, semantic_cache
+from app.core.rag.embedding_cache import EmbeddingCache
+from app.core.rag.numpy_store import NumpyVectorStore
+from app.core.rag.retrieval import BM25Index
+from app.services.admin_service import AdminService
+from app.services import document_service as document_service_module
+from app.services.query_service import QueryService
+from ingestion.parsers.pdf_parser import PDFParser
+from tests.conftest import paragraphs
+
+
+def write_document(tmp_path, parts, name="doc.txt"):
+    path = tmp_path / name
+    path.write_text("\n\n".join(parts))
+    return str(path)
+
+
+def stored_metadata(vector_store, registry, file_name="doc.txt"):
+    stored = vector_store.get_documents(registry.get_chunk_ids(file_name), include=["metadatas"])
+    return dict(zip(stored["ids"], stored["metadatas"]))
+
+
+# Incremental re-ingestion
+
+def test_reingest_unchanged_file_reuses_everything(document_service, tmp_path):
+    path = write_document(tmp_path, paragraphs(30))
+    first = document_service.store_document_in_vector_store(path)
+    second = document_service.store_document_in_vector_store(path)
+
+    assert second["unchanged"]
+    assert second["chunk_ids"] == first["chunk_ids"]
+    assert second["chunks_embedded"] == 0
+
+
+def test_reingest_embeds_only_changed_chunks(document_service, vector_store, registry, tmp_path):
+    parts = paragraphs(40)
+    path = write_document(tmp_path, parts)
+    first = document_service.store_document_in_vector_store(path)
+
+    # One paragraph replaced near the end: the chunks before it keep their index
+    edited = parts[:35] + ["A rewritten paragraph. " * 10] + parts[36:]
+    write_document(tmp_path, edited)
+    second = document_service.store_document_in_vector_store(path)
+
+    assert not second["unchanged"]
+    assert 0 < second["chunks_embedded"] < first["chunk_count"] // 2
+    assert second["chunks_reused"] + second["chunks_embedded"] == second["chunk_count"]
+    assert second["chunks_deleted"] == len(set(first["chunk_ids"]) - set(second["chunk_ids"]))
+    assert vector_store.get_collection_count() == second["chunk_count"]
+    assert registry.get_chunk_ids("doc.txt") == second["chunk_ids"]
+
+
+def test_reingest_moves_shifted_chunks(document_service, vector_store, registry, tmp_path):
+    parts = paragraphs(30)
+    path = write_document(tmp_path, parts)
+    first = document_service.store_document_in_vector_store(path)
+
+    # A chunk-sized paragraph in front shifts every chunk by one index
+    write_document(tmp_path, [" ".join(["opening"] * 120)] + parts)
+    second = document_service.store_document_in_vector_store(path)
+
+    # Only the chunks around the insert are new; the rest moved by one
+    assert second["chunks_embedded"] <= 3
+    assert second["chunks_deleted"] == len(set(first["chunk_ids"]) - set(second["chunk_ids"]))
+    assert second["chunk_ids"][-20:] == first["chunk_ids"][-20:]
+    indexes = {chunk_id: metadata["chunk_index"] for chunk_id, metadata in stored_metadata(vector_store, registry).items()}
+    assert indexes == {chunk_id: i for i, chunk_id in enumerate(second["chunk_ids"])}
+    assert registry.get_chunk_indexes("doc.txt") == indexes
+
+
+def test_reingest_refreshes_metadata_of_reused_chunks(document_service, vector_store, registry, lexical_index, tmp_path):
+    parts = paragraphs(30)
+    path = write_document(tmp_path, parts)
+    document_service.store_document_in_vector_store(path)
+    time.sleep(0.01)
+    write_document(tmp_path, parts[:-1] + ["A new last paragraph."])
+    second = document_service.store_document_in_vector_store(path)
+
+    ingested_at = registry.get_file("doc.txt")["ingested_at"]
+    metadatas = stored_metadata(vector_store, registry).values()
+    assert {metadata["ingested_at"] for metadata in metadatas} == {ingested_at}
+    assert len({metadata["content_sha256"] for metadata in metadatas}) == 1
+
+    where = {"ingested_at": {"$gte": ingested_at}}
+    assert vector_store.get_collection_count() == second["chunk_count"]
+    assert sum(len(page["ids"]) for page in vector_store.iter_documents(where=where, include=[])) == second["chunk_count"]
+    assert len(lexical_index.search(parts[0], top_k=100, where=where)) > 0
+
+
+def test_failed_reingest_rolls_back(document_service, vector_store, registry, lexical_index, tmp_path):
+    parts = paragraphs(30)
+    path = write_document(tmp_path, parts)
+    first = document_service.store_document_in_vector_store(path)
+    file_before = registry.get_file("doc.txt")
+    metadata_before = stored_metadata(vector_store, registry)
+
+    # New chunks and moved chunks are written, then a later batch fails
+    write_document(tmp_path, [" ".join(["opening"] * 120)] + parts + [" ".join(["closing"] * 120)])
+    write_chunks = document_service._write_chunks
+    calls = []
+
+    def failing_write_chunks(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 4:
+            raise RuntimeError("embedding backend went away")
+        return write_chunks(*args, **kwargs)
+
+    document_service._write_chunks = failing_write_chunks
+    with pytest.raises(RuntimeError):
+        document_service.store_document_in_vector_store(path)
+
+    assert registry.get_chunk_ids("doc.txt") == first["chunk_ids"]
+    assert registry.get_file("doc.txt") == file_before
+    assert stored_metadata(vector_store, registry) == metadata_before
+    assert vector_store.get_collection_count() == first["chunk_count"]
+    assert lexical_index.stats()["documents"] == first["chunk_count"]
+    assert lexical_index.search("opening", top_k=10) == []
+
+
+def test_failed_first_ingest_leaves_nothing(document_service, vector_store, registry, tmp_path):
+    path = write_document(tmp_path, paragraphs(20))
+    write_chunks = document_service._write_chunks
+    calls = []
+
+    def failing_write_chunks(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("disk full")
+        return write_chunks(*args, **kwargs)
+
+    document_service._write_chunks = failing_write_chunks
+    with pytest.raises(RuntimeError):
+        document_service.store_document_in_vector_store(path)
+
+    assert registry.get_file("doc.txt") is None
+    assert vector_store.get_collection_count() == 0
+
+
+# Registry rebuild
+
+def test_registry_rebuild_matches_ingested_state(document_service, vector_store, registry, lexical_index, tmp_path):
+    parts = paragraphs(30)
+    path = write_document(tmp_path, parts)
+    document_service.store_document_in_vector_store(path)
+    write_document(tmp_path, parts[5:] + ["An appended paragraph."])
+    document_service.store_document_in_vector_store(path)
+    other = document_service.store_document_in_vector_store(write_document(tmp_path, paragraphs(5, seed=1), "other.txt"))
+
+    files_before = registry.list_files()
+    indexes_before = registry.get_chunk_indexes("doc.txt")
+    admin = AdminService(vector_store=vector_store, registry=registry, lexical_index=lexical_index)
+    assert admin.rebuild_registry() == {"files": 2, "chunks": len(indexes_before) + other["chunk_count"]}
+
+    assert registry.list_files() == files_before
+    assert registry.get_chunk_indexes("doc.txt") == indexes_before
+
+
+# BM25 segments, tombstones and merges
+
+def test_bm25_tombstones_and_reindexing(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25"))
+    index.add_documents(["a", "b"], ["apple banana", "banana cherry"], [{"file_name": "x.txt"}] * 2)
+    index.add_documents(["a"], ["durian"], [{"file_name": "x.txt"}])
+
+    assert index.stats() == {"segments": 2, "documents": 2, "deleted_documents": 1}
+    assert [chunk_id for chunk_id, _ in index.search("apple", top_k=5)] == []
+    assert [chunk_id for chunk_id, _ in index.search("durian", top_k=5)] == ["a"]
+
+    assert index.delete_documents(["b", "missing"]) == 1
+    assert index.search("banana", top_k=5) == []
+
+    # Reopened from disk: same live documents
+    index.close()
+    reopened = BM25Index(str(tmp_path / "bm25"))
+    assert reopened.stats()["documents"] == 1
+    assert [chunk_id for chunk_id, _ in reopened.search("durian", top_k=5)] == ["a"]
+
+
+def test_bm25_merges_segments_and_drops_deleted_documents(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25"), merge_factor=4, max_segments=8)
+    texts = {}
+    for batch in range(20):
+        ids = [f"c{batch}_{i}" for i in range(3)]
+        for chunk_id in ids:
+            texts[chunk_id] = f"common term{batch} token{chunk_id}"
+        index.add_documents(ids, [texts[chunk_id] for chunk_id in ids], [{"file_name": f"f{batch % 3}.txt"}] * 3)
+        if batch % 5 == 4:
+            deleted = [f"c{batch}_0", f"c{batch - 1}_1"]
+            index.delete_documents(deleted)
+            for chunk_id in deleted:
+                texts.pop(chunk_id)
+
+    stats = index.stats()
+    assert stats["segments"] <= 8
+    assert stats["documents"] == len(texts)
+    # Merging rewrote the tombstoned documents away
+    assert stats["deleted_documents"] < 8
+
+    found = {chunk_id for chunk_id, _ in index.search("common", top_k=1000)}
+    assert found == set(texts)
+    filtered = {chunk_id for chunk_id, _ in index.search("common", top_k=1000, where={"file_name": "f1.txt"})}
+    assert filtered == {chunk_id for chunk_id in texts if int(chunk_id[1:].split("_")[0]) % 3 == 1}
+
+    # The merged segments survive a reopen
+    index.close()
+    reopened = BM25Index(str(tmp_path / "bm25"), merge_factor=4, max_segments=8)
+    assert {chunk_id for chunk_id, _ in reopened.search("common", top_k=1000)} == set(texts)
+
+
+def test_legacy_bm25_segments_are_tagged_with_their_files(document_service, vector_store, registry, lexical_index, tmp_path):
+    parts_a, parts_b = paragraphs(10), paragraphs(10, seed=1)
+    document_service.store_document_in_vector_store(write_document(tmp_path, parts_a, "a.txt"))
+    document_service.store_document_in_vector_store(write_document(tmp_path, parts_b, "b.txt"))
+    # Written before segments recorded their documents' files
+    index_dir = tmp_path / "bm25"
+    manifest = json.loads((index_dir / "manifest.json").read_text())
+    for name in manifest["segments"]:
+        (index_dir / name / "files.json").unlink()
+        (index_dir / name / "doc_files.npy").unlink()
+    manifest.pop("files")
+    (index_dir / "manifest.json").write_text(json.dumps(manifest))
+
+    index = BM25Index(str(index_dir))
+    assert index.has_legacy_segments() and not index.can_filter({"file_name": "b.txt"})
+    # A merge keeps them untagged rather than filterable with unknown files
+    index.add_documents(["c"], ["a later chunk"], [{"file_name": "c.txt"}])
+    index._merge(list(index._segments))
+    assert index.has_legacy_segments()
+
+    admin = AdminService(vector_store=vector_store, registry=registry, lexical_index=index)
+    chunk_count = vector_store.get_collection_count()
+    assert admin.tag_lexical_index() == {"segments": 1, "chunks": chunk_count}
+    assert admin.tag_lexical_index() == {"segments": 0, "chunks": 0}
+
+    index.close()
+    reopened = BM25Index(str(index_dir))
+    assert not reopened.has_legacy_segments() and reopened.can_filter({"file_name": "b.txt"})
+    query = f"{parts_a[0][:100]} {parts_b[0][:100]}"
+    found = {chunk_id for chunk_id, _ in reopened.search(query, top_k=1000, where={"file_name": "b.txt"})}
+    assert found and found <= set(registry.get_chunk_ids("b.txt"))
+    reopened.close()
+
+
+# Numpy store recall
+
+def _clustered_vectors(count, dimension, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(32, dimension))
+    return (centers[rng.integers(0, 32, size=count)] + 0.5 * rng.normal(size=(count, dimension))).astype(np.float32)
+
+
+@pytest.mark.parametrize("index_mode, quantization", [
+    ("flat", "none"),
+    ("flat", "int8"),
+    ("flat", "binary"),
+    ("ivf", "int8"),
+])
+def test_numpy_store_recall(tmp_path, index_mode, quantization):
+    # Queries drawn like the stored vectors (not stored themselves)
+    vectors = _clustered_vectors(4020, 256)
+    vectors, queries = vectors[:4000], vectors[4000:]
+    store = NumpyVectorStore(index_dir=str(tmp_path / "store"), index_mode=index_mode, quantization=quantization)
+    ids = [f"v{i}" for i in range(len(vectors))]
+    for start in range(0, len(vectors), 1000):
+        store.add_documents(
+            ids[start:start + 1000],
+            ["text"] * 1000,
+            [{"file_name": "f.txt"}] * 1000,
+            vectors[start:start + 1000].tolist(),
+        )
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    exact = np.argsort(-(queries @ normalized.T), axis=1)[:, :10]
+    results = store.query(["q"] * len(queries), n_results=10, embeddings=queries.tolist())
+    hits = sum(len({ids[j] for j in row} & set(found)) for row, found in zip(exact, results["ids"]))
+    store.close()
+
+    assert hits / exact.size >= (0.99 if quantization == "none" and index_mode == "flat" else 0.9)
+
+
+# Batch queries
+
+class _FailingExpansion:
+    """
+    Query expansion that fails for one question.
+    """
+    async def expand_query_async(self, question, num_expansions=3):
+        if "broken" in question:
+            raise RuntimeError("expansion failed")
+        return [question]
+
+
+def test_query_batch_async_reports_errors_per_item(document_service, vector_store, registry, lexical_index, tmp_path):
+    parts = paragraphs(10)
+    document_service.store_document_in_vector_store(write_document(tmp_path, parts))
+    service = QueryService(
+        vector_store=vector_store,
+        embedding_service=document_service.embedding_service,
+        gemini_client=GeminiClient(scheduler=GeminiScheduler(60, 1000000)),
+        query_expansion_service=_FailingExpansion(),
+        lexical_index=lexical_index,
+        registry=registry,
+    )
+
+    results = asyncio.run(service.query_batch_async([
+        {"question": parts[0][:80], "retrieval_mode": "multi_query"},
+        {"question": "a broken question", "retrieval_mode": "multi_query"},
+        {"question": parts[3][:80], "where": {"file_name": "doc.txt"}},
+    ]))
+
+    assert "error" in results[1]
+    for result in (results[0], results[2]):
+        assert "error" not in result
+        assert result["sources"] and result["sources"][0]["file_name"] == "doc.txt"
+
+
+# PDF parsing
+
+def write_pdf(tmp_path, page_texts, name="doc.pdf"):
+    from PyPDF2 import PageObject, PdfWriter
+    from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    writer = PdfWriter()
+    for text in page_texts:
+        page = PageObject.create_blank_page(None, 612, 792)
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode())
+        page[NameObject("/Contents")] = content
+        page[NameObject("/Resources")] = DictionaryObject({NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+        writer.add_page(page)
+    path = tmp_path / name
+    with open(path, "wb") as file:
+        writer.write(file)
+    return str(path)
+
+
+def test_pdf_pages_parsed_in_workers_match_in_process(tmp_path):
+    texts = [f"Page {i} of the report" for i in range(9)]
+    path = write_pdf(tmp_path, texts)
+
+    in_process = list(PDFParser().iter_pages(path))
+    with ProcessPoolExecutor(2) as executor:
+        # Small ranges and few in flight, so workers get several ranges of the file
+        pooled = list(PDFParser(executor, pages_per_task=2, max_in_flight=2).iter_pages(path))
+        # Rewritten in place: workers must not reuse their reader of the old file
+        write_pdf(tmp_path, texts[:4])
+        rewritten = list(PDFParser(executor, pages_per_task=2, max_in_flight=2).iter_pages(path))
+
+    assert pooled == in_process == [text + "\n" for text in texts]
+    assert rewritten == [text + "\n" for text in texts[:4]]
+
+
+# Embedding cache
+
+def _last_used(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return dict(conn.execute("SELECT key, last_used FROM embeddings"))
+
+
+def test_embedding_cache_batches_last_used_updates(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "TOUCH_FLUSH_ENTRIES", 3)
+    db_path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(db_path, memory_size=1)
+    cache.put_many({key: [1.0, 2.0] for key in "abcd"})
+    stored = _last_used(db_path)
+
+    time.sleep(0.01)
+    # Disk hits, not yet written
+    assert set(cache.get_many(["a", "b"])) == {"a", "b"}
+    assert _last_used(db_path) == stored
+
+    # The third pending key writes all of them at once
+    cache.get_many(["c"])
+    touched = _last_used(db_path)
+    assert all(touched[key] > stored[key] for key in "abc") and touched["d"] == stored["d"]
+
+    time.sleep(0.01)
+    cache.get_many(["d"])
+    cache.close()
+    assert _last_used(db_path)["d"] > touched["d"]
+
+
+def test_embedding_cache_recounts_before_evicting(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "cache.sqlite")
+    first = EmbeddingCache(db_path, memory_size=1, max_disk_entries=100)
+    second = EmbeddingCache(db_path, memory_size=1, max_disk_entries=100)
+
+    # Another process deleted entries: the local estimate (105) is too high
+    first.put_many({f"a{i}": [1.0] for i in range(95)})
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings LIMIT 50)")
+    first.put_many({f"b{i}": [1.0] for i in range(10)})
+    assert first.evictions == 0
+    assert first.stats()["disk_entries"] == 55
+
+    # Another process added entries: the local estimate (60) is too low
+    monkeypatch.setattr(embedding_cache, "DISK_RECOUNT_SECONDS", 0.0)
+    second.put_many({f"c{i}": [1.0] for i in range(60)})
+    assert second.stats()["disk_entries"] == 90
+    assert len(_last_used(db_path)) == 90
+    first.close()
+    second.close()
+
+
+# Corpus version
+
+def _bump_many(count):
+    for _ in range(count):
+        semantic_cache.bump_corpus_version()
+
+
+@pytest.mark.skipif(semantic_cache.fcntl is None, reason="cross-process lock needs fcntl")
+def test_corpus_version_bumps_from_several_processes_all_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "vector_db_dir", str(tmp_path))
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_bump_many, args=(50,)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    _bump_many(50)
+    for process in processes:
+        process.join()
+
+    assert semantic_cache.get_corpus_version() == 250
+
+
+def test_corpus_version_is_bumped_once_per_file(document_service, tmp_path, monkeypatch):
+    bumps = []
+    monkeypatch.setattr(document_service_module, "bump_corpus_version", lambda: bumps.append(1))
+    parts = paragraphs(30)
+    # Stored over several batches of 4 chunks
+    result = document_service.store_document_in_vector_store(write_document(tmp_path, parts))
+    assert result["chunk_count"] > 4
+    assert len(bumps) == 1
+
+    document_service.store_document_in_vector_store(write_document(tmp_path, parts[:10] + paragraphs(3, seed=1) + parts[10:]))
+    assert len(bumps) == 2
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+
+from app.core.llm.scheduler import GeminiScheduler, TokenBucket, request_key
+
+
+# Token buckets
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate_per_minute=600)
+    assert bucket.wait_time(600) == 0.0
+    bucket.consume(600)
+    # 10 tokens per second
+    assert 0.09 < bucket.wait_time(1) <= 0.1
+    # More than a minute of budget waits for a full bucket, not forever
+    assert bucket.wait_time(10000) <= 60.0
+
+
+def test_acquire_waits_for_the_request_budget():
+    scheduler = GeminiScheduler(requests_per_minute=600, tokens_per_minute=1000000)
+    for _ in range(600):
+        scheduler.acquire(1)
+    start = time.monotonic()
+    scheduler.acquire(1)
+    assert time.monotonic() - start >= 0.08
+    assert scheduler.stats()["total_requests"] == 601
+
+
+def test_acquire_waits_for_the_token_budget():
+    scheduler = GeminiScheduler(requests_per_minute=100000, tokens_per_minute=6000)
+    scheduler.acquire(6000)
+    start = time.monotonic()
+    # 100 tokens per second
+    scheduler.acquire(20)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_waiting_callers_are_served_in_arrival_order():
+    scheduler = GeminiScheduler(requests_per_minute=600, tokens_per_minute=1000000)
+    for _ in range(600):
+        scheduler.acquire(1)
+    order = []
+
+    def blocking_caller(name):
+        scheduler.acquire(1)
+        order.append(name)
+
+    async def async_caller(name):
+        await scheduler.acquire_async(1)
+        order.append(name)
+
+    async def mixed():
+        threads = []
+        tasks = []
+        for i in range(6):
+            if i % 2:
+                tasks.append(asyncio.create_task(async_caller(i)))
+                await asyncio.sleep(0.01)
+            else:
+                thread = threading.Thread(target=blocking_caller, args=(i,))
+                thread.start()
+                threads.append(thread)
+                await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+        for thread in threads:
+            await asyncio.to_thread(thread.join)
+
+    asyncio.run(mixed())
+    assert order == list(range(6))
+    assert scheduler.stats()["queue_depth"] == 0
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    scheduler = GeminiScheduler(requests_per_minute=600, tokens_per_minute=1000000)
+    for _ in range(600):
+        scheduler.acquire(1)
+
+    async def cancel_one():
+        first = asyncio.create_task(scheduler.acquire_async(1))
+        second = asyncio.create_task(scheduler.acquire_async(1))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.wait_for(second, timeout=2)
+
+    asyncio.run(cancel_one())
+    assert scheduler.stats()["queue_depth"] == 0
+
+
+# Coalescing
+
+def test_identical_concurrent_calls_are_coalesced():
+    scheduler = GeminiScheduler(requests_per_minute=600, tokens_per_minute=1000000)
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def api_call():
+        calls.append(1)
+        started.set()
+        release.wait(timeout=5)
+        return "answer"
+
+    key = request_key("chat", "same prompt")
+    results = []
+    leader = threading.Thread(target=lambda: results.append(scheduler.run(key, 10, api_call)))
+    leader.start()
+    started.wait(timeout=5)
+    followers = [threading.Thread(target=lambda: results.append(scheduler.run(key, 10, api_call))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert results == ["answer"] * 4
+    assert len(calls) == 1
+    assert scheduler.stats()["coalesced_requests"] == 3
+
+    # Finished calls aren't reused
+    assert scheduler.run(key, 10, api_call) == "answer"
+    assert len(calls) == 2
+
+
+def test_identical_concurrent_async_calls_are_coalesced():
+    scheduler = GeminiScheduler(requests_per_minute=600, tokens_per_minute=1000000)
+    calls = []
+
+    async def api_call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def burst():
+        key = request_key("chat", "same prompt")
+        other = request_key("chat", "other prompt")
+        return await asyncio.gather(
+            *(scheduler.run_async(key, 10, api_call) for _ in range(4)),
+            scheduler.run_async(other, 10, api_call),
+        )
+
+    assert asyncio.run(burst()) == ["answer"] * 5
+    assert len(calls) == 2
+    assert scheduler.stats()["coalesced_requests"] == 3